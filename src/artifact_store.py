@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for rendered artifacts (song and TOC PDFs, QR codes).
+
+An artifact is keyed by a SHA-256 of everything that determines its bytes: the
+final HTML, the renderer settings (wkhtmltopdf binary and page options,
+reproducible mode) and the contents of the static assets the HTML links to.
+Identical pages are then fetched instead of rendered, across builds and across
+machines that share the store.
+
+Backends implement the ArtifactStore interface and are registered in BACKENDS.
+LocalDirectoryStore keeps one file per artifact in a directory, which may be on
+a shared filesystem: writes go to a temporary file that is renamed into place,
+reads refresh the file's mtime, and the least recently used files are evicted
+when the store grows past its size limit. The store's total size is kept in a
+usage file updated on every write, so a write does not scan the store; the
+directory is only scanned, and the total recounted, when eviction runs.
+
+Rendered HTML is not stored: rendering a template is cheap once the prepare
+stage (prepare_songs.py) has cached the derived song fields.
+"""
+
+import os
+import abc
+import json
+import uuid
+import hashlib
+import argparse
+import functools
+
+from config import get_config
+
+CONFIG = get_config()
+
+# Bump when the way artifacts are produced changes without the key inputs changing
+ARTIFACT_FORMAT_VERSION = 1
+# Printed by the page script when a PDF is fetched, so the build can tell fetched from rendered pages
+ARTIFACT_HIT_MESSAGE = "Fetched PDF from the artifact store"
+# Eviction trims the store to this fraction of its limit, so it does not run on every write
+EVICTION_TARGET = 0.9
+# The running total size of a local store, next to its shard directories
+USAGE_FILE_NAME = "usage.json"
+
+class ArtifactStore(abc.ABC):
+    """Interface of an artifact store backend."""
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the artifact's bytes, or None if it is not in the store."""
+
+    @abc.abstractmethod
+    def put(self, key, data):
+        """Store an artifact. Storing a key that already exists is harmless."""
+
+    @abc.abstractmethod
+    def stats(self):
+        """Return a dict describing the store (entries, size)."""
+
+class LocalDirectoryStore(ArtifactStore):
+    """Artifacts as files under `root`, sharded by the first two hex digits of the key."""
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # The mtime doubles as the last access time for LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        total = self._total_bytes()
+        try:
+            total -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        # A unique temporary name per writer, so concurrent builds never write the same file
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        total += len(data)
+        if total > self.max_bytes:
+            self._evict()
+        else:
+            self._write_total(total)
+
+    def _usage_path(self):
+        return os.path.join(self.root, USAGE_FILE_NAME)
+
+    def _total_bytes(self):
+        """The running total size; counted from the files if there is no usage file yet."""
+        try:
+            with open(self._usage_path(), 'r', encoding='utf-8') as f:
+                return int(json.load(f)["bytes"])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return sum(size for _, size, _ in self._entries())
+
+    def _write_total(self, total):
+        # Concurrent writers may lose each other's updates; eviction recounts, so errors do not add up
+        temp_path = f"{self._usage_path()}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"bytes": max(total, 0)}, f)
+        os.replace(temp_path, self._usage_path())
+
+    def _entries(self):
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if ".tmp-" in entry.name:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Recount the store and remove the least recently used artifacts if it is over its limit."""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICTION_TARGET
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Another process evicted it first
+                    pass
+                total -= size
+                if total <= target:
+                    break
+        self._write_total(total)
+
+    def stats(self):
+        entries = list(self._entries())
+        return {"backend": "local", "root": self.root, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+BACKENDS = {"local": LocalDirectoryStore}
+
+@functools.lru_cache(maxsize=None)
+def get_artifact_store():
+    """The store configured in config.json, or None when it is disabled."""
+    settings = CONFIG.artifact_store
+    if not settings['enabled']:
+        return None
+    if settings['backend'] not in BACKENDS:
+        raise ValueError(f"Unknown artifact store backend '{settings['backend']}' "
+                         f"(available: {', '.join(sorted(BACKENDS))})")
+    backend = BACKENDS[settings['backend']]
+    return backend(CONFIG.artifact_store_dir(), int(settings['max_size_mb'] * 2**20))
+
+@functools.lru_cache(maxsize=None)
+def static_assets_hash():
+    """Hash of every file in the templates' static directory (CSS, fonts, images)."""
+    digest = hashlib.sha256()
+    static_dir = CONFIG.paths.static_dir
+    for directory, subdirs, files in sorted(os.walk(static_dir)):
+        subdirs.sort()
+        for file_name in sorted(files):
+            path = os.path.join(directory, file_name)
+            digest.update(os.path.relpath(path, static_dir).replace(os.sep, '/').encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def artifact_key(kind, content, settings):
+    """
+    Key of an artifact of the given kind ("pdf", "qr", ...) made from `content` with `settings`.
+    The static directory's absolute path is left out of the content, so checkouts in
+    different places share keys; its files are hashed in instead.
+    """
+    static_url = 'file:///' + CONFIG.paths.static_dir.replace(os.sep, '/')
+    header = json.dumps([ARTIFACT_FORMAT_VERSION, kind, settings, static_assets_hash()], sort_keys=True)
+    digest = hashlib.sha256(header.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(content.replace(static_url, "{static}").encode('utf-8'))
+    return digest.hexdigest()
+
+def pdf_settings(page_options):
+    """Renderer settings that, with the HTML, determine a PDF's bytes."""
+    from reproducible_pdf import is_enabled
+    reproducible = is_enabled()
+    return {
+        "renderer": os.path.basename(CONFIG.wkhtmltopdf_path()),
+        "page_options": list(page_options),
+        "reproducible": reproducible,
+        "source_date_epoch": os.environ.get('SOURCE_DATE_EPOCH') if reproducible else None,
+    }
+
+def fetch_artifact(key):
+    """The artifact's bytes, or None if the store is disabled or does not have it."""
+    store = get_artifact_store()
+    return store.get(key) if store is not None else None
+
+def store_artifact(key, data):
+    """Add freshly rendered bytes to the store."""
+    store = get_artifact_store()
+    if store is not None:
+        store.put(key, data)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or clear the artifact store.")
+    parser.add_argument("--clear", action="store_true", help="Remove every artifact")
+    args = parser.parse_args()
+
+    store = get_artifact_store()
+    if store is None:
+        print("The artifact store is disabled (artifact_store.enabled in config.json).")
+    elif args.clear:
+        removed = 0
+        for path, _, _ in list(store._entries()):
+            os.remove(path)
+            removed += 1
+        store._write_total(0)
+        print(f"Removed {removed} artifacts from {store.root}")
+    else:
+        stats = store.stats()
+        print(f"{stats['entries']} artifacts, {stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MiB "
+              f"in {stats['root']}")
@@ -1,44 +1,34 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import argparse
 import sys
 import re
-from PyPDF2 import PdfMerger
+
+from config import get_config, ConfigError
 
 # Load configuration
 try:
-    CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-    with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-        CONFIG = json.load(f)
-except FileNotFoundError:
-    print(f"Error: Configuration file not found at {CONFIG_FILE_PATH}")
-    sys.exit(1)
-except json.JSONDecodeError:
-    print(f"Error: Could not decode JSON from {CONFIG_FILE_PATH}")
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
     sys.exit(1)
 
-def build_final_songbook(version):
-    """Merges existing TOCs and all song PDFs for a given version into a single PDF."""
-    print(f"Starting to build final songbook for version: {version} from existing files.")
+# Rendering the TOCs with page numbers is repeated at most this many times
+TOC_NUMBERING_PASSES = 3
 
-    main_output_dir = CONFIG['paths']['output_dir']
-    version_songbook_subdir_template = CONFIG['output_formats']['songbook_subdir_template']
-    version_songbook_files_dir = os.path.join(main_output_dir, version_songbook_subdir_template.format(version=version))
-
-    if not os.path.isdir(version_songbook_files_dir):
-        print(f"Error: Version specific directory {version_songbook_files_dir} not found. Cannot proceed.")
-        sys.exit(1)
-
-    merger = PdfMerger()
+def songbook_pdf_paths(version, version_songbook_files_dir):
+    """
+    Return the PDFs that make up a version's songbook, in book order: the TOCs
+    (except for projection), then the song pages sorted by inner ID.
+    """
     pdfs_to_merge = []
 
     if version != "projection":
         print("\nLooking for Table of Contents files...")
         
         # Look for TOC by ID
-        toc_by_id_filename = CONFIG['file_names']['toc_pdf_ordered']
+        toc_by_id_filename = CONFIG.file_names['toc_pdf_ordered']
         toc_by_id_path = os.path.join(version_songbook_files_dir, toc_by_id_filename)
         if os.path.exists(toc_by_id_path):
             pdfs_to_merge.append(toc_by_id_path)
@@ -47,7 +37,7 @@ def build_final_songbook(version):
             print(f"Warning: {toc_by_id_filename} not found in {version_songbook_files_dir}. It will not be included.")
 
         # Look for TOC by Title
-        toc_by_title_filename = CONFIG['file_names']['toc_pdf_alphabetical']
+        toc_by_title_filename = CONFIG.file_names['toc_pdf_alphabetical']
         toc_by_title_path = os.path.join(version_songbook_files_dir, toc_by_title_filename)
         if os.path.exists(toc_by_title_path):
             pdfs_to_merge.append(toc_by_title_path)
@@ -70,34 +60,185 @@ def build_final_songbook(version):
         print(f"Found and sorted {len(song_files_in_dir)} song pages.")
         for song_file in song_files_in_dir:
             pdfs_to_merge.append(os.path.join(version_songbook_files_dir, song_file))
+    return pdfs_to_merge
+
+def merged_songbook_path(version, output_dir=None):
+    """Path of the merged songbook PDF of a version."""
+    return os.path.join(output_dir or CONFIG.paths.output_dir, f"{version}_SironSongbook_Merged.pdf")
+
+def load_song_info(songs_json=None):
+    """{inner_id: song} from the catalog, used for the outline and the page index; {} if it cannot be read."""
+    from song_catalog import open_catalog
+    try:
+        return {str(song['inner_id']): song for song in open_catalog(songs_json or CONFIG.paths.songs_json)}
+    except (OSError, ValueError) as e:
+        print(f"Warning: song titles not available ({e})")
+        return {}
+
+def toc_outline_title(pdf_path):
+    """Bookmark title of a TOC file."""
+    if os.path.basename(pdf_path) == CONFIG.file_names['toc_pdf_ordered']:
+        return "Tartalomjegyzék – azonosító szerint"
+    return "Tartalomjegyzék – cím szerint"
+
+def link_toc_pages(writer, entries, start_pages):
+    """
+    Turn the song links of the TOC pages (TOC_LINK_PREFIX + inner_id) into links to the
+    song's first page. Links to songs that are not in the book are removed.
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, NullObject
+    from page_index import TOC_LINK_PREFIX
+
+    for entry in entries:
+        if entry["kind"] != "toc":
+            continue
+        page = writer.pages[entry["page"] - 1]
+        annotations = page.get('/Annots')
+        if annotations is None:
+            continue
+        kept = ArrayObject()
+        for annotation_ref in annotations.get_object():
+            annotation = annotation_ref.get_object()
+            action = annotation.get('/A')
+            uri = str(action.get_object().get('/URI', "")) if action is not None else ""
+            if uri.startswith(TOC_LINK_PREFIX):
+                inner_id = uri[len(TOC_LINK_PREFIX):]
+                if inner_id not in start_pages:
+                    continue
+                target = writer.pages[start_pages[inner_id] - 1].indirect_reference
+                annotation[NameObject('/A')] = DictionaryObject({
+                    NameObject('/S'): NameObject('/GoTo'),
+                    NameObject('/D'): ArrayObject([target, NameObject('/XYZ'), NullObject(), NullObject(), NullObject()]),
+                })
+            kept.append(annotation_ref)
+        page[NameObject('/Annots')] = kept
+
+def source_page_entries(pdfs_to_merge):
+    """Page index entries of the book the given source PDFs would make, without merging them."""
+    from PyPDF2 import PdfReader
+    from page_index import index_entries
+
+    entries = []
+    for pdf_path in pdfs_to_merge:
+        entries += index_entries(pdf_path, PdfReader(pdf_path), len(entries) + 1)
+    return entries
+
+def number_toc_pages(version, main_output_dir, version_songbook_files_dir, songs_json=None, templates_dir=None):
+    """
+    Render both TOCs again with the page numbers the songs will have in the merged book,
+    and with links to them. Adding the page column can change the length of the TOCs and
+    so the page numbers, so this repeats until the numbers are stable.
+    """
+    from generate_toc import generate_toc
+    from page_index import song_pages
+
+    songs_json = songs_json or CONFIG.paths.songs_json
+    templates_dir = templates_dir or CONFIG.paths.templates_dir
+
+    def book_page_numbers():
+        entries = source_page_entries(songbook_pdf_paths(version, version_songbook_files_dir))
+        return {inner_id: start for inner_id, (start, _count) in song_pages(entries).items()}
+
+    page_numbers = book_page_numbers()
+    for _ in range(TOC_NUMBERING_PASSES):
+        print(f"\nRendering the TOCs with the page numbers of {len(page_numbers)} songs...")
+        for toc_version in ("1", "2"):
+            generate_toc(version, toc_version, templates_dir, main_output_dir, songs_json, page_numbers)
+        # The numbers are right once the TOCs just rendered do not move any song
+        numbers = book_page_numbers()
+        if numbers == page_numbers:
+            return
+        page_numbers = numbers
+    print(f"Warning: TOC page numbers did not settle after {TOC_NUMBERING_PASSES} passes; they may be off.")
+
+def build_final_songbook(version, output_dir=None, toc_page_numbers=False, songs_json=None, templates_dir=None):
+    """
+    Merges existing TOCs and all song PDFs for a given version into a single PDF, with a
+    bookmark for every song, and writes its page index (see page_index.py).
+    output_dir defaults to the output directory from config.json. With toc_page_numbers,
+    the TOCs are rendered again first, with the songs' page numbers and links to them.
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+    from reproducible_pdf import is_enabled, write_reproducible
+    from page_index import index_entries, song_pages, write_page_index
+
+    print(f"Starting to build final songbook for version: {version} from existing files.")
+
+    main_output_dir = output_dir or CONFIG.paths.output_dir
+    version_songbook_files_dir = os.path.join(main_output_dir, CONFIG.songbook_subdir(version))
+
+    if not os.path.isdir(version_songbook_files_dir):
+        print(f"Error: Version specific directory {version_songbook_files_dir} not found. Cannot proceed.")
+        sys.exit(1)
+
+    if toc_page_numbers and version != "projection":
+        number_toc_pages(version, main_output_dir, version_songbook_files_dir, songs_json, templates_dir)
+
+    writer = PdfWriter()
+    pdfs_to_merge = songbook_pdf_paths(version, version_songbook_files_dir)
     
     if not pdfs_to_merge:
         print("No PDF files to merge. Exiting.")
         return
 
     print(f"\nMerging {len(pdfs_to_merge)} PDF files...")
+    page_entries = []
+    # PyPDF2 remembers the objects it copied by id() of their reader, so every reader is kept
+    # until the book is written: a freed reader's id() could be reused by the next one
+    readers = []
     for pdf_path in pdfs_to_merge:
         if os.path.exists(pdf_path):
             print(f"Adding: {pdf_path}")
-            merger.append(pdf_path)
+            reader = PdfReader(pdf_path)
+            readers.append(reader)
+            page_entries += index_entries(pdf_path, reader, len(page_entries) + 1)
+            for page in reader.pages:
+                writer.add_page(page)
         else:
             print(f"Warning: File {pdf_path} not found, skipping.")
 
-    final_output_filename = f"{version}_SironSongbook_Merged.pdf"
-    final_output_path = os.path.join(main_output_dir, final_output_filename)
+    song_info = load_song_info(songs_json)
+    start_pages = {inner_id: start for inner_id, (start, _count) in song_pages(page_entries).items()}
+    link_toc_pages(writer, page_entries, start_pages)
+    for entry in page_entries:
+        if entry["kind"] == "toc" and entry["source_page"] == 1:
+            writer.add_outline_item(toc_outline_title(entry["source"]), entry["page"] - 1)
+    for inner_id, start_page in start_pages.items():
+        song = song_info.get(inner_id)
+        title = f"{song['id']} {song['title']}" if song else f"Song {inner_id}"
+        writer.add_outline_item(title, start_page - 1)
+
+    final_output_path = merged_songbook_path(version, main_output_dir)
 
     try:
-        merger.write(final_output_path)
+        if is_enabled():
+            write_reproducible(writer, final_output_path)
+        else:
+            with open(final_output_path, 'wb') as f:
+                writer.write(f)
         print(f"\nSuccessfully merged PDF saved as: {final_output_path}")
+        print(f"Page index saved as: {write_page_index(final_output_path, version, page_entries, song_info)}")
     except Exception as e:
         print(f"Error writing final PDF: {e}")
-    finally:
-        merger.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build a complete songbook PDF by merging TOCs and song pages for a specific version.")
     parser.add_argument("--version", choices=["singer", "musician", "projection"],
                         required=True, help="Songbook version to build (singer, musician, projection).")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Directory containing the generated pages; the merged PDF is saved here too.")
+    parser.add_argument("--toc-page-numbers", action="store_true",
+                        help="Render the TOCs again with the songs' page numbers and links before merging")
+    parser.add_argument("--songs-json", default=CONFIG.paths.songs_json,
+                        help="Song catalog used for the bookmarks, the page index and the TOCs")
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir,
+                        help="Directory containing template files (for --toc-page-numbers)")
     
     args = parser.parse_args()
-    build_final_songbook(args.version)
+    from pdf_conversion import ConversionError
+    try:
+        build_final_songbook(args.version, args.output_dir, args.toc_page_numbers, args.songs_json,
+                             args.templates_dir)
+    except ConversionError as e:
+        print(f"Error rendering the TOCs: {e}")
+        sys.exit(1)
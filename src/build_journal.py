@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Crash-resumable journal of a full songbook build.
+
+generate_full_songbook.py records in a JSON Lines file when each task of a
+run (the two TOCs and every song page) starts, finishes or fails. Records are
+only ever appended, each with a single O_APPEND write that is fsync'd before
+the build goes on, so after a reboot, Ctrl-C or crash the journal says exactly
+which tasks finished. Parallel workers append to the same file without
+interleaving their lines. A line torn by a crash in the middle of a write is
+ignored when the journal is read.
+
+A new run replaces the journal atomically with a fresh one. A run continued
+with --resume skips the tasks that finished or failed, and runs the ones that
+never started or were interrupted. --retry-failed runs only the tasks that
+failed. With both, everything that has not finished is run.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+from config import get_config, ConfigError
+
+# Load configuration
+try:
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+JOURNAL_FORMAT_VERSION = 1
+STARTED, DONE, FAILED = "started", "done", "failed"
+
+def toc_task(toc_version):
+    return f"toc:{toc_version}"
+
+def song_task(inner_id):
+    return f"song:{inner_id}"
+
+def _fsync_directory(path):
+    """Make a rename or a new file in path's directory durable (a no-op where unsupported)."""
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class BuildJournal:
+    """The state of every task of one run, backed by an append-only journal file."""
+    def __init__(self, path, header, states=None, failures=None):
+        self.path = path
+        self.header = header
+        self.states = states or {}
+        # The failure report entry of every task whose last attempt failed
+        self.failures = failures or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, path, version, catalog_sha256, shard=None):
+        """Start a new run, replacing any journal at path."""
+        header = {"event": "run", "format_version": JOURNAL_FORMAT_VERSION, "version": version,
+                  "shard": list(shard) if shard else None, "catalog_sha256": catalog_sha256,
+                  "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        _fsync_directory(path)
+        return cls(path, header)
+
+    @classmethod
+    def read(cls, path):
+        """Replay a journal. Raises FileNotFoundError, or ValueError if it is not a journal of this format."""
+        header = None
+        states, failures = {}, {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn, by a crash while it was written
+                    continue
+                if record.get("event") == "run":
+                    header = record
+                elif record.get("event") == "task":
+                    states[record["task"]] = record["state"]
+                    if record["state"] == FAILED:
+                        failures[record["task"]] = record.get("failure", {})
+                    else:
+                        failures.pop(record["task"], None)
+        if header is None or header.get("format_version") != JOURNAL_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a build journal of format {JOURNAL_FORMAT_VERSION}")
+        return cls(path, header, states, failures)
+
+    def _append(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        # One write() of a whole line on an O_APPEND descriptor is not interleaved with other writers
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _drop_torn_line(self):
+        """Cut off a last line torn by a crash, so the next record starts on a line of its own."""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def continue_run(self, resume, retry_failed):
+        """Note in the journal that the run is continued."""
+        modes = [mode for mode, enabled in (("resume", resume), ("retry-failed", retry_failed)) if enabled]
+        with self._lock:
+            self._drop_torn_line()
+            self._append({"event": "continue", "modes": modes, "time": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def record(self, task, state, failure=None):
+        """Append a task's new state; failure is the failure report entry of a failed task."""
+        record = {"event": "task", "task": task, "state": state, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if failure is not None:
+            record["failure"] = failure
+        with self._lock:
+            self._append(record)
+            self.states[task] = state
+            if state == FAILED:
+                self.failures[task] = failure or {}
+            else:
+                self.failures.pop(task, None)
+
+    def should_run(self, task, resume, retry_failed):
+        """Whether a continued run runs a task, given its state when the journal was read."""
+        state = self.states.get(task)
+        if state == DONE:
+            return False
+        if state == FAILED:
+            return retry_failed
+        # Never started, or interrupted while it ran
+        return resume
+
+    def counts(self):
+        counts = {STARTED: 0, DONE: 0, FAILED: 0}
+        for state in self.states.values():
+            counts[state] += 1
+        return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the state of the last full songbook build of a version.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"], required=True,
+                        help="Songbook version")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir, help="Directory of the build")
+    parser.add_argument("--shard", metavar="K/N", help="Show the journal of shard K of N")
+    args = parser.parse_args()
+
+    from sharding import parse_shard_spec
+    try:
+        shard = parse_shard_spec(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    path = CONFIG.build_journal_path(args.version, os.path.abspath(args.output_dir), shard)
+    try:
+        journal = BuildJournal.read(path)
+    except FileNotFoundError:
+        print(f"No build journal at {path}")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    counts = journal.counts()
+    print(f"Run started {journal.header['time']}: {counts[DONE]} done, {counts[FAILED]} failed, "
+          f"{counts[STARTED]} started but not finished ({path})")
+    for task, failure in sorted(journal.failures.items()):
+        print(f"  failed {task}: {failure.get('reason', 'unknown reason')}")
+    for task, state in sorted(journal.states.items()):
+        if state == STARTED:
+            print(f"  not finished {task}")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Shared configuration for all scripts.
+
+`config.json` is read and validated once per process. Relative paths in the
+"paths" section are resolved against this directory (the one holding the
+scripts), so the scripts behave the same whatever the current directory is.
+"""
+
+import os
+import json
+import functools
+from dataclasses import dataclass
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+CONFIG_FILE_PATH = os.path.join(REPO_DIR, 'config.json')
+
+class ConfigError(ValueError):
+    """Raised when config.json is missing, unreadable or incomplete."""
+
+# Sections of optional features; each is only validated when its feature is first used
+FEATURE_SECTIONS = ("render_service", "conversion", "reproducible_pdf", "artifact_store", "scheduling", "imposition")
+
+@dataclass(frozen=True)
+class PathsConfig:
+    data_dir: str
+    siron_excel: str
+    songs_json: str
+    songs_sqlite: str
+    search_index: str
+    prepared_cache: str
+    render_history: str
+    output_dir: str
+    templates_dir: str
+    static_dir_name: str
+    static_dir: str
+    wkhtmltopdf: str
+
+@dataclass(frozen=True)
+class LyricsConfig:
+    small_lines_threshold: int
+    large_lines_threshold: int
+    column_break_threshold: int
+
+@dataclass(frozen=True)
+class Config:
+    paths: PathsConfig
+    file_names: dict
+    templates: dict
+    page_parameters: dict
+    songbook_subdir_template: str
+    excel_column_mapping: dict
+    lyrics: LyricsConfig
+    guitar_chords: tuple
+    # The unvalidated sections of the optional features, by section name
+    feature_sections: dict
+
+    # The validated section of each feature, checked the first time it is used
+    @functools.cached_property
+    def render_service(self):
+        return _validate_render_service(dict(self.feature_sections["render_service"]))
+
+    @functools.cached_property
+    def conversion(self):
+        return _validate_conversion(dict(self.feature_sections["conversion"]))
+
+    @functools.cached_property
+    def reproducible_pdf(self):
+        return _validate_reproducible_pdf(dict(self.feature_sections["reproducible_pdf"]))
+
+    @functools.cached_property
+    def artifact_store(self):
+        return _validate_artifact_store(dict(self.feature_sections["artifact_store"]))
+
+    @functools.cached_property
+    def scheduling(self):
+        return _validate_scheduling(dict(self.feature_sections["scheduling"]))
+
+    @functools.cached_property
+    def imposition(self):
+        return _validate_imposition(dict(self.feature_sections["imposition"]))
+
+    def failure_report_path(self, version, output_dir=None):
+        """Return the path of the failed-songs report for a songbook version."""
+        filename = self.conversion['failure_report_filename'].format(version=version)
+        return os.path.join(output_dir or self.paths.output_dir, filename)
+
+    def build_journal_path(self, version, output_dir=None, shard=None):
+        """Return the path of the build journal of a songbook version (or of one shard of its build)."""
+        root, extension = os.path.splitext(self.file_names['build_journal'].format(version=version))
+        if shard:
+            root = f"{root}_shard{shard[0]}of{shard[1]}"
+        return os.path.join(output_dir or self.paths.output_dir, root + extension)
+
+    def songbook_subdir(self, version):
+        """Return the name of the output subdirectory for a songbook version."""
+        return self.songbook_subdir_template.format(version=version)
+
+    def song_page_filename(self, inner_id):
+        """Return the PDF file name for a song page."""
+        return f"{self.file_names['song_page_prefix']}{inner_id}{self.file_names['song_page_suffix']}"
+
+    def wkhtmltopdf_path(self):
+        """Return the wkhtmltopdf executable, honoring WKHTMLTOPDF_PATH from the environment or .env."""
+        _load_dotenv()
+        return os.getenv('WKHTMLTOPDF_PATH', self.paths.wkhtmltopdf)
+
+    def artifact_store_dir(self):
+        """Return the artifact store directory, honoring ARTIFACT_STORE_DIR (e.g. a shared mount)."""
+        _load_dotenv()
+        return os.getenv('ARTIFACT_STORE_DIR', self.artifact_store['directory'])
+
+@functools.lru_cache(maxsize=None)
+def _load_dotenv():
+    # python-dotenv is only needed when a PDF is actually generated
+    from dotenv import load_dotenv
+    load_dotenv()
+
+def _resolve(path):
+    return os.path.normpath(os.path.join(SRC_DIR, path))
+
+def _require(section, key, expected_type, section_name):
+    if key not in section:
+        raise ConfigError(f"Missing '{key}' in '{section_name}' section of {CONFIG_FILE_PATH}")
+    value = section[key]
+    if not isinstance(value, expected_type) or (expected_type is int and isinstance(value, bool)):
+        type_names = " or ".join(t.__name__ for t in expected_type) if isinstance(expected_type, tuple) \
+            else expected_type.__name__
+        raise ConfigError(f"'{section_name}.{key}' in {CONFIG_FILE_PATH} must be of type {type_names}")
+    return value
+
+def _validate_render_service(render_service):
+    if not 0 < _require(render_service, "port", int, "render_service") < 65536:
+        raise ConfigError(f"'render_service.port' in {CONFIG_FILE_PATH} must be between 1 and 65535")
+    _require(render_service, "host", str, "render_service")
+    for key in ("cache_size_mb", "change_check_interval_seconds"):
+        if _require(render_service, key, (int, float), "render_service") < 0:
+            raise ConfigError(f"'render_service.{key}' in {CONFIG_FILE_PATH} must not be negative")
+    if _require(render_service, "max_concurrent_renders", int, "render_service") < 1:
+        raise ConfigError(f"'render_service.max_concurrent_renders' in {CONFIG_FILE_PATH} must be at least 1")
+    return render_service
+
+def _validate_conversion(conversion):
+    for key in ("timeout_seconds", "retry_backoff_seconds", "retry_backoff_factor", "script_timeout_seconds"):
+        if _require(conversion, key, (int, float), "conversion") <= 0:
+            raise ConfigError(f"'conversion.{key}' in {CONFIG_FILE_PATH} must be positive")
+    if _require(conversion, "retries", int, "conversion") < 0:
+        raise ConfigError(f"'conversion.retries' in {CONFIG_FILE_PATH} must not be negative")
+    _require(conversion, "failure_report_filename", str, "conversion")
+    return conversion
+
+def _validate_reproducible_pdf(reproducible_pdf):
+    _require(reproducible_pdf, "enabled", bool, "reproducible_pdf")
+    _require(reproducible_pdf, "producer", str, "reproducible_pdf")
+    return reproducible_pdf
+
+def _validate_artifact_store(artifact_store):
+    _require(artifact_store, "enabled", bool, "artifact_store")
+    _require(artifact_store, "backend", str, "artifact_store")
+    artifact_store["directory"] = _resolve(_require(artifact_store, "directory", str, "artifact_store"))
+    if _require(artifact_store, "max_size_mb", (int, float), "artifact_store") <= 0:
+        raise ConfigError(f"'artifact_store.max_size_mb' in {CONFIG_FILE_PATH} must be positive")
+    return artifact_store
+
+def _validate_scheduling(scheduling):
+    if _require(scheduling, "jobs", int, "scheduling") < 1:
+        raise ConfigError(f"'scheduling.jobs' in {CONFIG_FILE_PATH} must be at least 1")
+    if not 0 < _require(scheduling, "history_weight", (int, float), "scheduling") <= 1:
+        raise ConfigError(f"'scheduling.history_weight' in {CONFIG_FILE_PATH} must be between 0 and 1")
+    if _require(scheduling, "default_seconds_per_cost", (int, float), "scheduling") <= 0:
+        raise ConfigError(f"'scheduling.default_seconds_per_cost' in {CONFIG_FILE_PATH} must be positive")
+    return scheduling
+
+def _validate_imposition(imposition):
+    signature_pages = _require(imposition, "signature_pages", int, "imposition")
+    if signature_pages < 0 or signature_pages % 4:
+        raise ConfigError(f"'imposition.signature_pages' in {CONFIG_FILE_PATH} must be a multiple of 4 "
+                          "(0 for a single saddle-stitched signature)")
+    _require(imposition, "sheet_size", str, "imposition")
+    _require(imposition, "crop_marks", bool, "imposition")
+    for key in ("crop_mark_length_mm", "crop_mark_offset_mm"):
+        if _require(imposition, key, (int, float), "imposition") < 0:
+            raise ConfigError(f"'imposition.{key}' in {CONFIG_FILE_PATH} must not be negative")
+    _require(imposition, "output_filename", str, "imposition")
+    return imposition
+
+def parse_config(raw):
+    """
+    Validate the raw JSON configuration and build a Config object.
+    The sections of optional features are validated when they are first used.
+    """
+    sections = {}
+    for name in ("paths", "file_names", "templates", "page_parameters", "output_formats",
+                 "excel_column_mapping", "lyrics"):
+        sections[name] = _require(raw, name, dict, "root")
+    feature_sections = {name: _require(raw, name, dict, "root") for name in FEATURE_SECTIONS}
+
+    paths = sections["paths"]
+    data_dir = _resolve(_require(paths, "data_dir", str, "paths"))
+    templates_dir = _resolve(_require(paths, "templates_dir", str, "paths"))
+    static_dir_name = _require(paths, "static_dir_name", str, "paths")
+    paths_config = PathsConfig(
+        data_dir=data_dir,
+        siron_excel=os.path.join(data_dir, _require(paths, "siron_excel_filename", str, "paths")),
+        songs_json=os.path.join(data_dir, _require(paths, "songs_json_filename", str, "paths")),
+        songs_sqlite=os.path.join(data_dir, _require(paths, "songs_sqlite_filename", str, "paths")),
+        search_index=os.path.join(data_dir, _require(paths, "search_index_filename", str, "paths")),
+        prepared_cache=os.path.join(data_dir, _require(paths, "prepared_cache_filename", str, "paths")),
+        render_history=os.path.join(data_dir, _require(paths, "render_history_filename", str, "paths")),
+        output_dir=_resolve(_require(paths, "output_dir", str, "paths")),
+        templates_dir=templates_dir,
+        static_dir_name=static_dir_name,
+        static_dir=os.path.join(templates_dir, static_dir_name),
+        # Left as-is: it may be a bare command name found on PATH
+        wkhtmltopdf=_require(paths, "wkhtmltopdf", str, "paths"),
+    )
+
+    file_names = sections["file_names"]
+    for key in ("song_page_prefix", "song_page_suffix", "toc_pdf_ordered", "toc_pdf_alphabetical", "shard_manifest",
+                "update_pack", "build_journal"):
+        _require(file_names, key, str, "file_names")
+    templates = sections["templates"]
+    for key in ("singer_song_page", "musician_song_page", "projection_song_page", "toc_template",
+                "update_pack_report"):
+        _require(templates, key, str, "templates")
+    for key in ("projection", "a4_song", "a4_toc"):
+        _require(sections["page_parameters"], key, dict, "page_parameters")
+
+    lyrics = sections["lyrics"]
+    thresholds = _require(lyrics, "lines_thresholds", dict, "lyrics")
+    lyrics_config = LyricsConfig(
+        small_lines_threshold=_require(thresholds, "small", int, "lyrics.lines_thresholds"),
+        large_lines_threshold=_require(thresholds, "large", int, "lyrics.lines_thresholds"),
+        column_break_threshold=_require(lyrics, "column_break_threshold", int, "lyrics"),
+    )
+
+    guitar_chords = raw.get("guitar_chords", [])
+    if not isinstance(guitar_chords, list) or not all(isinstance(chord, str) for chord in guitar_chords):
+        raise ConfigError(f"'guitar_chords' in {CONFIG_FILE_PATH} must be a list of strings")
+
+    return Config(
+        paths=paths_config,
+        file_names=file_names,
+        templates=templates,
+        page_parameters=sections["page_parameters"],
+        songbook_subdir_template=_require(sections["output_formats"], "songbook_subdir_template", str, "output_formats"),
+        excel_column_mapping=sections["excel_column_mapping"],
+        lyrics=lyrics_config,
+        guitar_chords=tuple(guitar_chords),
+        feature_sections=feature_sections,
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_config(config_file_path=CONFIG_FILE_PATH):
+    """Load, validate and return the configuration. The file is only read once per process."""
+    try:
+        with open(config_file_path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        raise ConfigError(f"Configuration file not found at {config_file_path}")
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"Could not decode JSON from {config_file_path}: {e}")
+    return parse_config(raw)
+
+if __name__ == "__main__":
+    try:
+        config = get_config()
+        # Checking the configuration covers the sections of every feature
+        for name in FEATURE_SECTIONS:
+            getattr(config, name)
+    except ConfigError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    print(f"Configuration in {CONFIG_FILE_PATH} is valid.")
+    for field, value in vars(config.paths).items():
+        print(f"  {field}: {value}")
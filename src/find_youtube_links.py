@@ -2,10 +2,11 @@ import json
 import os
 import argparse
 
+from config import get_config, ConfigError
+
 # --- YouTube search logic using youtube-search-python ---
 # Ensure 'youtube-search-python' is installed (pip install youtube-search-python)
-
-from youtubesearchpython import VideosSearch
+# It is imported inside actual_youtube_search so that --help and existing links need no network library.
 
 def actual_youtube_search(song_title, song_author):
     """
@@ -13,6 +14,8 @@ def actual_youtube_search(song_title, song_author):
     Prioritizes official music videos, then most viewed audio versions.
     Excludes concert/live recordings.
     """
+    from youtubesearchpython import VideosSearch
+
     print(f"  Searching YouTube for: '{song_author} - {song_title}'")
 
     # Attempt to find official music video
@@ -121,26 +124,20 @@ def get_youtube_link_for_song(song_details):
     return actual_youtube_search(song_title, song_author)
 
 def main():
-    # Load configuration to get default paths
-    config = {}
-    try:
-        config_file_path = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-        with open(config_file_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-    except FileNotFoundError:
-        print(f"Warning: Configuration file not found at {config_file_path}. Using default paths.")
-    except json.JSONDecodeError:
-        print(f"Warning: Could not decode JSON from {config_file_path}. Using default paths.")
-
     # Determine paths
     script_dir = os.path.dirname(__file__)
     project_root = os.path.abspath(os.path.join(script_dir, '..'))
 
-    default_data_dir = config.get('paths', {}).get('data_dir', os.path.join(project_root, 'data'))
-    default_songs_filename = config.get('paths', {}).get('songs_json_filename', 'songs.json')
-    default_songs_json_path = os.path.join(default_data_dir, default_songs_filename)
+    # Load configuration to get default paths
+    try:
+        config = get_config()
+        default_songs_json_path = config.paths.songs_json
+        default_output_dir = config.paths.output_dir
+    except ConfigError as e:
+        print(f"Warning: {e}. Using default paths.")
+        default_songs_json_path = os.path.join(project_root, 'data', 'songs.json')
+        default_output_dir = os.path.join(project_root, 'output')
 
-    default_output_dir = config.get('paths', {}).get('output_dir', os.path.join(project_root, 'output'))
     default_output_txt_filename = 'youtube_links.txt'
     default_output_txt_path = os.path.join(default_output_dir, default_output_txt_filename)
 
@@ -1,53 +1,126 @@
 #!/usr/bin/env python3
 
 import os
-import json
-import subprocess
 import argparse
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import get_config, ConfigError
+from song_catalog import open_catalog
+from pdf_conversion import run_streaming, write_failure_report
+import sharding
+from prepare_songs import prepare_catalog
+from render_history import RenderHistory, longest_first, predicted_makespan
+from artifact_store import ARTIFACT_HIT_MESSAGE
+from build_journal import BuildJournal, DONE, FAILED, STARTED, song_task, toc_task
 
 # Load configuration
 try:
-    CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-    with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-        CONFIG = json.load(f)
-except FileNotFoundError:
-    print(f"Error: Configuration file not found at {CONFIG_FILE_PATH}")
-    sys.exit(1)
-except json.JSONDecodeError:
-    print(f"Error: Could not decode JSON from {CONFIG_FILE_PATH}")
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
     sys.exit(1)
 
-def run_script(script_name, args_list):
-    """Helper function to run a Python script using subprocess."""
+def run_script(script_name, args_list, prefix="  "):
+    """
+    Helper function to run a Python script in a subprocess.
+    Its output is streamed as it runs, each line starting with prefix, and it is killed
+    if it exceeds the configured script timeout.
+    Returns (succeeded, details), where details describes the run for the failure report.
+    """
     script_path = os.path.join(os.path.dirname(__file__), script_name)
-    command = [sys.executable, script_path] + args_list
+    if not os.path.exists(script_path):
+        print(f"Error: Script {script_path} not found.")
+        return False, {"reason": "script not found", "script": script_name}
+    # -u: unbuffered, so the child's output is streamed as it is printed
+    command = [sys.executable, "-u", script_path] + args_list
     print(f"Running command: {' '.join(command)}")
-    try:
-        # Using encoding for stdout/stderr
-        result = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
-        print(f"Successfully ran {script_name} with args: {' '.join(args_list)}")
-        if result.stdout:
-            print(f"Output:\n{result.stdout}")
-        return True
-    except subprocess.CalledProcessError as e:
+    timeout = CONFIG.conversion['script_timeout_seconds']
+    result = run_streaming(command, timeout=timeout, prefix=prefix)
+    if result["timed_out"]:
+        print(f"Error: {script_name} with args: {' '.join(args_list)} timed out after {timeout} s and was killed")
+        result["reason"] = f"timed out after {timeout} s"
+    elif result["returncode"] != 0:
         print(f"Error running {script_name} with args: {' '.join(args_list)}")
-        print(f"Return code: {e.returncode}")
-        if e.stdout:
-            print(f"Stdout:\n{e.stdout}")
-        if e.stderr:
-            print(f"Stderr:\n{e.stderr}")
-        return False
-    except FileNotFoundError:
-        print(f"Error: Script {script_path} not found.")
-        return False
+        print(f"Return code: {result['returncode']}")
+        result["reason"] = f"exited with code {result['returncode']}"
+    else:
+        print(f"Successfully ran {script_name} with args: {' '.join(args_list)}")
+        return True, result
+    result["script"] = script_name
+    return False, result
 
 
-def generate_full_songbook(version, songs_file_path_arg, templates_dir_arg, output_dir_arg):
+def open_journal(version, journal_path, songs_file_path, shard, resume, retry_failed):
+    """
+    Start a new build journal, or with resume/retry_failed read the journal of the run to
+    continue. Returns None if that run cannot be continued.
+    """
+    try:
+        catalog_sha256 = sharding.catalog_fingerprint(songs_file_path)
+    except OSError:
+        catalog_sha256 = None
+    if not (resume or retry_failed):
+        return BuildJournal.start(journal_path, version, catalog_sha256, shard)
+
+    try:
+        journal = BuildJournal.read(journal_path)
+    except FileNotFoundError:
+        print(f"Error: no build journal to continue at {journal_path}. Run without --resume/--retry-failed first.")
+        return None
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+    if journal.header["catalog_sha256"] != catalog_sha256:
+        # Pages finished from the old catalog would be silently out of date
+        print(f"Error: {songs_file_path} changed since the run in {journal_path} started. Start a new run.")
+        return None
+    counts = journal.counts()
+    print(f"Continuing the run started {journal.header['time']}: {counts[DONE]} tasks done, "
+          f"{counts[FAILED]} failed, {counts[STARTED]} interrupted.")
+    journal.continue_run(resume, retry_failed)
+    return journal
+
+def generate_full_songbook(version, songs_file_path_arg, templates_dir_arg, output_dir_arg,
+                           shard=None, shard_strategy="hash", jobs=None, resume=False, retry_failed=False):
     """
     Generates all pages for a specific songbook version, including two types of TOCs and all song pages.
+    With shard=(k, n), only the songs assigned to shard k of n are generated (see sharding.py);
+    the TOCs are built by shard 1. A shard manifest records what the shard built.
+    Song pages are rendered by `jobs` parallel workers, the longest pages first (see render_history.py).
+    Every task is recorded in a build journal (see build_journal.py). With resume, the last run
+    continues where it stopped; with retry_failed, only the tasks that failed in it run again.
     """
+    jobs = jobs or CONFIG.scheduling['jobs']
     print(f"Starting generation for version: {version}")
+    report_path = CONFIG.failure_report_path(version, output_dir_arg)
+    if shard:
+        print(f"Building shard {shard[0]} of {shard[1]} ({shard_strategy} assignment)")
+        root, extension = os.path.splitext(report_path)
+        report_path = f"{root}_shard{shard[0]}of{shard[1]}{extension}"
+    # Songs that could not be attempted at all; the journal keeps the tasks that failed
+    failures = []
+    version_dir = os.path.join(output_dir_arg or CONFIG.paths.output_dir, CONFIG.songbook_subdir(version))
+    # Determine the actual songs file path to use (argument or config default)
+    actual_songs_file_path = songs_file_path_arg or CONFIG.paths.songs_json
+
+    journal = open_journal(version, CONFIG.build_journal_path(version, output_dir_arg, shard),
+                           actual_songs_file_path, shard, resume, retry_failed)
+    if journal is None:
+        return
+    continuing = resume or retry_failed
+
+    def needs_run(task, output_path):
+        if not continuing:
+            return True
+        if journal.states.get(task) == DONE and not os.path.exists(output_path):
+            print(f"{os.path.basename(output_path)} was built but is missing now; building it again.")
+            return True
+        return journal.should_run(task, resume, retry_failed)
+
+    def report_failures():
+        write_failure_report(report_path, version, failures + list(journal.failures.values()))
 
     # Common arguments for sub-scripts
     # These will be passed if the user provides them to this script,
@@ -61,32 +134,36 @@ def generate_full_songbook(version, songs_file_path_arg, templates_dir_arg, outp
         common_args.extend(["--json-file", songs_file_path_arg])
 
     # 1. Generate Table of Contents (if not projection version)
-    if version != "projection":
-        print("\nGenerating Table of Contents (by ID)...")
-        toc_args_id = ["--version", version, "--toc-version", "1"] + common_args
-        if not run_script("generate_toc.py", toc_args_id):
-            print("Failed to generate TOC by ID. Aborting.")
-            return
-
-        print("\nGenerating Table of Contents (by Title)...")
-        toc_args_title = ["--version", version, "--toc-version", "2"] + common_args
-        if not run_script("generate_toc.py", toc_args_title):
-            print("Failed to generate TOC by Title. Aborting.")
-            return
+    if shard and shard[0] != 1:
+        print("\nSkipping TOC generation: the TOCs are built by shard 1.")
+    elif version != "projection":
+        for toc_version, label, file_key in (("1", "by ID", "toc_pdf_ordered"),
+                                             ("2", "by Title", "toc_pdf_alphabetical")):
+            task = toc_task(toc_version)
+            if not needs_run(task, os.path.join(version_dir, CONFIG.file_names[file_key])):
+                print(f"\nSkipping Table of Contents ({label}): {journal.states[task]} in the earlier run.")
+                continue
+            print(f"\nGenerating Table of Contents ({label})...")
+            toc_args = ["--version", version, "--toc-version", toc_version] + common_args
+            journal.record(task, STARTED)
+            succeeded, details = run_script("generate_toc.py", toc_args)
+            if not succeeded:
+                print(f"Failed to generate TOC {label}. Aborting.")
+                journal.record(task, FAILED, dict(details, stage="toc", toc_version=toc_version))
+                report_failures()
+                return
+            journal.record(task, DONE)
     else:
         print("\nSkipping TOC generation for projection version.")
 
     # 2. Load songs data to iterate for page generation
-    # Determine the actual songs file path to use (argument or config default)
-    actual_songs_file_path = songs_file_path_arg or os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['songs_json_filename'])
-    
     try:
-        with open(actual_songs_file_path, 'r', encoding='utf-8') as f:
-            songs = json.load(f)
+        # Only song metadata is needed here, so lyrics are never loaded
+        songs = list(open_catalog(actual_songs_file_path))
     except FileNotFoundError:
         print(f"Error: Songs JSON file not found at {actual_songs_file_path}. Aborting song page generation.")
         return
-    except json.JSONDecodeError:
+    except ValueError:
         print(f"Error: Could not decode JSON from {actual_songs_file_path}. Aborting song page generation.")
         return
 
@@ -94,26 +171,112 @@ def generate_full_songbook(version, songs_file_path_arg, templates_dir_arg, outp
         print("No songs found in the JSON file. Skipping song page generation.")
         return
 
+    if shard:
+        manifest = {
+            "version": version,
+            "shard": shard[0],
+            "shards": shard[1],
+            "strategy": shard_strategy,
+            "catalog_sha256": sharding.catalog_fingerprint(actual_songs_file_path),
+            "status": "running",
+        }
+        assignment = sharding.assign_shards(songs, shard[1], version, shard_strategy)
+        songs = [song for song in songs if assignment.get(str(song.get("inner_id"))) == shard[0]]
+        manifest["assigned"] = [str(song["inner_id"]) for song in songs]
+        os.makedirs(version_dir, exist_ok=True)
+        manifest_path = sharding.manifest_path(version_dir, shard[0], shard[1])
+        # Written before the pages, so a shard that dies part way shows up as not complete
+        sharding.write_shard_manifest(manifest_path, manifest)
+
+    # Derive the render-ready fields once, so each page script only fills in the template
+    print("\nPreparing song data...")
+    # A shard only prepares the songs assigned to it
+    prepare_catalog(actual_songs_file_path, versions=(version,), songs=songs if shard else None)
+
     print(f"\nFound {len(songs)} songs. Generating individual song pages...")
     # 3. Generate all song pages
     songs_processed_count = 0
     songs_failed_count = 0
+    songs_to_render = []
     for i, song in enumerate(songs):
-        song_inner_id = song.get("inner_id")
-        if not song_inner_id:
+        if not song.get("inner_id"):
             print(f"Warning: Song at index {i} (Title: {song.get('title', 'N/A')}) is missing 'inner_id'. Skipping.")
             songs_failed_count += 1
-            continue
+            failures.append({"stage": "song", "index": i, "title": song.get('title', ''), "reason": "missing inner_id"})
+        elif needs_run(song_task(song["inner_id"]),
+                       os.path.join(version_dir, CONFIG.song_page_filename(song["inner_id"]))):
+            songs_to_render.append(song)
+    if continuing:
+        print(f"{len(songs_to_render)} of {len(songs)} pages left to build in this run.")
+
+    # Longest pages first, so no worker is left with a long page at the end
+    history = RenderHistory.load()
+    predictions = history.predict(songs_to_render, version)
+    songs_to_render = longest_first(songs_to_render, predictions)
+    predicted = predicted_makespan([predictions[str(song["inner_id"])][0] for song in songs_to_render], jobs)
+    from_history = sum(1 for seconds, source in predictions.values() if source == "history")
+    print(f"Scheduling {len(songs_to_render)} pages longest first on {jobs} worker{'s' if jobs != 1 else ''} "
+          f"({from_history} timed from history, {len(songs_to_render) - from_history} estimated). "
+          f"Predicted makespan: {predicted:.1f} s")
 
+    def render_song_page(song):
+        song_inner_id = song.get("inner_id")
         print(f"\nGenerating page for song with inner_id: {song_inner_id} (Title: {song.get('title', 'N/A')})...")
         song_page_args = ["--song-id", str(song_inner_id), "--version", version] + common_args
-        if run_script("generate_songbook_page.py", song_page_args):
-            songs_processed_count +=1
+        # With several workers the outputs interleave, so each line names its song
+        prefix = f"  [{song_inner_id}] " if jobs > 1 else "  "
+        task = song_task(song_inner_id)
+        journal.record(task, STARTED)
+        succeeded, details = run_script("generate_songbook_page.py", song_page_args, prefix)
+        if succeeded:
+            journal.record(task, DONE)
         else:
-            print(f"Failed to generate page for song inner_id {song_inner_id}. Continuing with next song...")
-            songs_failed_count +=1
+            journal.record(task, FAILED, dict(details, stage="song", inner_id=str(song_inner_id),
+                                              id=song.get('id', ''), title=song.get('title', '')))
+        return succeeded, details
+
+    pages_started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # The pool starts jobs in submission order, i.e. longest first
+        futures = {pool.submit(render_song_page, song): song for song in songs_to_render}
+        for future in as_completed(futures):
+            song = futures[future]
+            song_inner_id = song.get("inner_id")
+            succeeded, details = future.result()
+            if succeeded:
+                songs_processed_count +=1
+                # A page fetched from the artifact store says nothing about its render time
+                if not any(ARTIFACT_HIT_MESSAGE in line for line in details["output_tail"]):
+                    history.record(version, str(song_inner_id), details["seconds"])
+            else:
+                print(f"Failed to generate page for song inner_id {song_inner_id}. Continuing with next song...")
+                songs_failed_count +=1
+    actual = time.monotonic() - pages_started
+    history.save()
             
     print(f"\nSong page generation summary: {songs_processed_count} succeeded, {songs_failed_count} failed/skipped.")
+    print(f"Makespan on {jobs} worker{'s' if jobs != 1 else ''}: predicted {predicted:.1f} s, actual {actual:.1f} s.")
+    report_failures()
+    failures += list(journal.failures.values())
+    if shard:
+        completed = {}
+        failed_ids = {failure.get("inner_id") for failure in failures if failure.get("stage") == "song"}
+        for inner_id in manifest["assigned"]:
+            page_path = os.path.join(version_dir, CONFIG.song_page_filename(inner_id))
+            if inner_id not in failed_ids and os.path.exists(page_path):
+                completed[inner_id] = {"file": os.path.basename(page_path), "sha256": sharding.file_sha256(page_path)}
+        if shard[0] == 1 and version != "projection":
+            manifest["tocs"] = {}
+            for toc_key in ("toc_pdf_ordered", "toc_pdf_alphabetical"):
+                toc_path = os.path.join(version_dir, CONFIG.file_names[toc_key])
+                if os.path.exists(toc_path):
+                    manifest["tocs"][CONFIG.file_names[toc_key]] = sharding.file_sha256(toc_path)
+        manifest.update(completed=completed, failed=sorted(failed_ids - {None}),
+                        status="complete" if len(completed) == len(manifest["assigned"]) else "incomplete")
+        sharding.write_shard_manifest(manifest_path, manifest)
+        print(f"Shard manifest ({manifest['status']}): {manifest_path}")
+    if failures:
+        print(f"Failed songs are listed in {report_path}")
     print(f"Finished generation for version: {version}")
 
 
@@ -128,8 +291,26 @@ if __name__ == "__main__":
                         help="Directory containing template files. Overrides config.json setting for sub-scripts.")
     parser.add_argument("--output-dir",
                         help="Directory to save output files. Overrides config.json setting for sub-scripts.")
+    parser.add_argument("--shard", metavar="K/N",
+                        help="Only generate the song pages of shard K of N (e.g. 2/4); shard 1 also builds the TOCs.")
+    parser.add_argument("--shard-strategy", choices=sharding.STRATEGIES, default="hash",
+                        help="How songs are assigned to shards: by a hash of inner_id, or balanced by estimated cost. "
+                             "All shards of a build must use the same strategy.")
+    parser.add_argument("--jobs", type=int, default=CONFIG.scheduling['jobs'],
+                        help="Number of song pages rendered in parallel (default from config.json)")
+
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the last run where it stopped, using its build journal")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Run only the tasks that failed in the last run (with --resume: and the unfinished ones)")
 
     args = parser.parse_args()
+    try:
+        shard = sharding.parse_shard_spec(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Resolve paths to be absolute if provided by user, to ensure consistency for subprocess calls.
     # If not provided, they remain None, and sub-scripts will use their defaults from their loaded config.
@@ -137,4 +318,5 @@ if __name__ == "__main__":
     abs_templates_dir = os.path.abspath(args.templates_dir) if args.templates_dir else None
     abs_output_dir = os.path.abspath(args.output_dir) if args.output_dir else None
 
-    generate_full_songbook(args.version, abs_songs_json, abs_templates_dir, abs_output_dir)
+    generate_full_songbook(args.version, abs_songs_json, abs_templates_dir, abs_output_dir, shard, args.shard_strategy,
+                           args.jobs, args.resume, args.retry_failed)
@@ -1,11 +1,13 @@
-import pandas as pd
 import json
 import os
+import argparse
 
-# Load configuration
-CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-    CONFIG = json.load(f)
+from config import get_config
+from song_catalog import open_catalog
+from sqlite_catalog import write_sqlite_catalog
+from lyrics_search import update_search_index
+
+CONFIG = get_config()
 
 def extract_data_to_json(excel_path=None, output_path=None):
     """
@@ -15,15 +17,18 @@ def extract_data_to_json(excel_path=None, output_path=None):
         excel_path: Path to Excel file. Defaults to path from config.
         output_path: Path to save JSON output. Defaults to path from config.
     """
+    # pandas is slow to import and only needed for the Excel conversion
+    import pandas as pd
+
     if excel_path is None:
-        excel_path = os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['siron_excel_filename'])
+        excel_path = CONFIG.paths.siron_excel
     if output_path is None:
-        output_path = os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['songs_json_filename'])
+        output_path = CONFIG.paths.songs_json
         
     print(f"Reading data from {excel_path}...")
     
     # Mapping of Hungarian column headers to JSON property names from config
-    column_mapping = CONFIG['excel_column_mapping']
+    column_mapping = CONFIG.excel_column_mapping
     
     try:
         # Read the Excel file
@@ -87,38 +92,54 @@ def extract_data_to_json(excel_path=None, output_path=None):
         print(f"Error extracting data: {str(e)}")
         return False
 
+def print_summary(catalog):
+    """Print song counts from a catalog (JSON or SQLite backend)."""
+    summary = catalog.summary()
+
+    print("\nSummary:")
+    print(f"Total songs: {summary['total']}")
+    
+    # Count songs with YouTube links
+    print(f"Songs with YouTube links: {summary['youtube']}")
+    
+    # Count songs with explicit content
+    print(f"Songs with explicit content: {summary['explicit_content']}")
+    
+    # Count songs by category
+    categories = summary['categories']
+    if categories:
+        print("\nSongs by category:")
+        for cat, count in sorted(categories.items()):
+            print(f"  {cat}: {count}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the Excel song list to songs.json and optionally a SQLite catalog.")
+    parser.add_argument("--excel-file", default=CONFIG.paths.siron_excel,
+                        help="Path to the Excel file")
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json,
+                        help="Path to write the JSON file containing song data")
+    parser.add_argument("--sqlite", nargs="?", const=CONFIG.paths.songs_sqlite, metavar="DB_FILE",
+                        help=f"Also write an indexed SQLite catalog (default path: {CONFIG.paths.songs_sqlite})")
+    parser.add_argument("--search-index", nargs="?", const=CONFIG.paths.search_index, metavar="INDEX_FILE",
+                        help=f"Also update the lyrics search index (default path: {CONFIG.paths.search_index})")
+    args = parser.parse_args()
+
     # Run the extraction
-    extract_data_to_json()
+    extract_data_to_json(args.excel_file, args.json_file)
     
     # Provide a summary of the data
     try:
-        summary_json_path = os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['songs_json_filename'])
-        with open(summary_json_path, 'r', encoding='utf-8') as f:
-            songs = json.load(f)
-            
-        print("\nSummary:")
-        print(f"Total songs: {len(songs)}")
-        
-        # Count songs with YouTube links
-        youtube_count = sum(1 for song in songs if song.get('youtube'))
-        print(f"Songs with YouTube links: {youtube_count}")
-        
-        # Count songs with explicit content
-        explicit_count = sum(1 for song in songs if song.get('explicit_content'))
-        print(f"Songs with explicit content: {explicit_count}")
-        
-        # Count songs by category
-        categories = {}
-        for song in songs:
-            cat = song.get('category', '').strip()
-            if cat:
-                categories[cat] = categories.get(cat, 0) + 1
-        
-        if categories:
-            print("\nSongs by category:")
-            for cat, count in sorted(categories.items()):
-                print(f"  {cat}: {count}")
+        summary_catalog = open_catalog(args.json_file)
+
+        if args.sqlite:
+            song_count = write_sqlite_catalog(summary_catalog, args.sqlite)
+            print(f"Successfully wrote {song_count} songs to SQLite catalog {args.sqlite}")
+            summary_catalog = open_catalog(args.sqlite)
+
+        print_summary(summary_catalog)
+
+        if args.search_index:
+            update_search_index(args.json_file, args.search_index)
     
     except Exception as e:
         print(f"Error generating summary: {str(e)}")
@@ -1,36 +1,26 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import sys
 import argparse
-import subprocess
 import base64
+import functools
 from io import BytesIO
-from jinja2 import Environment, FileSystemLoader
-from dotenv import load_dotenv
-import qrcode
 import re
+from types import MappingProxyType
 
-# Load configuration
-CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-    CONFIG = json.load(f)
+from config import get_config
+from song_catalog import SongRecord, open_catalog
 
-# Load environment variables from .env file
-load_dotenv()
+# Heavy dependencies (jinja2, qrcode, python-dotenv) are imported where they are used,
+# so the CLI starts quickly and projection pages never load qrcode/Pillow.
+CONFIG = get_config()
 
-def wrap_chords_in_lyrics(text_with_chords):
+@functools.lru_cache(maxsize=None)
+def get_chord_pattern(chords):
     """
-    Finds words in the input text that are guitar chords (from config)
-    and wraps them in a <span class="chord">CHORD</span>.
+    Compile the chord matching regex once per chord list.
     """
-    if not text_with_chords:
-        return ""
-    
-    chords = CONFIG.get('guitar_chords', [])
-    if not chords:
-        return text_with_chords
-        
     # Sort chords by length in descending order to match longer chords first (e.g., "Am7" before "A")
     # Also, escape special characters in chords for regex.
     sorted_chords_escaped = sorted(map(re.escape, chords), key=len, reverse=True)
@@ -40,43 +30,69 @@ def wrap_chords_in_lyrics(text_with_chords):
     # (?!\S) asserts position is not followed by a non-whitespace character.
     # This effectively matches whole words separated by whitespace.
     # The inner parentheses create a capturing group for the chord itself.
-    chord_pattern_str = r'(?<!\S)(' + '|'.join(sorted_chords_escaped) + r')(?!\S)'
+    return re.compile(r'(?<!\S)(' + '|'.join(sorted_chords_escaped) + r')(?!\S)')
+
+def wrap_chords_in_lyrics(text_with_chords):
+    """
+    Finds words in the input text that are guitar chords (from config)
+    and wraps them in a <span class="chord">CHORD</span>.
+    """
+    if not text_with_chords:
+        return ""
+    
+    chords = CONFIG.guitar_chords
+    if not chords:
+        return text_with_chords
     
     def replace_chord(match):
         return f'<span class="chord">{match.group(1)}</span>' # match.group(1) is the captured chord
         
-    return re.sub(chord_pattern_str, replace_chord, text_with_chords)
+    return get_chord_pattern(chords).sub(replace_chord, text_with_chords)
 
 def load_song_data(json_file_path, song_id=None):
     """
-    Load song data from a JSON file.
+    Load song data from a JSON or JSON Lines catalog.
     If song_id is provided, return only that song.
     Otherwise, return all songs.
+    Songs are SongRecords whose lyrics are read from the file on first use.
     """
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        songs = json.load(file)
+    catalog = open_catalog(json_file_path)
     
     if song_id is not None:
-        for song in songs:
-            if str(song['inner_id']) == str(song_id): # Changed 'id' to 'inner_id'
-                return song
-        raise ValueError(f"Song with ID {song_id} not found.")
-    return songs
+        try:
+            return catalog.get(song_id) # Looked up by 'inner_id'
+        except KeyError:
+            raise ValueError(f"Song with ID {song_id} not found.")
+    return list(catalog)
+
+# Everything besides the URL that determines the QR image (also part of its artifact key)
+QR_SETTINGS = {"version": 1, "error_correction": "M", "box_size": 10, "border": 4}
 
+@functools.lru_cache(maxsize=1024)
 def generate_qr_code(url):
     """
-    Generate a QR code for the given URL and return it as a base64 encoded string
+    Generate a QR code for the given URL and return it as a base64 encoded string.
+    Results are memoized, so long-running callers only encode each URL once.
     """
     if not url:
         return None
+
+    from artifact_store import artifact_key, get_artifact_store
+    store = get_artifact_store()
+    key = artifact_key("qr", url, QR_SETTINGS)
+    if store is not None:
+        cached = store.get(key)
+        if cached is not None:
+            return cached.decode('ascii')
     
     print(f"Generating QR code for URL: {url}")
+    import qrcode
             
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=4,
+        box_size=QR_SETTINGS['box_size'],
+        border=QR_SETTINGS['border'],
     )
     qr.add_data(url)
     qr.make(fit=True)
@@ -88,8 +104,10 @@ def generate_qr_code(url):
     img.save(buffer, format="PNG")
     # Convert to base64 for embedding in HTML
     img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
-    return f"data:image/png;base64,{img_str}"
+    data_uri = f"data:image/png;base64,{img_str}"
+    if store is not None:
+        store.put(key, data_uri.encode('ascii'))
+    return data_uri
 
 def process_line_breaks(text):
     """
@@ -155,62 +173,102 @@ def break_lyrics_into_columns(lyrics_html, num_columns):
         # For num_columns other than 2, return original lyrics in first column.
         return [lyrics_html, ""]
 
-def render_template(template_path, song_data):
+@functools.lru_cache(maxsize=None)
+def get_template_environment(template_dir):
     """
-    Render a Jinja2 template with the provided song data.
+    Return a Jinja2 environment for the given directory, created once per process.
+    Jinja2 re-checks template modification times, so edited templates are picked up.
     """
-    song_data['columns'] = 1
-    template_dir = os.path.dirname(template_path)
-    template_file = os.path.basename(template_path)
-    # Construct static path using config
-    static_path_abs = os.path.abspath(os.path.join(CONFIG['paths']['templates_dir'], CONFIG['paths']['static_dir_name']))
-    song_data['static_path'] = 'file:///' + static_path_abs.replace(os.sep, '/')
+    from jinja2 import Environment, FileSystemLoader
+    return Environment(loader=FileSystemLoader(template_dir))
 
+def derive_page_fields(song, version, chord_sheet=None, semitones=0):
+    """
+    Compute the fields a song page derives from the lyrics: the lyrics HTML (split into
+    columns for long songs), the column count, the lyrics CSS class and, for the singer
+    version, the QR code. The song (a dict or a SongRecord) is not modified.
+    For the musician version, a transpose.ChordSheet of the song and a number of
+    semitones render the chords in another key.
+    """
+    fields = {'columns': 1}
 
-    if song_data['version'] == "musician":
-        if len(song_data.get('lyrics_with_chords', '').strip())==0:
-            song_data['lyrics_with_chords'] = song_data.get('lyrics', '') # Copy from lyrics
-        song_data['lyrics'] = process_line_breaks(wrap_chords_in_lyrics(song_data['lyrics_with_chords']))
+    if version == "musician":
+        lyrics_with_chords = song.get('lyrics_with_chords') or ''
+        if len(lyrics_with_chords.strip())==0:
+            lyrics_with_chords = song.get('lyrics', '') # Copy from lyrics
+            fields['lyrics_with_chords'] = lyrics_with_chords
+        if chord_sheet is not None and semitones % 12:
+            lyrics = process_line_breaks(chord_sheet.html(semitones))
+            fields['transposed_key'] = chord_sheet.key_name(semitones)
+        else:
+            lyrics = process_line_breaks(wrap_chords_in_lyrics(lyrics_with_chords))
     else: # For other versions like projection, handle lyrics if necessary
-        song_data['lyrics'] = process_line_breaks(song_data['lyrics'])
+        lyrics = process_line_breaks(song['lyrics'])
 
     # Determine the CSS class for lyrics based on length thresholds from config
-    lyrics_length = len(song_data['lyrics'].split('<br>'))
-    if lyrics_length >= CONFIG['lyrics']['column_break_threshold']:
-        song_data['columns'] = 2
+    lyrics_length = len(lyrics.split('<br>'))
+    if lyrics_length >= CONFIG.lyrics.column_break_threshold:
+        fields['columns'] = 2
 
-    if song_data['columns'] > 1:
-        song_data['lyrics'] = break_lyrics_into_columns(song_data['lyrics'], song_data['columns'])
+    if fields['columns'] > 1:
+        lyrics = break_lyrics_into_columns(lyrics, fields['columns'])
+    fields['lyrics'] = lyrics
 
-    if lyrics_length <= CONFIG['lyrics']['lines_thresholds']['large']:
-        song_data['lyrics_css'] = 'lyrics-l'
-    elif lyrics_length >= CONFIG['lyrics']['lines_thresholds']['small']:
-        song_data['lyrics_css'] = 'lyrics-s'
+    if lyrics_length <= CONFIG.lyrics.large_lines_threshold:
+        fields['lyrics_css'] = 'lyrics-l'
+    elif lyrics_length >= CONFIG.lyrics.small_lines_threshold:
+        fields['lyrics_css'] = 'lyrics-s'
     else:
-        song_data['lyrics_css'] = 'lyrics-m'
+        fields['lyrics_css'] = 'lyrics-m'
+
+    # Generate QR code if YouTube link exists
+    if 'youtube' in song and version == "singer":
+        fields['qr_code_data'] = generate_qr_code(song['youtube'])
+
+    return fields
+
+def build_render_context(song_data, version=None, chord_sheet=None, semitones=0, prepared=None):
+    """
+    Build the values a song page template is rendered with.
+    The song itself (a dict or a SongRecord) is left untouched; a new read-only mapping is returned.
+    The derived fields come from `prepared` (see prepare_songs.py) when given,
+    and are computed by derive_page_fields otherwise.
+    """
+    song = song_data.to_dict() if isinstance(song_data, SongRecord) else dict(song_data)
+    if version is not None:
+        song['version'] = version
+    # Construct static path using config
+    song['static_path'] = 'file:///' + CONFIG.paths.static_dir.replace(os.sep, '/')
+
+    if prepared is None:
+        prepared = derive_page_fields(song, song['version'], chord_sheet, semitones)
+    song.update(prepared)
+
+    return MappingProxyType(song)
+
+def render_template(template_path, song_data, version=None, chord_sheet=None, semitones=0, prepared=None):
+    """
+    Render a Jinja2 template with the provided song data.
+    If version is not given, it is taken from song_data['version'].
+    chord_sheet and semitones transpose the musician version, and prepared supplies
+    precomputed derived fields (see build_render_context).
+    """
+    template_dir = os.path.dirname(template_path)
+    template_file = os.path.basename(template_path)
+    context = build_render_context(song_data, version, chord_sheet, semitones, prepared)
    
-    env = Environment(loader=FileSystemLoader(template_dir))
+    env = get_template_environment(template_dir)
     template = env.get_template(template_file)
     
-    # Generate QR code if YouTube link exists
-    if 'youtube' in song_data and song_data['version'] == "singer":
-        song_data['qr_code_data'] = generate_qr_code(song_data['youtube'])
-    
-    return template.render(song=song_data)
+    return template.render(song=context)
 
-def html_to_pdf(html_content, output_path, version):
+def get_page_options(version):
     """
-    Convert HTML content to PDF using wkhtmltopdf.
-    Adjust page size based on version.
+    Return the wkhtmltopdf page options for the given songbook version.
     """
-    # Create temporary HTML file
-    temp_html = os.path.join(CONFIG['paths']['temp_dir'], CONFIG['file_names']['temp_html_page'])
-    with open(temp_html, 'w', encoding='utf-8') as file:
-        file.write(html_content)
-    
     # Set page parameters based on version from config
     if version == "projection":
-        params = CONFIG['page_parameters']['projection']
+        params = CONFIG.page_parameters['projection']
         page_options = [
             "--page-width", params['page_width'],
             "--page-height", params['page_height'],
@@ -221,7 +279,7 @@ def html_to_pdf(html_content, output_path, version):
             "--zoom", params['zoom']
         ]
     else: # singer or musician (A4)
-        params = CONFIG['page_parameters']['a4_song']
+        params = CONFIG.page_parameters['a4_song']
         page_options = [
             "--page-size", params['page_size'],
             "--orientation", params['orientation'],
@@ -233,30 +291,50 @@ def html_to_pdf(html_content, output_path, version):
     
     # Add common extra options from config
     page_options += params.get('extra_options', [])
-        
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # Execute wkhtmltopdf command
-    wkhtmltopdf_path = os.getenv('WKHTMLTOPDF_PATH', CONFIG['paths']['wkhtmltopdf'])
-    cmd = [wkhtmltopdf_path] + page_options + [temp_html, output_path]
-    
-    try:
-        result = subprocess.run(cmd, check=True)
+    return page_options
+
+def html_to_pdf(html_content, output_path, version):
+    """
+    Convert HTML content to PDF bytes using wkhtmltopdf, and write them to output_path
+    unless it is None. Adjust page size based on version.
+    The HTML is piped into wkhtmltopdf and the PDF read back from it; nothing is
+    written to disk but the output file.
+    A hung or failing wkhtmltopdf is killed and retried as configured; if every
+    attempt fails, pdf_conversion.ConversionError is raised.
+    A PDF already in the artifact store is used instead of rendering.
+    """
+    from pdf_conversion import convert_html, write_pdf
+    from reproducible_pdf import normalize_if_enabled
+    from artifact_store import ARTIFACT_HIT_MESSAGE, artifact_key, pdf_settings, fetch_artifact, store_artifact
+
+    page_options = get_page_options(version)
+
+    # The same HTML rendered with the same settings was already converted somewhere
+    key = artifact_key("pdf", html_content, pdf_settings(page_options))
+    data = fetch_artifact(key)
+    if data is not None:
+        if output_path:
+            write_pdf(data, output_path)
+            print(f"{ARTIFACT_HIT_MESSAGE}: {output_path}")
+        return data
+
+    data = normalize_if_enabled(convert_html(html_content, page_options, output_path or "song page"))
+    store_artifact(key, data)
+    if output_path:
+        write_pdf(data, output_path)
         print(f"Successfully generated PDF: {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error generating PDF: {e}")
+    return data
 
 def get_template_for_version(templates_dir, version):
     """
     Return the appropriate template file path based on the songbook version.
     """
     if version == "singer":
-        return os.path.join(templates_dir, CONFIG['templates']['singer_song_page'])
+        return os.path.join(templates_dir, CONFIG.templates['singer_song_page'])
     elif version == "musician":
-        return os.path.join(templates_dir, CONFIG['templates']['musician_song_page'])
+        return os.path.join(templates_dir, CONFIG.templates['musician_song_page'])
     elif version == "projection":
-        return os.path.join(templates_dir, CONFIG['templates']['projection_song_page'])
+        return os.path.join(templates_dir, CONFIG.templates['projection_song_page'])
     else:
         raise ValueError(f"Invalid version: {version}")
 
@@ -266,21 +344,20 @@ def generate_song_page(song_id, version, templates_dir, output_dir, json_file):
     """
     # Load song data
     song_data = load_song_data(json_file, song_id)
-    
-    # Add version to song_data so it can be passed to render_template
-    song_data['version'] = version
 
     # Get the appropriate template
     template_path = get_template_for_version(templates_dir, version)
     
-    # Render HTML
-    html_content = render_template(template_path, song_data)
+    # Render HTML, with the derived fields from the prepare stage when it has run;
+    # only this song's entry is read from the cache
+    from prepare_songs import PreparedSongs
+    prepared = PreparedSongs.load(CONFIG.paths.prepared_cache).get(song_data, version)
+    html_content = render_template(template_path, song_data, version, prepared=prepared)
     
     # Generate output file path
-    output_subdir_template = CONFIG['output_formats']['songbook_subdir_template']
-    output_subdir = output_subdir_template.format(version=version)
+    output_subdir = CONFIG.songbook_subdir(version)
     os.makedirs(os.path.join(output_dir, output_subdir), exist_ok=True)
-    output_filename = f"{CONFIG['file_names']['song_page_prefix']}{song_data['inner_id']}{CONFIG['file_names']['song_page_suffix']}"
+    output_filename = CONFIG.song_page_filename(song_data['inner_id'])
     output_path = os.path.join(output_dir, output_subdir, output_filename)
     
     # Convert HTML to PDF
@@ -293,19 +370,25 @@ if __name__ == "__main__":
     parser.add_argument("--song-id", required=True, help="Inner ID of the song to generate a page for")
     parser.add_argument("--version", choices=["singer", "musician", "projection"], 
                         required=True, help="Songbook version to generate")
-    parser.add_argument("--templates-dir", default=CONFIG['paths']['templates_dir'], 
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir, 
                         help="Directory containing template files")
-    parser.add_argument("--output-dir", default=CONFIG['paths']['output_dir'], 
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir, 
                         help="Directory to save output files")
-    parser.add_argument("--json-file", default=os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['songs_json_filename']), 
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json, 
                         help="Path to the JSON file containing song data")
     
     args = parser.parse_args()
     
-    generate_song_page(
-        args.song_id, 
-        args.version, 
-        args.templates_dir, 
-        args.output_dir, 
-        args.json_file
-    )
+    from pdf_conversion import ConversionError
+    try:
+        generate_song_page(
+            args.song_id, 
+            args.version, 
+            args.templates_dir, 
+            args.output_dir, 
+            args.json_file
+        )
+    except ConversionError as e:
+        print(f"Error generating PDF: {e}")
+        # The exit code tells generate_full_songbook.py that this song failed
+        sys.exit(1)
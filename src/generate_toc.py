@@ -1,21 +1,18 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import sys
 import argparse
-import subprocess
-from jinja2 import Environment, FileSystemLoader
 
-# Load configuration
-CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', 'config.json')
-with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-    CONFIG = json.load(f)
+from config import get_config
+from song_catalog import open_catalog, sort_toc_songs
+from page_index import TOC_LINK_PREFIX
+
+CONFIG = get_config()
 
 def load_songs_data(json_file_path):
-    """Load all songs data from the JSON file."""
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        songs = json.load(file)
-    return songs
+    """Load the metadata of all songs; lyrics are not needed for the ToC and are never read."""
+    return list(open_catalog(json_file_path))
 
 def sort_songs(songs, sort_by="id"):
     """
@@ -28,45 +25,34 @@ def sort_songs(songs, sort_by="id"):
     Returns:
         Sorted list of song dictionaries
     """
-    # Filter out songs with skip_toc set to True
-    filtered_songs = [song for song in songs if not song.get('skip_toc', False)]
-    
-    if sort_by == "id":
-        # Sort by the new 'inner_id' for consistent numerical ordering
-        return sorted(filtered_songs, key=lambda x: int(x['inner_id']))
-    elif sort_by == "title":
-        hungarian_alphabet = "aábcdeéfghiíjklmnoóöőpqrstuúüűvwxyz"
-        alphabet_order = {char: index for index, char in enumerate(hungarian_alphabet)}
-        
-        def hungarian_sort_key(title):
-            return [alphabet_order.get(char, len(hungarian_alphabet)) for char in title.casefold()]
-        
-        return sorted(filtered_songs, key=lambda x: hungarian_sort_key(x['title']))
-    else:
-        raise ValueError(f"Invalid sort_by parameter: {sort_by}")
+    return sort_toc_songs(songs, sort_by)
 
 def render_toc_template(template_path, data):
     """Render a ToC template with the provided songs data and sort order."""
     template_dir = os.path.dirname(template_path)
     template_file = os.path.basename(template_path)
     # Corrected static path to be relative to the templates_dir from config
-    static_path_abs = os.path.abspath(os.path.join(CONFIG['paths']['templates_dir'], CONFIG['paths']['static_dir_name']))
-    data['static_path'] = 'file:///' + static_path_abs.replace(os.sep, '/')
+    data['static_path'] = 'file:///' + CONFIG.paths.static_dir.replace(os.sep, '/')
     
+    from jinja2 import Environment, FileSystemLoader
     env = Environment(loader=FileSystemLoader(template_dir))
     template = env.get_template(template_file)
 
     return template.render(data=data) # Pass sort_order to template
 
-def html_to_pdf(html_content, output_path):
-    """Convert HTML content to PDF using wkhtmltopdf."""
-    # Create temporary HTML file
-    temp_html = os.path.join(CONFIG['paths']['temp_dir'], CONFIG['file_names']['temp_html_toc'])
-    with open(temp_html, 'w', encoding='utf-8') as file:
-        file.write(html_content)
-    
+def html_to_pdf(html_content, output_path=None):
+    """
+    Convert HTML content to PDF bytes using wkhtmltopdf, piping the HTML in and the PDF
+    out, and write them to output_path unless it is None.
+    Raises pdf_conversion.ConversionError if it keeps failing or hanging.
+    A PDF already in the artifact store is used instead of rendering.
+    """
+    from pdf_conversion import convert_html, write_pdf
+    from reproducible_pdf import normalize_if_enabled
+    from artifact_store import artifact_key, pdf_settings, fetch_artifact, store_artifact
+
     # A4 portrait settings for ToC from config
-    params = CONFIG['page_parameters']['a4_toc']
+    params = CONFIG.page_parameters['a4_toc']
     page_options = [
         "--page-size", params['page_size'],
         "--orientation", params['orientation'],
@@ -78,23 +64,22 @@ def html_to_pdf(html_content, output_path):
     # Add common extra options from config
     page_options += params.get('extra_options', [])
 
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # Execute wkhtmltopdf command
-    wkhtmltopdf_path = os.getenv('WKHTMLTOPDF_PATH', CONFIG['paths']['wkhtmltopdf'])
-    cmd = [wkhtmltopdf_path] + page_options + [temp_html, output_path]
-    
-    try:
-        result = subprocess.run(cmd, check=True)
+    key = artifact_key("pdf", html_content, pdf_settings(page_options))
+    data = fetch_artifact(key)
+    if data is not None:
+        if output_path:
+            write_pdf(data, output_path)
+            print(f"Fetched ToC PDF from the artifact store: {output_path}")
+        return data
+
+    data = normalize_if_enabled(convert_html(html_content, page_options, output_path or "ToC"))
+    store_artifact(key, data)
+    if output_path:
+        write_pdf(data, output_path)
         print(f"Generated ToC PDF: {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error generating ToC PDF: {e}")
-    finally:
-        if os.path.exists(temp_html):
-            os.remove(temp_html)
+    return data
 
-def generate_toc(version, toc_version, templates_dir, output_dir, json_file):
+def generate_toc(version, toc_version, templates_dir, output_dir, json_file, page_numbers=None):
     """
     Generate a PDF Table of Contents for the specified songbook version.
     
@@ -104,39 +89,39 @@ def generate_toc(version, toc_version, templates_dir, output_dir, json_file):
         templates_dir: Directory containing template files
         output_dir: Directory to save output files
         json_file: Path to the JSON file containing song data
+        page_numbers: Optional {inner_id: page} in the merged songbook; adds a page
+            column and links from the titles to the songs
     """
     # Projection version doesn't have a TOC
     if version == "projection":
         print("Projection version does not include a Table of Contents.")
         return None
     
-    # Load songs data
-    songs_data = load_songs_data(json_file)
-    
-    # Sort songs based on TOC version
+    # Sort songs based on TOC version; the SQLite backend answers this from its indexes
     sort_by = "id" if toc_version == "1" else "title"
-    sorted_songs = sort_songs(songs_data, sort_by)
+    sorted_songs = open_catalog(json_file).toc_songs(sort_by)
     
     # Get the template path from config
-    template_filename = CONFIG['templates']['toc_template']
+    template_filename = CONFIG.templates['toc_template']
     template_path = os.path.join(templates_dir, template_filename)
     
     data = {
         "songs": sorted_songs,
         "version": version,
         "sort_by": sort_by,
+        "page_numbers": page_numbers,
+        "link_prefix": TOC_LINK_PREFIX,
     }
     # Render HTML, passing the sort_by value as sort_order for the template
     html_content = render_toc_template(template_path, data)
     
     # Generate output file path
-    output_subdir_template = CONFIG['output_formats']['songbook_subdir_template']
-    output_subdir = output_subdir_template.format(version=version)
+    output_subdir = CONFIG.songbook_subdir(version)
     os.makedirs(os.path.join(output_dir, output_subdir), exist_ok=True)
     if toc_version == "1":
-        output_filename = CONFIG['file_names']['toc_pdf_ordered']
+        output_filename = CONFIG.file_names['toc_pdf_ordered']
     elif toc_version == "2":
-        output_filename = CONFIG['file_names']['toc_pdf_alphabetical']
+        output_filename = CONFIG.file_names['toc_pdf_alphabetical']
     else:
         raise ValueError(f"Invalid ToC version: {toc_version}")
     output_path = os.path.join(output_dir, output_subdir, output_filename)
@@ -152,19 +137,24 @@ if __name__ == "__main__":
                         required=True, help="Songbook version to generate")
     parser.add_argument("--toc-version", choices=["1", "2"], required=True,
                         help="ToC version: 1 for ordered by ID, 2 for alphabetical by title")
-    parser.add_argument("--templates-dir", default=CONFIG['paths']['templates_dir'], 
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir, 
                         help="Directory containing template files")
-    parser.add_argument("--output-dir", default=CONFIG['paths']['output_dir'], 
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir, 
                         help="Directory to save output files")
-    parser.add_argument("--json-file", default=os.path.join(CONFIG['paths']['data_dir'], CONFIG['paths']['songs_json_filename']), 
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json, 
                         help="Path to the JSON file containing song data")
     
     args = parser.parse_args()
     
-    generate_toc(
-        args.version, 
-        args.toc_version, 
-        args.templates_dir, 
-        args.output_dir, 
-        args.json_file
-    )
+    from pdf_conversion import ConversionError
+    try:
+        generate_toc(
+            args.version, 
+            args.toc_version, 
+            args.templates_dir, 
+            args.output_dir, 
+            args.json_file
+        )
+    except ConversionError as e:
+        print(f"Error generating ToC PDF: {e}")
+        sys.exit(1)
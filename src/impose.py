@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Impose a songbook onto booklet signatures for printing.
+
+Pages are placed two-up on landscape sheets in booklet order, so that folded
+and nested sheets read in page order. Each signature (a stack of sheets folded
+together) holds `signature_pages` pages. Set it to 0 to get a single
+saddle-stitched signature; otherwise signatures are gathered for perfect
+binding. The book is padded with blank pages at the end to fill the last
+signature, which is shrunk to the fewest whole sheets that fit.
+
+The input is either the merged songbook or the per-song PDFs (in the order
+build_final_songbook.py merges them). Nothing is rendered again. Each source
+page becomes a Form XObject that reuses the page's compressed content stream and
+resources as they are, and a sheet only adds a few drawing operators that place
+two of them and, optionally, crop and fold marks. Pages with a /Rotate are
+placed turned as a viewer shows them. Source files are read one after the
+other and pages are copied signature by signature, so memory stays around the
+size of the source and output files.
+"""
+
+import os
+import sys
+import argparse
+
+from config import get_config, ConfigError
+
+# Load configuration
+try:
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+MM = 72 / 25.4
+# Landscape sheet sizes in points; "auto" makes the sheet exactly two pages wide
+SHEET_SIZES = {"A3": (1190.55, 841.89), "A4": (841.89, 595.28), "SRA3": (1275.59, 907.09)}
+
+def signature_sizes(page_count, signature_pages):
+    """Page counts of the signatures of a book, each a multiple of 4."""
+    total = -(-page_count // 4) * 4
+    if not signature_pages:
+        return [total] if total else []
+    sizes = []
+    while total > 0:
+        sizes.append(min(signature_pages, total))
+        total -= sizes[-1]
+    return sizes
+
+def imposition_order(page_count, signature_pages):
+    """
+    Return the sides of the printed sheets in print order, front then back of each
+    sheet, as (left, right) page indexes. None marks a blank padding page.
+    """
+    sides = []
+    start = 0
+    for size in signature_sizes(page_count, signature_pages):
+        for sheet in range(size // 4):
+            # The outermost sheet carries the first two and last two pages of the signature
+            sides.append((start + size - 1 - 2 * sheet, start + 2 * sheet))
+            sides.append((start + 2 * sheet + 1, start + size - 2 - 2 * sheet))
+        start += size
+    return [tuple(index if index < page_count else None for index in side) for side in sides]
+
+def count_pages(pdf_paths):
+    from PyPDF2 import PdfReader
+    return sum(len(PdfReader(path).pages) for path in pdf_paths)
+
+def _iter_pages(pdf_paths, readers):
+    """
+    Yield the pages of pdf_paths in order. Each reader is appended to readers, which the caller
+    keeps until the output is written: PyPDF2 remembers the objects it copied by id() of their
+    reader, and a freed reader's id() could be reused by the next one.
+    """
+    from PyPDF2 import PdfReader
+    for path in pdf_paths:
+        reader = PdfReader(path)
+        readers.append(reader)
+        yield from reader.pages
+
+def _rotation_matrix(rotation, left, bottom, width, height):
+    """
+    The matrix that turns a page's box (left, bottom, width, height) the way its /Rotate
+    (clockwise, a multiple of 90) shows it, with the shown page's lower left corner at 0, 0.
+    """
+    right, top = left + width, bottom + height
+    return {
+        90: (0, -1, 1, 0, -bottom, right),
+        180: (-1, 0, 0, -1, right, top),
+        270: (0, 1, -1, 0, top, -left),
+    }[rotation]
+
+def _page_form(writer, page):
+    """Add a page to writer as a Form XObject and return its reference. Content is not re-encoded."""
+    from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+                                FloatObject, NameObject)
+
+    contents = page.get('/Contents')
+    contents = contents.get_object() if contents is not None else None
+    if isinstance(contents, ArrayObject):
+        # Several content streams are concatenated (decoded) into one
+        form = DecodedStreamObject()
+        form.set_data(b"\n".join(part.get_object().get_data() for part in contents))
+    elif contents is not None and '/Filter' in contents:
+        form = EncodedStreamObject()
+        form._data = contents._data
+        for key in ('/Filter', '/DecodeParms'):
+            if key in contents:
+                form[NameObject(key)] = contents[key].clone(writer)
+    else:
+        form = DecodedStreamObject()
+        form.set_data(contents.get_data() if contents is not None else b"")
+
+    resources = page.get('/Resources')
+    box = page.mediabox
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject(FloatObject(value) for value in (box.left, box.bottom, box.right, box.top)),
+        NameObject('/Resources'): resources.get_object().clone(writer) if resources is not None else DictionaryObject(),
+    })
+    placed_box = (float(box.left), float(box.bottom), float(box.width), float(box.height))
+    rotation = int(page.get('/Rotate', 0)) % 360
+    if rotation:
+        if rotation % 90:
+            raise ValueError(f"Page rotation must be a multiple of 90 degrees, got {rotation}")
+        # The form is drawn turned as the page is shown, so it is placed by its shown size
+        form[NameObject('/Matrix')] = ArrayObject(FloatObject(value)
+                                                  for value in _rotation_matrix(rotation, *placed_box))
+        width, height = placed_box[2:]
+        placed_box = (0.0, 0.0, height, width) if rotation in (90, 270) else (0.0, 0.0, width, height)
+    return writer._add_object(form), placed_box
+
+def _crop_marks(left, bottom, width, height, offset, length):
+    """Drawing operators for trim marks at the corners of the spread and fold marks at its centre."""
+    right, top, fold = left + width, bottom + height, left + width / 2
+    lines = []
+    for x, y, dx, dy in ((left, bottom, -1, -1), (right, bottom, 1, -1), (left, top, -1, 1), (right, top, 1, 1)):
+        lines.append((x + dx * offset, y, x + dx * (offset + length), y))
+        lines.append((x, y + dy * offset, x, y + dy * (offset + length)))
+    lines.append((fold, bottom - offset, fold, bottom - offset - length))
+    lines.append((fold, top + offset, fold, top + offset + length))
+    ops = ["q 0.25 w 0 G"] + [f"{x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S" for x1, y1, x2, y2 in lines] + ["Q"]
+    return "\n".join(ops)
+
+def impose(pdf_paths, output_path, signature_pages=None, sheet_size=None, crop_marks=None):
+    """
+    Impose the pages of pdf_paths (in order) onto booklet sheets and write them to output_path.
+    Settings default to the `imposition` section of config.json. Returns the number of sheets.
+    """
+    from PyPDF2 import PdfWriter, PageObject
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+    from reproducible_pdf import is_enabled, write_reproducible
+
+    settings = CONFIG.imposition
+    signature_pages = settings['signature_pages'] if signature_pages is None else signature_pages
+    sheet_size = sheet_size or settings['sheet_size']
+    crop_marks = settings['crop_marks'] if crop_marks is None else crop_marks
+    if signature_pages < 0 or signature_pages % 4:
+        raise ValueError(f"Signature size must be a multiple of 4, got {signature_pages}")
+    if sheet_size != "auto" and sheet_size not in SHEET_SIZES:
+        raise ValueError(f"Unknown sheet size '{sheet_size}' (available: auto, {', '.join(SHEET_SIZES)})")
+
+    page_count = count_pages(pdf_paths)
+    if not page_count:
+        raise ValueError("No pages to impose")
+    sides = imposition_order(page_count, signature_pages)
+
+    writer = PdfWriter()
+    readers = []
+    pages = _iter_pages(pdf_paths, readers)
+    forms = {}
+    next_page = 0
+    offset, length = settings['crop_mark_offset_mm'] * MM, settings['crop_mark_length_mm'] * MM
+    margin = offset + length if crop_marks else 0
+    slot = sheet = scale = None
+
+    for side_index, side in enumerate(sides):
+        if side_index % 2 == 0:
+            # Copy the source pages up to the highest one this sheet needs, i.e. at most
+            # one signature ahead; each page is dropped from `forms` once placed
+            needed = max((index for index in side + sides[side_index + 1] if index is not None), default=-1)
+            while next_page <= needed:
+                forms[next_page] = _page_form(writer, next(pages))
+                next_page += 1
+
+        if slot is None:
+            # The first page of the book sets the page slot and the sheet geometry
+            slot = forms[0][1][2:]
+            if sheet_size == "auto":
+                sheet, scale = (2 * slot[0] + 2 * margin, slot[1] + 2 * margin), 1.0
+            else:
+                sheet = SHEET_SIZES[sheet_size]
+                scale = min((sheet[0] - 2 * margin) / (2 * slot[0]), (sheet[1] - 2 * margin) / slot[1])
+        spread_left = (sheet[0] - 2 * slot[0] * scale) / 2
+        spread_bottom = (sheet[1] - slot[1] * scale) / 2
+
+        ops = []
+        xobjects = DictionaryObject()
+        for position, index in enumerate(side):
+            if index is None:
+                continue
+            form_ref, (box_left, box_bottom, width, height) = forms.pop(index)
+            # Fit the page in its slot, centred, in case it is not the size of the first page
+            page_scale = scale * min(slot[0] / width, slot[1] / height)
+            x = spread_left + position * slot[0] * scale + (slot[0] * scale - width * page_scale) / 2
+            y = spread_bottom + (slot[1] * scale - height * page_scale) / 2
+            name = f"/P{position}"
+            xobjects[NameObject(name)] = form_ref
+            ops.append(f"q {page_scale:.5f} 0 0 {page_scale:.5f} {x - box_left * page_scale:.2f} "
+                       f"{y - box_bottom * page_scale:.2f} cm {name} Do Q")
+        if crop_marks:
+            ops.append(_crop_marks(spread_left, spread_bottom, 2 * slot[0] * scale, slot[1] * scale, offset, length))
+
+        content = DecodedStreamObject()
+        content.set_data("\n".join(ops).encode('ascii'))
+        sheet_page = PageObject.create_blank_page(None, *sheet)
+        sheet_page[NameObject('/Resources')] = DictionaryObject({NameObject('/XObject'): xobjects})
+        sheet_page[NameObject('/Contents')] = writer._add_object(content)
+        writer.add_page(sheet_page)
+
+    if is_enabled():
+        write_reproducible(writer, output_path)
+    else:
+        temp_path = f"{output_path}.tmp-{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            writer.write(f)
+        os.replace(temp_path, output_path)
+
+    sheets = len(sides) // 2
+    signatures = len(signature_sizes(page_count, signature_pages))
+    print(f"Imposed {page_count} pages ({len(sides) * 2 - page_count} blank) onto {sheets} sheets "
+          f"in {signatures} signature{'s' if signatures != 1 else ''}: {output_path}")
+    return sheets
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Impose a songbook onto two-up booklet signatures for printing.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"],
+                        required=True, help="Songbook version to impose (singer, musician, projection).")
+    parser.add_argument("--source", choices=["merged", "pages"], default="merged",
+                        help="Impose the merged songbook, or the TOC and song page PDFs directly")
+    parser.add_argument("--signature-pages", type=int, default=CONFIG.imposition['signature_pages'],
+                        help="Pages per signature, a multiple of 4; 0 for one saddle-stitched signature")
+    parser.add_argument("--sheet-size", default=CONFIG.imposition['sheet_size'],
+                        help=f"Sheet size: auto (two pages wide) or one of {', '.join(SHEET_SIZES)} (landscape)")
+    parser.add_argument("--crop-marks", action=argparse.BooleanOptionalAction,
+                        default=CONFIG.imposition['crop_marks'], help="Add trim and fold marks")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Directory containing the generated pages; the booklet is saved here too.")
+    parser.add_argument("--output", help="Output PDF path (default: from imposition.output_filename)")
+    args = parser.parse_args()
+
+    from build_final_songbook import merged_songbook_path, songbook_pdf_paths
+
+    output_dir = os.path.abspath(args.output_dir)
+    if args.source == "merged":
+        pdf_paths = [merged_songbook_path(args.version, output_dir)]
+    else:
+        pdf_paths = songbook_pdf_paths(args.version, os.path.join(output_dir, CONFIG.songbook_subdir(args.version)))
+    missing = [path for path in pdf_paths if not os.path.exists(path)]
+    if missing or not pdf_paths:
+        print(f"Error: nothing to impose, missing: {', '.join(missing) or 'song pages'}")
+        sys.exit(1)
+
+    output_path = args.output or os.path.join(
+        output_dir, CONFIG.imposition['output_filename'].format(version=args.version))
+    try:
+        impose(pdf_paths, output_path, args.signature_pages, args.sheet_size, args.crop_marks)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import json
+import argparse
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+from urllib.error import URLError, HTTPError
+
+def parse_song_ids(spec):
+    """Parse a song ID list such as "1-20,25,30" into a list of strings."""
+    song_ids = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            song_ids.extend(str(i) for i in range(int(start), int(end) + 1))
+        elif part:
+            song_ids.append(part)
+    return song_ids
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def fetch(url):
+    """Fetch one URL and return (latency in seconds, status, cache header)."""
+    start = time.perf_counter()
+    try:
+        with urlopen(url) as response:
+            response.read()
+            return time.perf_counter() - start, response.status, response.headers.get("X-Cache", "")
+    except HTTPError as e:
+        return time.perf_counter() - start, e.code, ""
+    except URLError:
+        return time.perf_counter() - start, None, ""
+
+def run_load_test(base_url, song_ids, version, output_format, total_requests, concurrency):
+    urls = [
+        f"{base_url}/song/{song_ids[i % len(song_ids)]}?version={version}&format={output_format}"
+        for i in range(total_requests)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, urls))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, status, _ in results if status == 200)
+    errors = sum(1 for _, status, _ in results if status != 200)
+    cache_hits = sum(1 for _, _, cache in results if cache == "hit")
+
+    print(f"\nRequests: {total_requests} ({concurrency} concurrent), errors: {errors}")
+    print(f"Cache hits: {cache_hits}, misses: {total_requests - errors - cache_hits}")
+    print(f"Total time: {elapsed:.2f} s, throughput: {total_requests / elapsed:.1f} req/s")
+    if latencies:
+        print("Latency (ms): "
+              f"mean {statistics.mean(latencies) * 1000:.1f}, "
+              f"p50 {percentile(latencies, 0.50) * 1000:.1f}, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f}, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}, "
+              f"max {latencies[-1] * 1000:.1f}")
+
+    try:
+        with urlopen(f"{base_url}/stats") as response:
+            print(f"Service stats: {json.loads(response.read())}")
+    except (URLError, HTTPError) as e:
+        print(f"Could not read service stats: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure latency and throughput of the song page render service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="Base URL of the render service")
+    parser.add_argument("--song-ids", default="1-20", help="Song inner IDs to request, e.g. 1-20,25")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"], default="singer",
+                        help="Songbook version to request")
+    parser.add_argument("--format", choices=["html", "pdf"], default="html", help="Output format to request")
+    parser.add_argument("--requests", type=int, default=500, help="Total number of requests to send")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent clients")
+
+    args = parser.parse_args()
+
+    run_load_test(args.url.rstrip('/'), parse_song_ids(args.song_ids), args.version,
+                  args.format, args.requests, args.concurrency)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Diacritic-insensitive full-text search over song titles, authors and lyrics.
+
+The index is an inverted index from accent-folded terms to the songs that
+contain them, weighted by field (a title match counts more than a lyrics
+match) and ranked with BM25. Query words also match as prefixes, so a half
+remembered "jerusal" finds "Jerusálájim". The index is saved as JSON next to
+songs.json and is updated incrementally: only songs whose text changed are
+re-indexed, and only the postings lists of their terms are rewritten.
+"""
+
+import os
+import re
+import json
+import math
+import bisect
+import heapq
+import hashlib
+import argparse
+import time
+import unicodedata
+
+from config import get_config
+from song_catalog import SongRecord, open_catalog
+
+INDEX_FORMAT_VERSION = 2
+FIELD_WEIGHTS = {"title": 3.0, "title_suffix": 2.0, "author": 1.5, "lyrics": 1.0}
+PREFIX_MATCH_FACTOR = 0.8
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+def fold_accents(text):
+    """Lowercase text and strip diacritics, e.g. "Ḥofsi Beárcenu" -> "hofsi bearcenu"."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize(text):
+    """Split text into accent-folded search terms."""
+    return _TOKEN_PATTERN.findall(fold_accents(text or ""))
+
+def _song_text(song):
+    return {field: str(song.get(field) or "") for field in FIELD_WEIGHTS}
+
+def _content_hash(fields):
+    return hashlib.sha1(json.dumps(fields, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _encode_postings(postings):
+    return " ".join(f"{inner_id}:{weight:g}" for inner_id, weight in postings.items())
+
+def _decode_postings(encoded):
+    postings = {}
+    for entry in encoded.split():
+        inner_id, weight = entry.rsplit(":", 1)
+        postings[inner_id] = float(weight)
+    return postings
+
+class LyricsSearchIndex:
+    """
+    Inverted index over the songs of a catalog.
+
+    Postings lists are kept in their compact saved form and only decoded for the
+    terms a query touches, so loading a large index stays cheap.
+    """
+    def __init__(self, docs=None, postings=None, source=None):
+        # inner_id -> {"hash", "length", "id", "title", "author", "terms"}
+        self.docs = docs or {}
+        # term -> encoded postings ("inner_id:weight ...")
+        self.postings = postings or {}
+        # Signature of the catalog file the index was last synchronized with
+        self.source = source
+        self._vocabulary = None
+        self._decoded = {}
+        self._length_norms = None
+
+    @classmethod
+    def load(cls, index_path):
+        """Load a saved index. Returns an empty index if the file does not exist or is outdated."""
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if data.get("format_version") != INDEX_FORMAT_VERSION:
+            print(f"Search index {index_path} has an old format; it will be rebuilt.")
+            return cls()
+        return cls(data["docs"], data["postings"], data.get("source"))
+
+    def save(self, index_path):
+        """Write the index atomically, so concurrent searches never read a partial file."""
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        temp_path = f"{index_path}.tmp-{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "format_version": INDEX_FORMAT_VERSION,
+                "source": self.source,
+                "docs": self.docs,
+                "postings": self.postings,
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, index_path)
+
+    def _postings_for(self, term):
+        postings = self._decoded.get(term)
+        if postings is None:
+            postings = _decode_postings(self.postings.get(term, ""))
+            self._decoded[term] = postings
+        return postings
+
+    def update(self, songs):
+        """
+        Synchronize the index with the given songs (dicts or SongRecords).
+        Only new and changed songs are tokenized; songs that are gone are removed.
+        Returns (added, changed, removed) counts.
+        """
+        wanted = {}
+        for song in songs:
+            song = song.to_dict() if isinstance(song, SongRecord) else song
+            fields = _song_text(song)
+            wanted[str(song['inner_id'])] = (song, fields, _content_hash(fields))
+
+        stale = {inner_id for inner_id, doc in self.docs.items()
+                 if inner_id not in wanted or wanted[inner_id][2] != doc["hash"]}
+        fresh = [inner_id for inner_id, (_, _, content_hash) in wanted.items()
+                 if inner_id not in self.docs or inner_id in stale]
+        removed = sum(1 for inner_id in stale if inner_id not in wanted)
+
+        # Only the postings lists of terms in stale or fresh songs are decoded and written again
+        touched = {}
+
+        def edit(term):
+            term_postings = touched.get(term)
+            if term_postings is None:
+                term_postings = touched[term] = _decode_postings(self.postings.get(term, ""))
+            return term_postings
+
+        for inner_id in stale:
+            for term in self.docs.pop(inner_id)["terms"]:
+                edit(term).pop(inner_id, None)
+
+        for inner_id in fresh:
+            song, fields, content_hash = wanted[inner_id]
+            weights = {}
+            length = 0
+            for field, text in fields.items():
+                tokens = tokenize(text)
+                length += len(tokens)
+                for token in tokens:
+                    weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+            for term, weight in weights.items():
+                edit(term)[inner_id] = weight
+            self.docs[inner_id] = {
+                "hash": content_hash,
+                "length": length,
+                "id": str(song.get('id') or ''),
+                "title": str(song.get('title') or ''),
+                "author": str(song.get('author') or ''),
+                # Lets a removed or changed song be taken out of just its own postings lists
+                "terms": sorted(weights),
+            }
+
+        vocabulary_changed = False
+        for term, term_postings in touched.items():
+            if term_postings:
+                vocabulary_changed = vocabulary_changed or term not in self.postings
+                self.postings[term] = _encode_postings(term_postings)
+            else:
+                vocabulary_changed = True
+                self.postings.pop(term, None)
+            self._decoded.pop(term, None)
+        if vocabulary_changed:
+            self._vocabulary = None
+        if stale or fresh:
+            self._length_norms = None
+
+        return len(fresh) - (len(stale) - removed), len(stale) - removed, removed
+
+    def _expand(self, token):
+        """Return (term, factor) pairs matching a query token exactly or as a prefix."""
+        matches = []
+        if token in self.postings:
+            matches.append((token, 1.0))
+        if len(token) >= MIN_PREFIX_LENGTH:
+            if self._vocabulary is None:
+                self._vocabulary = sorted(self.postings)
+            start = bisect.bisect_left(self._vocabulary, token)
+            for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+                if not term.startswith(token):
+                    break
+                if term != token:
+                    matches.append((term, PREFIX_MATCH_FACTOR))
+        return matches
+
+    def search(self, query, limit=10):
+        """
+        Return up to `limit` songs matching the query, best first.
+        Songs matching every query word rank above songs matching only some of them.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self.docs:
+            return []
+
+        doc_count = len(self.docs)
+        if self._length_norms is None:
+            # The BM25 document length term depends only on the index, so it is computed once
+            average_length = sum(doc["length"] for doc in self.docs.values()) / doc_count or 1.0
+            self._length_norms = {
+                inner_id: BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / average_length)
+                for inner_id, doc in self.docs.items()
+            }
+
+        # Rarest words first: once the songs containing them are known, the
+        # common words only need to be scored for those candidates
+        expansions = [[(term, factor, self._postings_for(term)) for term, factor in self._expand(token)]
+                      for token in tokens]
+        expansions.sort(key=lambda terms: sum(len(postings) for _, _, postings in terms))
+        scores, matched_tokens = self._score(expansions, require_all=True)
+        if not scores:
+            scores, matched_tokens = self._score(expansions, require_all=False)
+
+        ranked = heapq.nsmallest(limit, scores,
+                                 key=lambda inner_id: (-matched_tokens[inner_id], -scores[inner_id], int(inner_id)))
+        results = []
+        for inner_id in ranked:
+            doc = self.docs[inner_id]
+            results.append({
+                "inner_id": inner_id,
+                "id": doc["id"],
+                "title": doc["title"],
+                "author": doc["author"],
+                "score": round(scores[inner_id], 4),
+                "matched_all": matched_tokens[inner_id] == len(tokens),
+            })
+        return results
+
+    def _score(self, expansions, require_all):
+        """BM25 scores per song, summed over query tokens; with require_all, only songs matching every token."""
+        doc_count = len(self.docs)
+        length_norms = self._length_norms
+        scores = {}
+        matched_tokens = {}
+        candidates = None
+        for terms in expansions:
+            token_scores = {}
+            for term, factor, postings in terms:
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                term_factor = factor * idf * (BM25_K1 + 1)
+                if candidates is not None and len(candidates) < len(postings):
+                    entries = ((inner_id, postings[inner_id]) for inner_id in candidates if inner_id in postings)
+                else:
+                    entries = postings.items()
+                for inner_id, weight in entries:
+                    score = term_factor * weight / (weight + length_norms[inner_id])
+                    # A token counts once per song, by its best matching term
+                    if score > token_scores.get(inner_id, 0.0):
+                        token_scores[inner_id] = score
+            if require_all:
+                if candidates is not None:
+                    token_scores = {inner_id: score for inner_id, score in token_scores.items() if inner_id in candidates}
+                candidates = set(token_scores)
+                if not candidates:
+                    return {}, {}
+            for inner_id, score in token_scores.items():
+                scores[inner_id] = scores.get(inner_id, 0.0) + score
+                matched_tokens[inner_id] = matched_tokens.get(inner_id, 0) + 1
+        if require_all:
+            scores = {inner_id: score for inner_id, score in scores.items() if inner_id in candidates}
+        return scores, matched_tokens
+
+def _source_signature(catalog_path):
+    stat = os.stat(catalog_path)
+    return [os.path.abspath(catalog_path), stat.st_mtime_ns, stat.st_size]
+
+def update_search_index(catalog_path, index_path, force=False):
+    """
+    Bring the saved index up to date with the catalog, re-indexing only changed songs.
+    Nothing is read from the catalog if it has not changed since the last update.
+    """
+    index = LyricsSearchIndex.load(index_path)
+    signature = _source_signature(catalog_path)
+    if index.source == signature and not force:
+        return index
+
+    added, changed, removed = index.update(open_catalog(catalog_path))
+    index.source = signature
+    index.save(index_path)
+    print(f"Search index updated: {added} added, {changed} changed, {removed} removed ({len(index.docs)} songs).")
+    return index
+
+if __name__ == "__main__":
+    CONFIG = get_config()
+    parser = argparse.ArgumentParser(description="Search songs by title, author or a lyric fragment, ignoring accents.")
+    parser.add_argument("query", nargs="?", help="Words to search for, e.g. \"kol od balevav\"")
+    parser.add_argument("--limit", type=int, default=10, help="Maximum number of results")
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json,
+                        help="Path to the song catalog (songs.json, .jsonl or SQLite)")
+    parser.add_argument("--index-file", default=CONFIG.paths.search_index,
+                        help="Path to the saved search index")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from scratch")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.index_file):
+        os.remove(args.index_file)
+    search_index = update_search_index(args.json_file, args.index_file)
+
+    if args.query:
+        start = time.perf_counter()
+        results = search_index.search(args.query, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            print(f"{len(results)} result(s) for '{args.query}' in {elapsed_ms:.1f} ms:")
+            for result in results:
+                marker = "" if result["matched_all"] else "  (partial match)"
+                author = f" - {result['author']}" if result['author'] else ""
+                print(f"  [{result['inner_id']:>4}] {result['id']:<6} {result['title']}{author}{marker}")
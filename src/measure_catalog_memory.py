@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import gc
+import json
+import random
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from song_catalog import open_catalog, write_json_lines
+
+WORDS = ["ávir", "hárim", "calul", "kájájin", "vereáḥ", "oránim", "niszá", "beruáḥ", "jerusálájim",
+         "záháv", "nehoset", "kinor", "hátikvá", "ḥofsi", "beárcenu", "sálom", "lájla", "tov"]
+CHORDS = ["Am", "Dm", "E7", "C", "G", "F", "H7", "Bb"]
+
+def synthetic_song(inner_id, rng):
+    """Build a song with realistic field sizes (about 30 lines of lyrics)."""
+    lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))) for _ in range(30)]
+    chord_lines = []
+    for line in lines:
+        chord_lines.append("   ".join(rng.choice(CHORDS) for _ in range(rng.randint(2, 4))))
+        chord_lines.append(line)
+    return {
+        "id": f"S{inner_id:05d}",
+        "inner_id": str(inner_id),
+        "original_id": "",
+        "title": " ".join(rng.choice(WORDS) for _ in range(3)).capitalize(),
+        "author": "Szerző " + str(inner_id % 997),
+        "lyrics": "\n".join(lines),
+        "lyrics_with_chords": "\n".join(chord_lines),
+        "category": f"Kategória {inner_id % 12}",
+        "youtube": f"https://www.youtube.com/watch?v=synthetic{inner_id}",
+        "explicit_content": inner_id % 50 == 0,
+        "skip_toc": False,
+        "title_suffix": "",
+    }
+
+def measure(label, load):
+    """Report the memory held by the loaded catalog and the peak while loading it."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    catalog = load()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<32} resident {current / 2**20:8.1f} MiB   peak {peak / 2**20:8.1f} MiB   load {elapsed:6.2f} s")
+    return catalog
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare memory use of plain dicts and SongCatalog on a synthetic catalog.")
+    parser.add_argument("--songs", type=int, default=50000, help="Number of synthetic songs to generate")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic catalog")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        songs = [synthetic_song(i, rng) for i in range(1, args.songs + 1)]
+        json_path = os.path.join(work_dir, "songs.json")
+        jsonl_path = os.path.join(work_dir, "songs.jsonl")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(songs, f, ensure_ascii=False, indent=2)
+        write_json_lines(songs, jsonl_path)
+        del songs
+        print(f"Synthetic catalog: {args.songs} songs, "
+              f"{os.path.getsize(json_path) / 2**20:.1f} MiB JSON, {os.path.getsize(jsonl_path) / 2**20:.1f} MiB JSONL\n")
+
+        def load_dicts():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        dicts = measure("json.load (list of dicts)", load_dicts)
+        del dicts
+        measure("SongCatalog (songs.json)", lambda: open_catalog(json_path))
+        catalog = measure("SongCatalog (songs.jsonl)", lambda: open_catalog(jsonl_path))
+
+        start = time.perf_counter()
+        sample = [catalog.get(str(rng.randint(1, args.songs))) for _ in range(1000)]
+        total_chars = sum(len(song.lyrics_with_chords) for song in sample)
+        elapsed = time.perf_counter() - start
+        print(f"\nLazy lyrics: {len(sample)} random songs ({total_chars} chars) read in {elapsed * 1000:.1f} ms")
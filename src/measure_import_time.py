@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+import statistics
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_POINTS = [
+    "generate_songbook_page",
+    "generate_toc",
+    "generate_json",
+    "generate_full_songbook",
+    "build_final_songbook",
+    "find_youtube_links",
+    "render_service",
+]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure_import(module_name):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Returns the cumulative import time in microseconds and the slowest direct dependencies.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    dependencies = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 1 and name == module_name:
+            total_us = cumulative_us
+        elif indent == 3:
+            # Modules imported directly by the entry point (importtime indents by two per level)
+            dependencies.append((cumulative_us, name))
+    dependencies.sort(reverse=True)
+    return total_us, dependencies[:3]
+
+def measure_cold_start(module_name, runs):
+    """
+    Median wall-clock time of starting a fresh interpreter that imports the entry point.
+    The scripts are imported rather than run, since some of them (generate_json) have no --help.
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module_name}"], cwd=SRC_DIR,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report import time and cold-start time of every entry point.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to time per entry point")
+    args = parser.parse_args()
+
+    print(f"{'Entry point':<26} {'import (ms)':>12} {'startup (ms)':>12}  slowest imports")
+    for module_name in ENTRY_POINTS:
+        try:
+            total_us, slowest = measure_import(module_name)
+        except RuntimeError as e:
+            print(f"{module_name:<26} {'error':>12} {'':>12}  {e}")
+            continue
+        cold_start = measure_cold_start(module_name, args.runs)
+        slowest_text = ", ".join(f"{name} {us / 1000:.1f}ms" for us, name in slowest)
+        print(f"{module_name:<26} {total_us / 1000:>12.1f} {cold_start * 1000:>12.1f}  {slowest_text}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Check that the shards of a sharded build are all present and complete.
+
+Run after every `generate_full_songbook.py --shard k/n` process has finished and
+their pages are in one output directory. The manifests are compared with the
+assignment recomputed from the catalog, and every page is checked against the
+hash its shard recorded. With --build, build_final_songbook.py runs when
+everything checks out.
+"""
+
+import os
+import re
+import sys
+import argparse
+
+from config import get_config, ConfigError
+from song_catalog import open_catalog
+import sharding
+
+# Load configuration
+try:
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+def _manifest_pattern():
+    template = re.escape(CONFIG.file_names['shard_manifest'])
+    template = template.replace(re.escape("{shard}"), r"(?P<shard>\d+)").replace(re.escape("{shards}"), r"(?P<shards>\d+)")
+    return re.compile(template + "$")
+
+def find_manifests(version_dir):
+    """Return {(shard, shards): path} for the shard manifests in a version directory."""
+    pattern = _manifest_pattern()
+    manifests = {}
+    for file_name in os.listdir(version_dir):
+        match = pattern.match(file_name)
+        if match:
+            manifests[(int(match.group("shard")), int(match.group("shards")))] = os.path.join(version_dir, file_name)
+    return manifests
+
+def validate_shards(version, output_dir, songs_json, shards=None):
+    """
+    Validate the shard manifests of a version against the catalog.
+    Returns a list of problems; an empty list means the pages are ready to merge.
+    """
+    version_dir = os.path.join(output_dir, CONFIG.songbook_subdir(version))
+    if not os.path.isdir(version_dir):
+        return [f"Version directory {version_dir} not found"]
+
+    found = find_manifests(version_dir)
+    if not found:
+        return [f"No shard manifests found in {version_dir}"]
+    shard_counts = {count for _, count in found}
+    if shards is None:
+        if len(shard_counts) > 1:
+            return [f"Manifests from builds with different shard counts: {sorted(shard_counts)}. "
+                    "Remove the stale ones or pass --shards."]
+        shards = shard_counts.pop()
+
+    problems = []
+    manifests = {}
+    for shard in range(1, shards + 1):
+        path = found.get((shard, shards))
+        if path is None:
+            problems.append(f"Shard {shard}/{shards}: manifest missing")
+            continue
+        try:
+            manifests[shard] = sharding.read_shard_manifest(path)
+        except (OSError, ValueError) as e:
+            problems.append(f"Shard {shard}/{shards}: unreadable manifest: {e}")
+    if problems:
+        return problems
+
+    songs = list(open_catalog(songs_json))
+    fingerprint = sharding.catalog_fingerprint(songs_json)
+    strategies = {manifest["strategy"] for manifest in manifests.values()}
+    if len(strategies) > 1:
+        return [f"Shards used different strategies: {sorted(strategies)}"]
+    assignment = sharding.assign_shards(songs, shards, version, strategies.pop())
+
+    for shard, manifest in manifests.items():
+        label = f"Shard {shard}/{shards}"
+        if manifest["version"] != version:
+            problems.append(f"{label}: built for version {manifest['version']}")
+        if manifest["catalog_sha256"] != fingerprint:
+            problems.append(f"{label}: built from a different catalog than {songs_json}")
+        if manifest["status"] != "complete":
+            problems.append(f"{label}: status is '{manifest['status']}'"
+                            + (f", failed songs: {', '.join(manifest.get('failed', []))}" if manifest.get('failed') else ""))
+
+        expected = {inner_id for inner_id, assigned in assignment.items() if assigned == shard}
+        assigned = set(manifest["assigned"])
+        if assigned != expected:
+            problems.append(f"{label}: assigned {len(assigned)} songs, expected {len(expected)} "
+                            f"(missing {len(expected - assigned)}, unexpected {len(assigned - expected)})")
+
+        for inner_id, page in manifest.get("completed", {}).items():
+            page_path = os.path.join(version_dir, page["file"])
+            if not os.path.exists(page_path):
+                problems.append(f"{label}: page {page['file']} is missing")
+            elif sharding.file_sha256(page_path) != page["sha256"]:
+                problems.append(f"{label}: page {page['file']} changed after the shard recorded it")
+
+    if version != "projection":
+        tocs = manifests[1].get("tocs", {})
+        for toc_key in ("toc_pdf_ordered", "toc_pdf_alphabetical"):
+            toc_file = CONFIG.file_names[toc_key]
+            toc_path = os.path.join(version_dir, toc_file)
+            if toc_file not in tocs or not os.path.exists(toc_path):
+                problems.append(f"Shard 1/{shards}: table of contents {toc_file} is missing")
+            elif sharding.file_sha256(toc_path) != tocs[toc_file]:
+                problems.append(f"Shard 1/{shards}: table of contents {toc_file} changed after the shard recorded it")
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the shards of a sharded songbook build and optionally merge them.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"],
+                        required=True, help="Songbook version to validate (singer, musician, projection).")
+    parser.add_argument("--shards", type=int, help="Expected number of shards (default: taken from the manifests)")
+    parser.add_argument("--songs-json", default=CONFIG.paths.songs_json,
+                        help="Path to the song catalog the shards were built from")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Output directory the shards wrote to")
+    parser.add_argument("--build", action="store_true",
+                        help="Run build_final_songbook.py when all shards are complete")
+    args = parser.parse_args()
+
+    problems = validate_shards(args.version, os.path.abspath(args.output_dir), args.songs_json, args.shards)
+    if problems:
+        print(f"Shards for version {args.version} are not ready to merge:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print(f"All shards for version {args.version} are present and complete.")
+
+    if args.build:
+        from build_final_songbook import build_final_songbook
+        build_final_songbook(args.version, os.path.abspath(args.output_dir))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Open a merged songbook at a song.
+
+The page index that build_final_songbook.py writes next to the merged PDF maps
+every song to its first page, so a song is found without opening the PDF. By
+default the book is opened in the system's PDF viewer with a #page=N fragment,
+which browsers and most viewers honour. --viewer runs a command of your own
+instead, e.g. --viewer "evince --page-index={page} {file}" on the projection
+laptop, and --print-page only prints the page number for use in other scripts.
+"""
+
+import os
+import sys
+import shlex
+import argparse
+import subprocess
+import webbrowser
+
+from config import get_config, ConfigError
+
+# Load configuration
+try:
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+def find_song(index, song_id=None, inner_id=None):
+    """Return (inner_id, song entry) from a page index by display ID (e.g. H01) or inner ID."""
+    songs = index.get("songs", {})
+    if inner_id is not None:
+        song = songs.get(str(inner_id))
+        return (str(inner_id), song) if song else (None, None)
+    for key, song in songs.items():
+        if song["id"] is not None and song["id"].casefold() == song_id.casefold():
+            return key, song
+    return None, None
+
+def open_at_page(pdf_path, page, viewer=None):
+    """Open pdf_path at a 1-based page, with the given viewer command or the default viewer."""
+    if viewer:
+        command = [part.format(file=pdf_path, page=page) for part in shlex.split(viewer)]
+        subprocess.Popen(command)
+    else:
+        webbrowser.open(f"file://{os.path.abspath(pdf_path)}#page={page}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open a merged songbook at the first page of a song.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"],
+                        required=True, help="Songbook version to open (singer, musician, projection).")
+    song_group = parser.add_mutually_exclusive_group(required=True)
+    song_group.add_argument("--id", help="Song ID as shown in the TOC, e.g. H01")
+    song_group.add_argument("--inner-id", help="Inner ID of the song, as in song_<inner_id>.pdf")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Directory containing the merged songbook")
+    parser.add_argument("--viewer", help="Viewer command, with {file} and {page} placeholders")
+    parser.add_argument("--print-page", action="store_true", help="Only print the page number")
+    args = parser.parse_args()
+
+    from build_final_songbook import merged_songbook_path
+    from page_index import page_index_path, read_page_index
+
+    pdf_path = merged_songbook_path(args.version, os.path.abspath(args.output_dir))
+    try:
+        index = read_page_index(page_index_path(pdf_path))
+    except FileNotFoundError:
+        print(f"Error: no page index next to {pdf_path}. Run build_final_songbook.py first.")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    inner_id, song = find_song(index, args.id, args.inner_id)
+    if song is None:
+        print(f"Error: song {args.id or args.inner_id} is not in the {args.version} songbook.")
+        sys.exit(1)
+
+    if args.print_page:
+        print(song["start_page"])
+    else:
+        pages = song["page_count"]
+        print(f"{song['id'] or inner_id} {song['title'] or ''}: page {song['start_page']} "
+              f"({pages} page{'s' if pages != 1 else ''}) of {pdf_path}")
+        open_at_page(pdf_path, song["start_page"], args.viewer)
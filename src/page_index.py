@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Page index of a merged songbook: which source file and song each page comes
+from, and a fingerprint of the page's content.
+
+build_final_songbook.py writes the index next to the merged PDF, and keeps the
+index of the previous build, so songbook_diff.py can tell which physical pages
+changed without opening the old book. The index also maps every song to its
+first page and page count, which the TOC page numbers and open_song.py use.
+
+A page fingerprint is a SHA-256 of the page size and the raw (still compressed)
+bytes of its content streams and of the images and forms it draws. Nothing is
+decoded or parsed, so fingerprinting a whole book is fast. The fingerprint does
+not include the PDF's creation date or /ID, so it stays the same when an
+unchanged page is rendered again.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+from config import get_config
+
+CONFIG = get_config()
+
+PAGE_INDEX_FORMAT_VERSION = 1
+# TOC links are rendered with this URL followed by the song's inner_id; the merge
+# turns them into links to the song's page in the merged songbook
+TOC_LINK_PREFIX = "https://songbook.invalid/song/"
+
+def _stream_bytes(stream):
+    """The stream's stored bytes: compressed data for encoded streams, as-is otherwise."""
+    return stream._data if isinstance(stream._data, bytes) else str(stream._data).encode('utf-8')
+
+def page_fingerprint(page):
+    """SHA-256 of a PyPDF2 page's size, content streams and XObjects (images, forms)."""
+    from PyPDF2.generic import ArrayObject
+
+    digest = hashlib.sha256()
+    box = page.mediabox
+    digest.update(f"{float(box.width):.2f}x{float(box.height):.2f}".encode('ascii'))
+
+    contents = page.get('/Contents')
+    contents = contents.get_object() if contents is not None else None
+    parts = contents if isinstance(contents, ArrayObject) else ([contents] if contents is not None else [])
+    for part in parts:
+        digest.update(_stream_bytes(part.get_object()))
+
+    resources = page.get('/Resources')
+    xobjects = resources.get_object().get('/XObject') if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode('utf-8'))
+            digest.update(_stream_bytes(xobjects[name].get_object()))
+    return digest.hexdigest()
+
+def describe_source(pdf_path):
+    """Return (kind, inner_id) of a songbook source file: ("song", "12") or ("toc", None)."""
+    file_name = os.path.basename(pdf_path)
+    prefix = re.escape(CONFIG.file_names['song_page_prefix'])
+    suffix = re.escape(CONFIG.file_names['song_page_suffix'])
+    match = re.match(rf"{prefix}(\d+){suffix}$", file_name, re.IGNORECASE)
+    if match:
+        return "song", match.group(1)
+    return "toc", None
+
+def index_entries(pdf_path, reader, first_page):
+    """Page index entries of one source file whose first page is `first_page` (1-based) in the book."""
+    kind, inner_id = describe_source(pdf_path)
+    return [{
+        "page": first_page + source_page,
+        "source": os.path.basename(pdf_path),
+        "source_page": source_page + 1,
+        "kind": kind,
+        "inner_id": inner_id,
+        "sha256": page_fingerprint(page),
+    } for source_page, page in enumerate(reader.pages)]
+
+def song_pages(entries):
+    """{inner_id: (start_page, page_count)} from page index entries."""
+    pages = {}
+    for entry in entries:
+        if entry["kind"] == "song":
+            start, count = pages.get(entry["inner_id"], (entry["page"], 0))
+            pages[entry["inner_id"]] = (start, count + 1)
+    return pages
+
+def page_index_path(merged_pdf_path, previous=False):
+    """Path of the page index of a merged songbook (or of the build before it)."""
+    base, _ = os.path.splitext(merged_pdf_path)
+    return f"{base}.pages.previous.json" if previous else f"{base}.pages.json"
+
+def write_page_index(merged_pdf_path, version, entries, song_info=None):
+    """
+    Write the page index of a merged songbook atomically. song_info ({inner_id: song})
+    adds the songs' IDs and titles. An existing index is kept as the previous build's
+    index, unless the pages did not change at all.
+    """
+    path = page_index_path(merged_pdf_path)
+    song_info = song_info or {}
+    songs = {}
+    for inner_id, (start_page, page_count) in song_pages(entries).items():
+        song = song_info.get(inner_id)
+        songs[inner_id] = {"id": str(song['id']) if song else None, "title": song['title'] if song else None,
+                           "start_page": start_page, "page_count": page_count}
+    index = {"format_version": PAGE_INDEX_FORMAT_VERSION, "version": version,
+             "merged_pdf": os.path.basename(merged_pdf_path), "page_count": len(entries),
+             "songs": songs, "pages": entries}
+    if os.path.exists(path):
+        try:
+            unchanged = read_page_index(path)["pages"] == entries
+        except (OSError, ValueError):
+            unchanged = False
+        if not unchanged:
+            os.replace(path, page_index_path(merged_pdf_path, previous=True))
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, path)
+    return path
+
+def read_page_index(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get("format_version") != PAGE_INDEX_FORMAT_VERSION:
+        raise ValueError(f"{path} has page index format {index.get('format_version')}, "
+                         f"expected {PAGE_INDEX_FORMAT_VERSION}")
+    return index
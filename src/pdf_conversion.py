@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Running wkhtmltopdf (and other child processes) without letting one bad run stall a build.
+
+Every run gets a timeout. A run that hangs is killed together with any processes
+it started, and failed runs are retried with exponential backoff as configured in
+the "conversion" section of config.json. Child output is streamed line by line
+instead of being buffered, and the last lines are kept for failure reports.
+
+wkhtmltopdf reads the HTML from its stdin and writes the PDF to its stdout, so
+a conversion needs no temporary files and the PDF arrives in memory.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+import threading
+from collections import deque
+
+from config import get_config
+
+CONFIG = get_config()
+
+class ConversionError(RuntimeError):
+    """A conversion failed on every attempt. `details` describes the last attempt."""
+    def __init__(self, message, details):
+        super().__init__(message)
+        self.details = details
+
+def _kill_process_tree(process):
+    """Kill a child started by run_streaming and whatever it spawned."""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+# A new session/process group lets a timeout kill the whole tree, not just the direct child
+_POPEN_OPTIONS = {"start_new_session": True} if os.name == "posix" else {
+    "creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+def _start_watchdog(process, timeout):
+    """Kill process after timeout seconds. Returns (timer or None, event set on timeout)."""
+    timed_out = threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        _kill_process_tree(process)
+
+    watchdog = threading.Timer(timeout, on_timeout) if timeout else None
+    if watchdog:
+        watchdog.daemon = True
+        watchdog.start()
+    return watchdog, timed_out
+
+def _stream_lines(stream, prefix, tail):
+    for line in stream:
+        line = line.rstrip("\n")
+        tail.append(line)
+        print(f"{prefix}{line}", flush=True)
+
+def run_streaming(cmd, timeout=None, prefix="", tail_lines=20):
+    """
+    Run cmd, printing its output as it arrives, and kill it if it runs longer than timeout seconds.
+    Returns a dict with "returncode", "timed_out", "seconds" and "output_tail" (the last lines of output).
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                               text=True, encoding='utf-8', errors='replace', bufsize=1, **_POPEN_OPTIONS)
+    watchdog, timed_out = _start_watchdog(process, timeout)
+    tail = deque(maxlen=tail_lines)
+    try:
+        _stream_lines(process.stdout, prefix, tail)
+        process.wait()
+    except BaseException:
+        # Never leave a child running behind an interrupted build
+        _kill_process_tree(process)
+        process.wait()
+        raise
+    finally:
+        if watchdog:
+            watchdog.cancel()
+        process.stdout.close()
+    return {
+        "returncode": process.returncode,
+        "timed_out": timed_out.is_set(),
+        "seconds": round(time.monotonic() - start, 3),
+        "output_tail": list(tail),
+    }
+
+def run_piped(cmd, input_data, timeout=None, prefix="", tail_lines=20):
+    """
+    Run cmd with input_data (bytes) on its stdin and collect its stdout in memory, printing
+    its stderr as it arrives. Killed after timeout seconds like run_streaming.
+    Returns the run_streaming dict plus "stdout" (bytes).
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               **_POPEN_OPTIONS)
+    watchdog, timed_out = _start_watchdog(process, timeout)
+    chunks = []
+
+    def feed():
+        try:
+            process.stdin.write(input_data)
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            # The child exited (or was killed) without reading everything; its exit code tells why
+            pass
+
+    def collect():
+        chunks.extend(iter(lambda: process.stdout.read(65536), b""))
+
+    threads = [threading.Thread(target=feed, daemon=True), threading.Thread(target=collect, daemon=True)]
+    for thread in threads:
+        thread.start()
+    tail = deque(maxlen=tail_lines)
+    try:
+        _stream_lines(io.TextIOWrapper(process.stderr, encoding='utf-8', errors='replace'), prefix, tail)
+        for thread in threads:
+            thread.join()
+        process.wait()
+    except BaseException:
+        _kill_process_tree(process)
+        process.wait()
+        raise
+    finally:
+        if watchdog:
+            watchdog.cancel()
+        for stream in (process.stdin, process.stdout, process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+    return {
+        "returncode": process.returncode,
+        "timed_out": timed_out.is_set(),
+        "seconds": round(time.monotonic() - start, 3),
+        "output_tail": list(tail),
+        "stdout": b"".join(chunks),
+    }
+
+def is_complete_pdf(data, returncode):
+    """
+    Whether a wkhtmltopdf run produced a usable PDF. Exit code 0 with PDF output is a
+    success. wkhtmltopdf also exits with 1 for some non-fatal asset errors (e.g. a missing
+    image) but still writes the whole PDF, so exit code 1 is only accepted if the output
+    ends with %%EOF and parses. Any other exit code is a failure, whatever was written.
+    """
+    if returncode == 0:
+        return data.startswith(b"%PDF")
+    if returncode != 1 or not data.startswith(b"%PDF") or not data.rstrip().endswith(b"%%EOF"):
+        return False
+    from PyPDF2 import PdfReader
+    try:
+        return len(PdfReader(io.BytesIO(data)).pages) > 0
+    except Exception:
+        # A damaged PDF can fail to parse in many ways; none of them is usable
+        return False
+
+def convert_html(html_content, page_options, description):
+    """
+    Convert HTML to PDF bytes with wkhtmltopdf, piping the HTML in and the PDF out, with the
+    configured timeout and retries. description names the page in messages. Raises
+    ConversionError if every attempt fails or wkhtmltopdf cannot be started.
+    """
+    settings = CONFIG.conversion
+    cmd = [CONFIG.wkhtmltopdf_path()] + list(page_options) + ["-", "-"]
+    html_bytes = html_content.encode('utf-8')
+    attempts = 1 + settings['retries']
+    delay = settings['retry_backoff_seconds']
+    for attempt in range(1, attempts + 1):
+        try:
+            result = run_piped(cmd, html_bytes, timeout=settings['timeout_seconds'], prefix="  wkhtmltopdf: ")
+        except OSError as e:
+            # A missing or non-executable wkhtmltopdf will not get better by retrying
+            raise ConversionError(f"wkhtmltopdf could not be started for {description}: {e}",
+                                  {"returncode": None, "timed_out": False, "seconds": 0, "output_tail": [str(e)],
+                                   "attempts": attempt, "reason": str(e)})
+        pdf = result.pop("stdout")
+        if not result["timed_out"] and is_complete_pdf(pdf, result["returncode"]):
+            return pdf
+
+        if result["timed_out"]:
+            reason = f"timed out after {settings['timeout_seconds']} s"
+        elif result["returncode"] not in (0, 1):
+            reason = f"exited with code {result['returncode']}"
+        elif result["returncode"] == 1:
+            reason = "exited with code 1 and an incomplete PDF"
+        else:
+            reason = "produced no PDF"
+        result.update({"attempts": attempt, "reason": reason})
+        if attempt == attempts:
+            raise ConversionError(f"wkhtmltopdf {reason} for {description} (attempt {attempt}/{attempts})", result)
+        print(f"wkhtmltopdf {reason} (attempt {attempt}/{attempts}); retrying in {delay:g} s...")
+        time.sleep(delay)
+        delay *= settings['retry_backoff_factor']
+
+def write_pdf(data, output_path):
+    """Write PDF bytes to output_path atomically, creating its directory."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, output_path)
+
+def write_failure_report(report_path, version, failures):
+    """Write the songs that failed to build as JSON, so they can be inspected or re-run."""
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    temp_path = f"{report_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "failed_count": len(failures),
+            "failures": failures,
+        }, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, report_path)
+
+if __name__ == "__main__":
+    # Run any command under the watchdog, e.g. to check a wkhtmltopdf installation:
+    #   python src/pdf_conversion.py wkhtmltopdf --version
+    if len(sys.argv) < 2:
+        print("Usage: pdf_conversion.py COMMAND [ARGS...]")
+        sys.exit(2)
+    outcome = run_streaming(sys.argv[1:], timeout=CONFIG.conversion['timeout_seconds'])
+    print(json.dumps(outcome, indent=2))
+    sys.exit(0 if outcome["returncode"] == 0 and not outcome["timed_out"] else 1)
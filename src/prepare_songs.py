@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+The "prepare" stage: render-ready song fields, computed once and cached.
+
+For each song and edition, the fields a page derives from the lyrics (lyrics
+HTML with line breaks and chord markup, column split, line-count CSS class and
+the singer QR code) are computed by generate_songbook_page.derive_page_fields
+and stored in the SQLite file data/prepared_songs.db. Entries are keyed by a
+hash of the song's lyrics, chords and YouTube link, the edition, the config
+values the derivation depends on and PREPARE_FORMAT_VERSION. A changed song or
+setting therefore simply misses the cache and old entries are never served.
+
+`generate_full_songbook.py` runs this stage before the page loop; the page
+script and the render service read from the same cache. The key column is
+indexed, so a page script reads its one entry without parsing the others.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+from config import get_config
+from song_catalog import SongRecord, open_catalog
+
+CONFIG = get_config()
+
+# Bump when derive_page_fields changes what it produces
+PREPARE_FORMAT_VERSION = 1
+# Bump when the layout of the cache database changes
+CACHE_SCHEMA_VERSION = 1
+# How long save() waits for another process (e.g. another shard) to finish writing the cache
+SAVE_TIMEOUT_SECONDS = 60
+VERSIONS = ("singer", "musician", "projection")
+_SOURCE_FIELDS = ("lyrics", "lyrics_with_chords", "youtube")
+
+def _settings_hash():
+    """Hash of the configuration the derived fields depend on."""
+    settings = {
+        "format_version": PREPARE_FORMAT_VERSION,
+        "lyrics": [CONFIG.lyrics.small_lines_threshold, CONFIG.lyrics.large_lines_threshold,
+                   CONFIG.lyrics.column_break_threshold],
+        "guitar_chords": list(CONFIG.guitar_chords),
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def prepared_key(song, version, settings_hash=None):
+    """Cache key of a song's prepared fields for one edition."""
+    source = [str(song.get(field) or "") for field in _SOURCE_FIELDS]
+    payload = json.dumps([settings_hash or _settings_hash(), version, source], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class PreparedSongs:
+    """
+    The prepared-fields cache. `get()` returns cached fields or derives them, so it can be
+    used by a long-running process (the render service) as well as by the batch build.
+    Entries are read from the cache file one at a time, as they are needed; derived
+    entries are kept in memory until save(). Read connections are per thread.
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        # Entries read or derived by this process; the derived ones are written by save()
+        self.entries = {}
+        self._derived = set()
+        self.hits = 0
+        self.misses = 0
+        self._settings_hash = _settings_hash()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def load(cls, cache_path):
+        """Open the cache file. A missing or outdated file gives an empty cache; nothing is read yet."""
+        return cls(cache_path)
+
+    def _connection(self):
+        """A read-only connection of this thread, or None if there is no usable cache file."""
+        if not hasattr(self._local, "connection"):
+            connection = None
+            if os.path.exists(self.cache_path):
+                uri = "file:" + os.path.abspath(self.cache_path).replace(os.sep, '/') + "?mode=ro"
+                connection = sqlite3.connect(uri, uri=True)
+                try:
+                    version = connection.execute("PRAGMA user_version").fetchone()[0]
+                except sqlite3.DatabaseError:
+                    # e.g. the JSON file older versions wrote
+                    version = None
+                if version != CACHE_SCHEMA_VERSION:
+                    connection.close()
+                    connection = None
+            self._local.connection = connection
+        return self._local.connection
+
+    def _read(self, key):
+        connection = self._connection()
+        if connection is None:
+            return None
+        row = connection.execute("SELECT fields FROM prepared WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self):
+        connection = self._connection()
+        return connection.execute("SELECT COUNT(*) FROM prepared").fetchone()[0] if connection else 0
+
+    def save(self, keep_keys=None):
+        """
+        Write the entries derived since the cache was opened, in one transaction. With keep_keys,
+        entries not in it (songs that changed or were removed) are dropped from the file.
+        """
+        with self._lock:
+            rows = [(key, json.dumps(self.entries[key], ensure_ascii=False)) for key in self._derived]
+            self._derived = set()
+        # This thread reads the file again as saved
+        reader = getattr(self._local, "connection", None)
+        if reader is not None:
+            reader.close()
+        self._local.__dict__.pop("connection", None)
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        # Shards of a build save into the same file: writers take turns, and the file is never
+        # deleted, since another process may have it open
+        connection = sqlite3.connect(self.cache_path, timeout=SAVE_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+            except sqlite3.DatabaseError as e:
+                if isinstance(e, sqlite3.OperationalError):
+                    raise
+                # e.g. the JSON file older versions wrote; --rebuild replaces it
+                print(f"Warning: {self.cache_path} is not a prepared-fields cache, so it was not updated. "
+                      "Run prepare_songs.py --rebuild to replace it.")
+                return
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != CACHE_SCHEMA_VERSION:
+                # A new or outdated cache is started again, in the same transaction as the writes
+                connection.execute("DROP TABLE IF EXISTS prepared")
+                connection.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+            connection.execute("CREATE TABLE IF NOT EXISTS prepared (key TEXT PRIMARY KEY, fields TEXT NOT NULL)")
+            connection.executemany("INSERT OR REPLACE INTO prepared VALUES (?, ?)", rows)
+            if keep_keys is not None:
+                connection.execute("CREATE TEMP TABLE keep (key TEXT PRIMARY KEY)")
+                connection.executemany("INSERT OR IGNORE INTO keep VALUES (?)", ((key,) for key in keep_keys))
+                connection.execute("DELETE FROM prepared WHERE key NOT IN (SELECT key FROM keep)")
+            connection.execute("COMMIT")
+        finally:
+            # Closing without COMMIT rolls the transaction back
+            connection.close()
+
+    def key(self, song, version):
+        return prepared_key(song, version, self._settings_hash)
+
+    def get(self, song, version):
+        """Return the prepared fields of a song (dict or SongRecord) for an edition."""
+        if isinstance(song, SongRecord):
+            # Read the lyrics once instead of once per field
+            song = song.to_dict()
+        key = self.key(song, version)
+        fields = self.entries.get(key)
+        if fields is None:
+            fields = self._read(key)
+            if fields is not None:
+                with self._lock:
+                    self.entries[key] = fields
+        if fields is not None:
+            self.hits += 1
+            return fields
+
+        from generate_songbook_page import derive_page_fields
+        self.misses += 1
+        fields = derive_page_fields(song, version)
+        with self._lock:
+            self.entries[key] = fields
+            self._derived.add(key)
+        return fields
+
+def prepare_catalog(catalog_path, cache_path=None, versions=VERSIONS, songs=None):
+    """
+    Bring the prepared-fields cache up to date for every song and edition of a catalog.
+    Only songs whose content or relevant settings changed are derived again.
+    With songs (records of the catalog, e.g. the songs of one shard), only those are prepared.
+    """
+    cache_path = cache_path or CONFIG.paths.prepared_cache
+    prepared = PreparedSongs.load(cache_path)
+    keep_keys = set()
+    for song in open_catalog(catalog_path) if songs is None else songs:
+        # One read of the lyrics per song, shared by all editions
+        song = song.to_dict()
+        for version in versions:
+            prepared.get(song, version)
+            keep_keys.add(prepared.key(song, version))
+    # Stale entries are only dropped when every song and edition was prepared, so
+    # preparing one edition or one shard does not evict the others
+    prepared.save(keep_keys if songs is None and set(versions) == set(VERSIONS) else None)
+    print(f"Prepared {prepared.misses} song pages, reused {prepared.hits} ({len(prepared)} cached).")
+    return prepared
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the render-ready fields of every song and edition.")
+    parser.add_argument("--version", choices=VERSIONS, action="append", dest="versions",
+                        help="Edition to prepare (repeatable; default: all)")
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json,
+                        help="Path to the song catalog (songs.json, .jsonl or SQLite)")
+    parser.add_argument("--cache-file", default=CONFIG.paths.prepared_cache,
+                        help="Path to the prepared-fields cache")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the cache and prepare everything again")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.cache_file):
+        os.remove(args.cache_file)
+    prepare_catalog(args.json_file, args.cache_file, tuple(args.versions or VERSIONS))
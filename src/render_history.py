@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Render-time history and longest-first scheduling of song pages.
+
+generate_full_songbook.py records how long each song page took to render, per
+edition, in data/render_history.json. The next build predicts every page's
+duration from this history and starts the longest pages first (longest
+processing time first), so a parallel build does not end with one worker
+rendering a long musician page while the others sit idle.
+
+Songs without history get an estimate from their lyric length, chord count and
+QR code (sharding.estimate_page_cost), converted to seconds with the median
+seconds-per-cost ratio of the songs that do have history.
+
+The history is a heuristic: several builds may update it at once, and the last
+one to save wins for the songs they share.
+"""
+
+import os
+import json
+import heapq
+import argparse
+import statistics
+
+from config import get_config
+from sharding import estimate_page_cost
+
+CONFIG = get_config()
+
+HISTORY_FORMAT_VERSION = 1
+
+def _history_key(version, inner_id):
+    return f"{version}:{inner_id}"
+
+class RenderHistory:
+    """Smoothed render durations in seconds, keyed by edition and song."""
+    def __init__(self, path, entries=None):
+        self.path = path
+        self.entries = entries or {}
+        self._updates = {}
+
+    @classmethod
+    def load(cls, path=None):
+        """Load the history file; a missing or unreadable file gives an empty history."""
+        path = path or CONFIG.paths.render_history
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+        if data.get("format_version") != HISTORY_FORMAT_VERSION:
+            return cls(path)
+        return cls(path, data.get("entries", {}))
+
+    def duration(self, version, inner_id):
+        """The smoothed duration of a page, or None if it was never rendered."""
+        entry = self.entries.get(_history_key(version, inner_id))
+        return entry["seconds"] if entry else None
+
+    def record(self, version, inner_id, seconds):
+        """Blend a new duration into the history (exponential moving average)."""
+        key = _history_key(version, inner_id)
+        weight = CONFIG.scheduling['history_weight']
+        previous = self.entries.get(key)
+        smoothed = seconds if previous is None else weight * seconds + (1 - weight) * previous["seconds"]
+        entry = {"seconds": round(smoothed, 3), "runs": (previous["runs"] if previous else 0) + 1}
+        self.entries[key] = entry
+        self._updates[key] = entry
+
+    def save(self):
+        """
+        Write the history atomically. Entries recorded by this process are applied on top of
+        the file as it is now, so builds of other editions or shards are not overwritten.
+        """
+        current = RenderHistory.load(self.path).entries
+        current.update(self._updates)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"format_version": HISTORY_FORMAT_VERSION, "entries": current}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.entries = current
+
+    def predict(self, songs, version):
+        """
+        Return {inner_id: (seconds, source)} for the songs, where source is "history"
+        or "estimate".
+        """
+        costs = {str(song['inner_id']): estimate_page_cost(song, version) for song in songs}
+        ratios = [self.duration(version, inner_id) / cost for inner_id, cost in costs.items()
+                  if self.duration(version, inner_id) is not None]
+        seconds_per_cost = statistics.median(ratios) if ratios else CONFIG.scheduling['default_seconds_per_cost']
+        predictions = {}
+        for inner_id, cost in costs.items():
+            seconds = self.duration(version, inner_id)
+            predictions[inner_id] = (seconds, "history") if seconds is not None \
+                else (cost * seconds_per_cost, "estimate")
+        return predictions
+
+def longest_first(songs, predictions):
+    """The songs ordered by predicted duration, longest first (ties keep catalog order)."""
+    order = {id(song): index for index, song in enumerate(songs)}
+    return sorted(songs, key=lambda song: (-predictions[str(song['inner_id'])][0], order[id(song)]))
+
+def predicted_makespan(durations, workers):
+    """
+    Wall-clock time of running jobs with the given durations, in this order, on a pool
+    of workers that each take the next job as soon as they are free.
+    """
+    loads = [0.0] * max(1, workers)
+    for seconds in durations:
+        heapq.heapreplace(loads, loads[0] + seconds)
+    return max(loads)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the slowest song pages in the render history.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"], required=True,
+                        help="Songbook version")
+    parser.add_argument("--top", type=int, default=10, help="Number of songs to list")
+    args = parser.parse_args()
+
+    history = RenderHistory.load()
+    durations = sorted(((entry["seconds"], key.split(":", 1)[1]) for key, entry in history.entries.items()
+                        if key.startswith(f"{args.version}:")), reverse=True)
+    if not durations:
+        print(f"No render history for version {args.version} in {history.path}")
+    else:
+        print(f"{len(durations)} pages timed, {sum(seconds for seconds, _ in durations):.1f} s in total. Slowest:")
+        for seconds, inner_id in durations[:args.top]:
+            print(f"  song {inner_id}: {seconds:.2f} s")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import generate_songbook_page
+from generate_songbook_page import CONFIG, get_template_for_version, render_template
+from song_catalog import open_catalog, CatalogChangedError
+from prepare_songs import PreparedSongs
+from pdf_conversion import ConversionError
+
+VERSIONS = ("singer", "musician", "projection")
+# Seconds a client is asked to wait when songs.json is being rewritten during a request
+RETRY_AFTER_SECONDS = 1
+FORMATS = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+class SongPageCache:
+    """
+    A thread-safe LRU cache of rendered pages, bounded by the total size in bytes.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, record_stats=True):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record_stats:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            # Never cache something that would evict the whole cache
+            return
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self.current_bytes -= len(old_value)
+            self._entries[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+class RenderService:
+    """
+    Keeps the song catalog and templates in memory and renders song pages on demand.
+    Cached pages are dropped whenever the songs JSON file or any template changes.
+    """
+    def __init__(self, json_file, templates_dir, cache_bytes, max_concurrent_renders, check_interval):
+        self.json_file = json_file
+        self.templates_dir = templates_dir
+        self.check_interval = check_interval
+        self.cache = SongPageCache(cache_bytes)
+        self._render_slots = threading.BoundedSemaphore(max_concurrent_renders)
+        self._reload_lock = threading.Lock()
+        # (generation, catalog), replaced as one value so a render never mixes two reloads
+        self._loaded = (0, None)
+        # Prepared fields are keyed by song content, so they stay valid when the catalog reloads
+        self._prepared = PreparedSongs.load(CONFIG.paths.prepared_cache)
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._refresh_if_changed(force=True)
+
+    def _source_fingerprint(self):
+        """Return the modification times and sizes of every input that affects rendering."""
+        paths = [self.json_file]
+        for root, _, files in os.walk(self.templates_dir):
+            paths.extend(os.path.join(root, name) for name in files)
+        fingerprint = []
+        for path in sorted(paths):
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _refresh_if_changed(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        with self._reload_lock:
+            self._last_check = now
+            fingerprint = self._source_fingerprint()
+            if fingerprint == self._fingerprint:
+                return
+            catalog = open_catalog(self.json_file)
+            self._loaded = (self._loaded[0] + 1, catalog)
+            self._fingerprint = fingerprint
+            self.cache.clear()
+            print(f"Loaded {len(catalog)} songs from {self.json_file}")
+
+    def render(self, inner_id, version, output_format):
+        """
+        Return the rendered page as bytes and whether it was served from the cache.
+        Raises KeyError if the song does not exist, and CatalogChangedError if the
+        songs JSON file keeps changing while it is read.
+        """
+        try:
+            return self._render(inner_id, version, output_format)
+        except CatalogChangedError:
+            # songs.json was rewritten after the last check; reload it and try once more
+            self._refresh_if_changed(force=True)
+            return self._render(inner_id, version, output_format)
+
+    def _render(self, inner_id, version, output_format):
+        self._refresh_if_changed()
+        generation, catalog = self._loaded
+        song = catalog.get(inner_id)
+        # The generation keeps a page rendered from an older catalog from being served after a reload
+        cache_key = (generation, str(inner_id), version, output_format)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+
+        with self._render_slots:
+            # Another request may have rendered the same page while we were waiting
+            cached = self.cache.get(cache_key, record_stats=False)
+            if cached is not None:
+                return cached, True
+
+            template_path = get_template_for_version(self.templates_dir, version)
+            html_content = render_template(template_path, song, version, prepared=self._prepared.get(song, version))
+            if output_format == "pdf":
+                body = self._html_to_pdf_bytes(html_content, version)
+            else:
+                body = html_content.encode('utf-8')
+
+        if self._loaded[0] == generation:
+            # Not cached if the catalog was reloaded (and the cache cleared) during the render
+            self.cache.put(cache_key, body)
+        return body, False
+
+    def _html_to_pdf_bytes(self, html_content, version):
+        """
+        Convert HTML to PDF in memory; nothing is written to disk, so renders can run in
+        parallel. PDFs are shared with the batch build through the artifact store.
+        """
+        # Timeouts matter here: a hung conversion would otherwise hold a render slot forever
+        return generate_songbook_page.html_to_pdf(html_content, None, version)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["songs"] = len(self._loaded[1])
+        stats["qr_cache"] = generate_songbook_page.generate_qr_code.cache_info()._asdict()
+        return stats
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes:
+        GET /song/{inner_id}?version=singer|musician|projection&format=html|pdf
+        GET /stats
+    """
+    service = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = [part for part in parsed.path.split('/') if part]
+
+        if parts == ["stats"]:
+            self._send(200, "application/json", json.dumps(self.service.stats()).encode('utf-8'))
+            return
+
+        if len(parts) != 2 or parts[0] != "song":
+            self._send_error(404, f"Unknown path: {parsed.path}")
+            return
+
+        query = parse_qs(parsed.query)
+        version = query.get("version", ["singer"])[0]
+        output_format = query.get("format", ["html"])[0]
+        if version not in VERSIONS:
+            self._send_error(400, f"Invalid version: {version}")
+            return
+        if output_format not in FORMATS:
+            self._send_error(400, f"Invalid format: {output_format}")
+            return
+
+        try:
+            body, cache_hit = self.service.render(parts[1], version, output_format)
+        except KeyError:
+            self._send_error(404, f"Song with ID {parts[1]} not found.")
+            return
+        except CatalogChangedError as e:
+            self._send_error(503, f"The song catalog is being updated: {e}",
+                             {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return
+        except ConversionError as e:
+            self._send_error(500, f"Error generating PDF: {e}")
+            return
+        except Exception as e:
+            # e.g. a template error, or a half-written songs.json that cannot be loaded
+            self._send_error(500, f"Error rendering song {parts[1]}: {e}")
+            return
+
+        self._send(200, FORMATS[output_format], body, {"X-Cache": "hit" if cache_hit else "miss"})
+
+    def _send_error(self, status, message, extra_headers=None):
+        self._send(status, "application/json", json.dumps({"error": message}).encode('utf-8'), extra_headers)
+
+    def _send(self, status, content_type, body, extra_headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the console readable under load; errors are still reported in responses
+        pass
+
+def serve(host, port, service):
+    RenderRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    print(f"Serving song pages on http://{host}:{port}/song/<inner_id>?version=<version>&format=<html|pdf>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down render service.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    service_config = CONFIG.render_service
+    parser = argparse.ArgumentParser(description="Serve rendered song pages over HTTP from an in-memory cache.")
+    parser.add_argument("--host", default=service_config['host'], help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=service_config['port'], help="Port to listen on")
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir,
+                        help="Directory containing template files")
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json,
+                        help="Path to the JSON file containing song data")
+    parser.add_argument("--cache-size-mb", type=float, default=service_config['cache_size_mb'],
+                        help="Maximum total size of cached pages in megabytes")
+    parser.add_argument("--max-renders", type=int, default=service_config['max_concurrent_renders'],
+                        help="Maximum number of pages rendered at the same time")
+
+    args = parser.parse_args()
+
+    render_service = RenderService(
+        args.json_file,
+        args.templates_dir,
+        int(args.cache_size_mb * 1024 * 1024),
+        args.max_renders,
+        service_config['change_check_interval_seconds'],
+    )
+    serve(args.host, args.port, render_service)
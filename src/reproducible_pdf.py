@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Byte-reproducible PDF output.
+
+wkhtmltopdf stamps every PDF with the time it was made, and PyPDF2 adds its
+own producer string, so rebuilding an unchanged page gives different bytes.
+In reproducible mode:
+
+- PDFs rendered by wkhtmltopdf (song pages, TOCs) have their CreationDate and
+  ModDate, and /ID if there is one, rewritten as they arrive. Replacement values have
+  the same length, so the object layout and xref table stay valid.
+  wkhtmltopdf already writes objects in a fixed order.
+- The merged songbook is written by PyPDF2 with a fixed Producer/Creator, fixed
+  dates and a document /ID derived from its content. PyPDF2 numbers objects in
+  traversal order from the document root, so the same inputs give the same file.
+
+Dates come from SOURCE_DATE_EPOCH (see reproducible-builds.org), or
+1970-01-01 when it is not set. Reproducible mode is on when
+`reproducible_pdf.enabled` is set in config.json or SOURCE_DATE_EPOCH is set.
+"""
+
+import os
+import re
+import sys
+import hashlib
+import argparse
+import datetime
+from io import BytesIO
+
+from config import get_config
+
+CONFIG = get_config()
+
+_DATE_PATTERN = re.compile(rb"(/(?:CreationDate|ModDate)\s*\(D:)(\d+)([^)]*)\)")
+_ID_PATTERN = re.compile(rb"(/ID\s*\[\s*<)([0-9A-Fa-f]+)(>\s*<)([0-9A-Fa-f]+)(>\s*\])")
+
+def is_enabled():
+    return CONFIG.reproducible_pdf['enabled'] or 'SOURCE_DATE_EPOCH' in os.environ
+
+def source_date():
+    """The build time from SOURCE_DATE_EPOCH as a UTC datetime, or the Unix epoch if it is not set."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH', '0')
+    try:
+        return datetime.datetime.fromtimestamp(int(epoch), tz=datetime.timezone.utc)
+    except ValueError:
+        raise ValueError(f"SOURCE_DATE_EPOCH must be an integer number of seconds, got '{epoch}'")
+
+def _replace_date(match, digits):
+    prefix, original_digits, timezone = match.groups()
+    # Same number of digits, and a UTC offset written in the original's width
+    if timezone[:1] in (b"+", b"-"):
+        timezone = b"+" + re.sub(rb"\d", b"0", timezone[1:])
+    return prefix + digits[:len(original_digits)].ljust(len(original_digits), b"0") + timezone + b")"
+
+def normalize_pdf_bytes(data):
+    """
+    Return the PDF with fixed CreationDate/ModDate and a content-derived /ID.
+    Every replacement has the length of the value it replaces, so offsets are unchanged.
+    """
+    digits = source_date().strftime("%Y%m%d%H%M%S").encode('ascii')
+    data = _DATE_PATTERN.sub(lambda match: _replace_date(match, digits), data)
+
+    matches = list(_ID_PATTERN.finditer(data))
+    if matches:
+        # The /ID is a hash of the document with its /ID values blanked out
+        blanked = _ID_PATTERN.sub(lambda match: match.group(1) + b"0" * len(match.group(2)) + match.group(3)
+                                  + b"0" * len(match.group(4)) + match.group(5), data)
+        digest = hashlib.sha256(blanked).hexdigest().upper().encode('ascii')
+
+        def replace_id(match):
+            first = (digest * 2)[:len(match.group(2))]
+            second = (digest * 2)[:len(match.group(4))]
+            return match.group(1) + first + match.group(3) + second + match.group(5)
+        data = _ID_PATTERN.sub(replace_id, data)
+    return data
+
+def normalize_pdf_file(path):
+    """Normalize a PDF in place. The file is only rewritten if it changes."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    normalized = normalize_pdf_bytes(data)
+    if normalized != data:
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            f.write(normalized)
+        os.replace(temp_path, path)
+
+def normalize_if_enabled(data):
+    """Normalize freshly rendered PDF bytes when reproducible mode is on."""
+    return normalize_pdf_bytes(data) if is_enabled() else data
+
+def write_reproducible(merger, output_path):
+    """
+    Write a PyPDF2 PdfMerger (or PdfWriter) to output_path with fixed metadata and a
+    content-derived /ID. The file is written next to the target and moved into place.
+    """
+    from PyPDF2.generic import ArrayObject, ByteStringObject
+
+    date = source_date().strftime("D:%Y%m%d%H%M%S+00'00'")
+    producer = CONFIG.reproducible_pdf['producer']
+    writer = getattr(merger, 'output', merger)
+    writer.get_object(writer._info).clear()
+    merger.add_metadata({"/Producer": producer, "/Creator": producer, "/CreationDate": date, "/ModDate": date})
+
+    # First pass without an /ID (not even one the writer already has, e.g. from a
+    # cloned input), then the /ID is the hash of those bytes
+    if hasattr(writer, '_ID'):
+        del writer._ID
+    first_pass = BytesIO()
+    merger.write(first_pass)
+    document_id = ByteStringObject(hashlib.md5(first_pass.getvalue()).digest())
+    writer._ID = ArrayObject([document_id, document_id])
+    output = BytesIO()
+    writer.write(output)
+
+    temp_path = f"{output_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        f.write(output.getvalue())
+    os.replace(temp_path, output_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize the dates and /ID of PDFs in place and print their hashes.")
+    parser.add_argument("pdf_files", nargs="+", help="PDF files written by wkhtmltopdf")
+    args = parser.parse_args()
+
+    for pdf_file in args.pdf_files:
+        try:
+            normalize_pdf_file(pdf_file)
+        except (OSError, ValueError) as e:
+            print(f"Error normalizing {pdf_file}: {e}")
+            sys.exit(1)
+        with open(pdf_file, 'rb') as f:
+            print(f"{hashlib.sha256(f.read()).hexdigest()}  {pdf_file}")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Splitting song page generation across several build agents.
+
+`generate_full_songbook.py --shard k/n` builds only the songs assigned to shard k
+of n and records what it built in a shard manifest next to the pages. The
+assignment depends only on the catalog, so every agent computes the same split
+without talking to the others:
+
+- "hash": each song goes to the shard given by a hash of its inner_id, so adding
+  songs never moves existing ones to another shard.
+- "balanced": songs are spread by estimated rendering cost, longest first, onto
+  the least loaded shard, so the shards finish at about the same time.
+
+merge_shards.py checks that every shard's manifest is present and complete
+before build_final_songbook.py runs.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+from config import get_config
+
+CONFIG = get_config()
+
+MANIFEST_FORMAT_VERSION = 1
+STRATEGIES = ("hash", "balanced")
+
+def parse_shard_spec(spec):
+    """Parse "k/n" into (k, n), with 1 <= k <= n. Raises ValueError for anything else."""
+    try:
+        shard, shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}': expected k/n, e.g. 2/4")
+    if shards < 1 or not 1 <= shard <= shards:
+        raise ValueError(f"Invalid shard '{spec}': k must be between 1 and n")
+    return shard, shards
+
+def hash_shard(inner_id, shards):
+    """Shard (1-based) of a song under the "hash" strategy."""
+    digest = hashlib.sha1(str(inner_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big") % shards + 1
+
+def estimate_page_cost(song, version):
+    """
+    Relative cost of rendering a song page, from what makes wkhtmltopdf slower:
+    longer lyrics, the chord spans of the musician edition and the singer QR code.
+    """
+    text = song['lyrics_with_chords'] if version == "musician" else song['lyrics']
+    cost = 1.0 + (text or "").count("\n") / 40.0
+    if version == "musician" and text and CONFIG.guitar_chords:
+        from generate_songbook_page import get_chord_pattern
+        cost += len(get_chord_pattern(CONFIG.guitar_chords).findall(text)) / 100.0
+    if version == "singer" and song.get('youtube'):
+        cost += 0.5
+    return cost
+
+def assign_shards(songs, shards, version, strategy="hash"):
+    """
+    Return {inner_id: shard} for every song. The result only depends on the songs
+    and the arguments, so all shards agree on it.
+    """
+    if strategy == "hash":
+        return {str(song['inner_id']): hash_shard(song['inner_id'], shards) for song in songs}
+    if strategy != "balanced":
+        raise ValueError(f"Invalid shard strategy: {strategy}")
+
+    # Longest processing time first: the most expensive song goes to the least loaded shard
+    costs = sorted(((estimate_page_cost(song, version), str(song['inner_id'])) for song in songs),
+                   key=lambda item: (-item[0], item[1]))
+    loads = [0.0] * shards
+    assignment = {}
+    for cost, inner_id in costs:
+        shard = min(range(shards), key=lambda index: (loads[index], index))
+        loads[shard] += cost
+        assignment[inner_id] = shard + 1
+    return assignment
+
+def catalog_fingerprint(catalog_path):
+    """SHA-256 of the catalog file, so shards built from different catalogs are not merged."""
+    digest = hashlib.sha256()
+    with open(catalog_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def manifest_path(version_dir, shard, shards):
+    return os.path.join(version_dir, CONFIG.file_names['shard_manifest'].format(shard=shard, shards=shards))
+
+def write_shard_manifest(path, manifest):
+    """Write a shard manifest atomically, so the merge step never reads a half-written one."""
+    manifest = dict(manifest, format_version=MANIFEST_FORMAT_VERSION, updated=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+def read_shard_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        raise ValueError(f"{path} has manifest format {manifest.get('format_version')}, "
+                         f"expected {MANIFEST_FORMAT_VERSION}")
+    return manifest
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Memory-efficient access to the song catalog.
+
+Only the small metadata fields of each song stay in memory, in `__slots__`
+records. The large lyric fields are read back from the source file on demand,
+using the byte offset of each song's JSON object recorded while loading.
+Both the `songs.json` array and a JSON Lines file (one song per line) are supported.
+"""
+
+import os
+import json
+import argparse
+
+METADATA_FIELDS = (
+    "id", "inner_id", "original_id", "title", "author", "category",
+    "youtube", "explicit_content", "skip_toc", "title_suffix",
+)
+LYRIC_FIELDS = ("lyrics", "lyrics_with_chords")
+SONG_FIELDS = METADATA_FIELDS + LYRIC_FIELDS
+
+class CatalogChangedError(ValueError):
+    """The catalog file changed on disk after it was loaded, so lyric offsets are stale."""
+
+HUNGARIAN_ALPHABET = "aábcdeéfghiíjklmnoóöőpqrstuúüűvwxyz"
+_ALPHABET_ORDER = {char: index for index, char in enumerate(HUNGARIAN_ALPHABET)}
+
+def hungarian_title_key(title):
+    """
+    Collation key for sorting titles in Hungarian alphabetical order.
+    Characters outside the alphabet sort after it. Returned as bytes so it can be stored and indexed.
+    """
+    return bytes(_ALPHABET_ORDER.get(char, len(HUNGARIAN_ALPHABET)) for char in title.casefold())
+
+def sort_toc_songs(songs, sort_by="id"):
+    """
+    Sort songs either by ID or alphabetically by title, excluding songs with skip_toc set to True.
+    """
+    # Filter out songs with skip_toc set to True
+    filtered_songs = [song for song in songs if not song.get('skip_toc', False)]
+
+    if sort_by == "id":
+        # Sort by the new 'inner_id' for consistent numerical ordering
+        return sorted(filtered_songs, key=lambda x: int(x['inner_id']))
+    elif sort_by == "title":
+        return sorted(filtered_songs, key=lambda x: hungarian_title_key(x['title']))
+    else:
+        raise ValueError(f"Invalid sort_by parameter: {sort_by}")
+
+def summarize_songs(songs):
+    """Return the catalog summary: totals, YouTube and explicit-content counts, and songs per category."""
+    summary = {"total": 0, "youtube": 0, "explicit_content": 0, "categories": {}}
+    for song in songs:
+        summary["total"] += 1
+        if song.get('youtube'):
+            summary["youtube"] += 1
+        if song.get('explicit_content'):
+            summary["explicit_content"] += 1
+        category = (song.get('category') or '').strip()
+        if category:
+            summary["categories"][category] = summary["categories"].get(category, 0) + 1
+    return summary
+
+class SongRecord:
+    """
+    A song whose metadata is resident and whose lyrics are loaded lazily.
+    Supports the read-only dict access (song['title'], song.get(...)) used by the scripts and templates.
+    """
+    __slots__ = METADATA_FIELDS + ("_catalog", "_offset", "_length")
+
+    def __init__(self, catalog, offset, length, song):
+        self._catalog = catalog
+        self._offset = offset
+        self._length = length
+        for field in METADATA_FIELDS:
+            setattr(self, field, song.get(field, ""))
+
+    @property
+    def lyrics(self):
+        return self._catalog.load_song(self).get("lyrics", "")
+
+    @property
+    def lyrics_with_chords(self):
+        return self._catalog.load_song(self).get("lyrics_with_chords", "")
+
+    def __getitem__(self, key):
+        if key in SONG_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in SONG_FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in SONG_FIELDS else default
+
+    def to_dict(self):
+        """Return the full song, including lyrics, as a plain dict."""
+        song = self._catalog.load_song(self)
+        song.update({field: getattr(self, field) for field in METADATA_FIELDS})
+        return song
+
+    def __repr__(self):
+        return f"SongRecord(inner_id={self.inner_id!r}, title={self.title!r})"
+
+def _scan_json_array(path):
+    """Yield (byte offset, byte length, song) for each object in a JSON array file."""
+    with open(path, 'r', encoding='utf-8') as file:
+        text = file.read()
+
+    decoder = json.JSONDecoder()
+    index = text.index('[') + 1
+    # Byte offsets are tracked incrementally, since non-ASCII lyrics make them differ from str indexes
+    byte_offset = len(text[:index].encode('utf-8'))
+    length = len(text)
+    while True:
+        start = index
+        while index < length and text[index] in ' \t\r\n,':
+            index += 1
+        if index >= length or text[index] == ']':
+            return
+        byte_offset += len(text[start:index].encode('utf-8'))
+        song, end = decoder.raw_decode(text, index)
+        byte_length = len(text[index:end].encode('utf-8'))
+        yield byte_offset, byte_length, song
+        byte_offset += byte_length
+        index = end
+
+def _scan_json_lines(path):
+    """Yield (byte offset, byte length, song) for each line of a JSON Lines file."""
+    with open(path, 'rb') as file:
+        offset = 0
+        for line in file:
+            if line.strip():
+                yield offset, len(line), json.loads(line)
+            offset += len(line)
+
+class SongCatalog:
+    """
+    Song metadata for a whole catalog, with lyrics read from `path` on demand.
+    Iterates in file order; `get()` looks songs up by `inner_id`.
+
+    The SQLite backend (sqlite_catalog.SqliteSongCatalog) offers the same methods.
+    """
+    def __init__(self, path):
+        self.path = path
+        scan = _scan_json_lines if path.endswith('.jsonl') else _scan_json_array
+        self._stat = self._file_signature()
+        self._songs = [SongRecord(self, offset, length, song) for offset, length, song in scan(path)]
+        self._by_inner_id = {str(song.inner_id): song for song in self._songs}
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __len__(self):
+        return len(self._songs)
+
+    def __iter__(self):
+        return iter(self._songs)
+
+    def get(self, inner_id):
+        """Return the song with the given inner_id. Raises KeyError if it does not exist."""
+        return self._by_inner_id[str(inner_id)]
+
+    def get_by_id(self, song_id):
+        """Return the song with the given printed ID (e.g. "H01"). Raises KeyError if it does not exist."""
+        for song in self._songs:
+            if str(song.id) == str(song_id):
+                return song
+        raise KeyError(song_id)
+
+    def toc_songs(self, sort_by="id"):
+        """Songs that appear in the table of contents, sorted by "id" or "title"."""
+        return sort_toc_songs(self._songs, sort_by)
+
+    def songs_in_category(self, category):
+        """Songs in the given category, in file order."""
+        return [song for song in self._songs if song.category == category]
+
+    def summary(self):
+        """Return the catalog summary: totals, YouTube and explicit-content counts, and songs per category."""
+        return summarize_songs(self._songs)
+
+    def load_song(self, record):
+        """Read a song's full JSON object back from the catalog file."""
+        if self._file_signature() != self._stat:
+            raise CatalogChangedError(f"{self.path} changed on disk since it was loaded; reload the catalog.")
+        with open(self.path, 'rb') as file:
+            file.seek(record._offset)
+            return json.loads(file.read(record._length))
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+def open_catalog(path):
+    """Open a song catalog: songs.json, a .jsonl file or a SQLite catalog written by generate_json."""
+    if path.endswith(SQLITE_SUFFIXES):
+        from sqlite_catalog import SqliteSongCatalog
+        return SqliteSongCatalog(path)
+    return SongCatalog(path)
+
+def write_json_lines(songs, output_path):
+    """Write songs (dicts or SongRecords) as JSON Lines, one song per line."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for song in songs:
+            if isinstance(song, SongRecord):
+                song = song.to_dict()
+            file.write(json.dumps(song, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    from config import get_config
+
+    parser = argparse.ArgumentParser(description="Inspect a song catalog or convert it to JSON Lines.")
+    parser.add_argument("--json-file", default=get_config().paths.songs_json,
+                        help="Path to the songs.json, .jsonl or SQLite catalog")
+    parser.add_argument("--to-jsonl", help="Write the catalog as JSON Lines to this path")
+    args = parser.parse_args()
+
+    catalog = open_catalog(args.json_file)
+    print(f"Loaded {len(catalog)} songs from {args.json_file}")
+    if args.to_jsonl:
+        write_json_lines(catalog, args.to_jsonl)
+        print(f"Wrote {len(catalog)} songs to {args.to_jsonl}")
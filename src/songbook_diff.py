@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Compare two builds of a songbook and produce an update pack.
+
+The comparison only reads the page indexes that build_final_songbook.py writes
+next to the merged PDF (see page_index.py), so it takes milliseconds. Pages are
+matched by source file and page within it, which makes every page either:
+
+- changed: the song (or TOC) page's content differs,
+- added: a new song, or a song that got longer,
+- removed: a song that was dropped, or got shorter,
+- moved: unchanged, but at another page number because pages were added or
+  removed before it. Song pages carry no page numbers, so these need no reprint.
+
+The update pack PDF contains the changed and added pages, copied from the new
+merged songbook in book order, and is accompanied by JSON and HTML lists of all
+changes. By default the latest build is compared with the build before it.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from config import get_config, ConfigError
+
+# Load configuration
+try:
+    CONFIG = get_config()
+except ConfigError as e:
+    print(f"Error: {e}")
+    sys.exit(1)
+
+STATUSES = ("changed", "added", "removed", "moved")
+PRINTED_STATUSES = ("changed", "added")
+
+def diff_page_indexes(old_index, new_index):
+    """
+    Return the differences between two page indexes as a list of dicts with the
+    status, the old and new page numbers and the source of each differing page.
+    """
+    def source_key(entry):
+        return entry["source"], entry["source_page"]
+
+    old_pages = {source_key(entry): entry for entry in old_index["pages"]}
+    new_keys = set()
+    changes = []
+    for entry in new_index["pages"]:
+        key = source_key(entry)
+        new_keys.add(key)
+        previous = old_pages.get(key)
+        if previous is None:
+            status = "added"
+        elif previous["sha256"] != entry["sha256"]:
+            status = "changed"
+        elif previous["page"] != entry["page"]:
+            status = "moved"
+        else:
+            continue
+        changes.append({"status": status, "page": entry["page"], "old_page": previous["page"] if previous else None,
+                        "source": entry["source"], "source_page": entry["source_page"],
+                        "kind": entry["kind"], "inner_id": entry["inner_id"]})
+    for key, entry in old_pages.items():
+        if key not in new_keys:
+            changes.append({"status": "removed", "page": None, "old_page": entry["page"],
+                            "source": entry["source"], "source_page": entry["source_page"],
+                            "kind": entry["kind"], "inner_id": entry["inner_id"]})
+    changes.sort(key=lambda change: (change["page"] is None, change["page"] or change["old_page"]))
+    return changes
+
+def song_titles(songs_json):
+    """{inner_id: title} from the catalog, or {} if it cannot be read."""
+    from song_catalog import open_catalog
+    try:
+        return {str(song['inner_id']): song['title'] for song in open_catalog(songs_json)}
+    except (OSError, ValueError) as e:
+        print(f"Warning: song titles not available ({e})")
+        return {}
+
+def write_update_pack(merged_pdf_path, changes, pack_pdf_path):
+    """Copy the changed and added pages of the merged songbook into pack_pdf_path. Returns the page count."""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    pages = [change["page"] for change in changes if change["status"] in PRINTED_STATUSES]
+    if not pages:
+        return 0
+    reader = PdfReader(merged_pdf_path)
+    writer = PdfWriter()
+    for page in pages:
+        # Links would point into the full book, so they are left out of the printed pack
+        writer.add_page(reader.pages[page - 1], excluded_keys=("/Annots",))
+    temp_path = f"{pack_pdf_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        writer.write(f)
+    os.replace(temp_path, pack_pdf_path)
+    return len(pages)
+
+def render_report(report, template_path):
+    template_dir = os.path.dirname(template_path)
+    template_file = os.path.basename(template_path)
+    from jinja2 import Environment, FileSystemLoader
+    env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+    return env.get_template(template_file).render(report=report)
+
+def build_update_pack(version, output_dir=None, old_index_path=None, new_index_path=None,
+                      songs_json=None, templates_dir=None):
+    """
+    Compare two page indexes of a version and write the update pack PDF and its JSON and
+    HTML reports to output_dir. Returns the report dict.
+    """
+    from build_final_songbook import merged_songbook_path
+    from page_index import page_index_path, read_page_index
+
+    output_dir = output_dir or CONFIG.paths.output_dir
+    merged_pdf_path = merged_songbook_path(version, output_dir)
+    old_index_path = old_index_path or page_index_path(merged_pdf_path, previous=True)
+    new_index_path = new_index_path or page_index_path(merged_pdf_path)
+    old_index = read_page_index(old_index_path)
+    new_index = read_page_index(new_index_path)
+    for index, path in ((old_index, old_index_path), (new_index, new_index_path)):
+        if index["version"] != version:
+            raise ValueError(f"{path} is a page index of the {index['version']} songbook, not {version}")
+
+    changes = diff_page_indexes(old_index, new_index)
+    titles = song_titles(songs_json or CONFIG.paths.songs_json)
+    for change in changes:
+        change["title"] = titles.get(change["inner_id"]) if change["kind"] == "song" else "Tartalomjegyzék"
+
+    base_path = os.path.join(output_dir, CONFIG.file_names['update_pack'].format(version=version))
+    pack_pdf_path = base_path + ".pdf"
+    if os.path.exists(pack_pdf_path):
+        # A pack left from an earlier comparison must not be mistaken for this one
+        os.remove(pack_pdf_path)
+    pack_pages = write_update_pack(merged_pdf_path, changes, pack_pdf_path)
+
+    report = {
+        "version": version,
+        "old_index": os.path.abspath(old_index_path),
+        "new_index": os.path.abspath(new_index_path),
+        "old_page_count": old_index["page_count"],
+        "new_page_count": new_index["page_count"],
+        "counts": {status: sum(1 for change in changes if change["status"] == status) for status in STATUSES},
+        "update_pack": os.path.basename(pack_pdf_path) if pack_pages else None,
+        "update_pack_pages": pack_pages,
+        "changes": changes,
+    }
+    with open(base_path + ".json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    template_path = os.path.join(templates_dir or CONFIG.paths.templates_dir, CONFIG.templates['update_pack_report'])
+    with open(base_path + ".html", 'w', encoding='utf-8') as f:
+        f.write(render_report(report, template_path))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the pages that changed between two songbook builds "
+                                                 "and collect the ones to reprint in an update pack.")
+    parser.add_argument("--version", choices=["singer", "musician", "projection"],
+                        required=True, help="Songbook version to compare (singer, musician, projection).")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Directory containing the merged songbook; the update pack is saved here too.")
+    parser.add_argument("--old", help="Page index of the old build (default: the build before the latest)")
+    parser.add_argument("--new", help="Page index of the new build (default: the latest build)")
+    parser.add_argument("--songs-json", default=CONFIG.paths.songs_json,
+                        help="Song catalog used for the titles in the report")
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir,
+                        help="Directory containing template files")
+    args = parser.parse_args()
+
+    try:
+        report = build_update_pack(args.version, os.path.abspath(args.output_dir), args.old, args.new,
+                                   args.songs_json, args.templates_dir)
+    except FileNotFoundError as e:
+        print(f"Error: page index not found: {e.filename}. Run build_final_songbook.py for both builds first.")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    counts = report["counts"]
+    print(f"{counts['changed']} changed, {counts['added']} added, {counts['removed']} removed, "
+          f"{counts['moved']} moved pages ({report['old_page_count']} -> {report['new_page_count']} pages).")
+    if report["update_pack"]:
+        print(f"Update pack with {report['update_pack_pages']} pages: "
+              f"{os.path.join(os.path.abspath(args.output_dir), report['update_pack'])}")
+    else:
+        print("Nothing to reprint.")
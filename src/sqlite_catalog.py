@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+SQLite backend for the song catalog.
+
+`generate_json.py --sqlite` writes the catalog to a SQLite file with indexes on
+`inner_id`, `id`, `category`, a Hungarian title collation key and the
+`skip_toc`/`explicit_content` flags. SqliteSongCatalog reads it through the same
+interface as song_catalog.SongCatalog, so every script accepts the .db file
+wherever it accepts songs.json.
+"""
+
+import os
+import sqlite3
+import threading
+
+from song_catalog import METADATA_FIELDS, SongRecord, hungarian_title_key
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE songs (
+    inner_id INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    original_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    title_key BLOB NOT NULL,
+    author TEXT NOT NULL,
+    category TEXT NOT NULL,
+    youtube TEXT NOT NULL,
+    explicit_content INTEGER NOT NULL,
+    skip_toc INTEGER NOT NULL,
+    title_suffix TEXT NOT NULL,
+    lyrics TEXT NOT NULL,
+    lyrics_with_chords TEXT NOT NULL
+);
+CREATE INDEX songs_id ON songs (id);
+CREATE INDEX songs_category ON songs (category);
+CREATE INDEX songs_title_key ON songs (title_key);
+CREATE INDEX songs_toc_by_id ON songs (skip_toc, inner_id);
+CREATE INDEX songs_toc_by_title ON songs (skip_toc, title_key);
+CREATE INDEX songs_explicit_content ON songs (explicit_content);
+"""
+
+_METADATA_COLUMNS = ", ".join(METADATA_FIELDS)
+
+def write_sqlite_catalog(songs, db_path):
+    """
+    Write songs (dicts or SongRecords) to a new SQLite catalog at db_path.
+    The database is built next to the target and moved into place, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    temp_path = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        rows = []
+        for song in songs:
+            song = song.to_dict() if isinstance(song, SongRecord) else song
+            rows.append((
+                int(song['inner_id']),
+                str(song.get('id', '')),
+                str(song.get('original_id') or ''),
+                str(song.get('title') or ''),
+                hungarian_title_key(str(song.get('title') or '')),
+                str(song.get('author') or ''),
+                str(song.get('category') or ''),
+                str(song.get('youtube') or ''),
+                int(bool(song.get('explicit_content'))),
+                int(bool(song.get('skip_toc'))),
+                str(song.get('title_suffix') or ''),
+                str(song.get('lyrics') or ''),
+                str(song.get('lyrics_with_chords') or ''),
+            ))
+        connection.executemany("INSERT INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, db_path)
+    return len(rows)
+
+class SqliteSongCatalog:
+    """
+    Song catalog backed by SQLite. Lookups and ToC queries use the indexes instead of scanning.
+    Connections are read-only and per thread, so it can be shared by the render service's threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"SQLite catalog not found at {path}")
+        self._local = threading.local()
+        version = self._connection().execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            raise ValueError(f"{path} has catalog schema version {version}, expected {SCHEMA_VERSION}. "
+                             "Regenerate it with generate_json.py --sqlite.")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            uri = "file:" + os.path.abspath(self.path).replace(os.sep, '/') + "?mode=ro"
+            connection = sqlite3.connect(uri, uri=True)
+            self._local.connection = connection
+        return connection
+
+    def _record(self, row):
+        song = dict(zip(METADATA_FIELDS, row))
+        song['inner_id'] = str(song['inner_id'])
+        song['explicit_content'] = bool(song['explicit_content'])
+        song['skip_toc'] = bool(song['skip_toc'])
+        return SongRecord(self, None, None, song)
+
+    def _query(self, where="", params=(), order_by="inner_id"):
+        cursor = self._connection().execute(
+            f"SELECT {_METADATA_COLUMNS} FROM songs {where} ORDER BY {order_by}", params)
+        return [self._record(row) for row in cursor]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    def __iter__(self):
+        return iter(self._query())
+
+    def get(self, inner_id):
+        """Return the song with the given inner_id. Raises KeyError if it does not exist."""
+        try:
+            songs = self._query("WHERE inner_id = ?", (int(inner_id),))
+        except ValueError:
+            raise KeyError(inner_id)
+        if not songs:
+            raise KeyError(inner_id)
+        return songs[0]
+
+    def get_by_id(self, song_id):
+        """Return the song with the given printed ID (e.g. "H01"). Raises KeyError if it does not exist."""
+        songs = self._query("WHERE id = ?", (str(song_id),))
+        if not songs:
+            raise KeyError(song_id)
+        return songs[0]
+
+    def songs_in_category(self, category):
+        """Songs in the given category, in inner_id order."""
+        return self._query("WHERE category = ?", (category,))
+
+    def toc_songs(self, sort_by="id"):
+        """Songs that appear in the table of contents, sorted by "id" or "title"."""
+        if sort_by == "id":
+            return self._query("WHERE skip_toc = 0", order_by="inner_id")
+        elif sort_by == "title":
+            return self._query("WHERE skip_toc = 0", order_by="title_key, inner_id")
+        else:
+            raise ValueError(f"Invalid sort_by parameter: {sort_by}")
+
+    def summary(self):
+        """Return the catalog summary: totals, YouTube and explicit-content counts, and songs per category."""
+        connection = self._connection()
+        total, youtube, explicit = connection.execute(
+            "SELECT COUNT(*), COUNT(NULLIF(youtube, '')), COALESCE(SUM(explicit_content), 0) FROM songs").fetchone()
+        categories = {}
+        for category, count in connection.execute("SELECT category, COUNT(*) FROM songs GROUP BY category"):
+            category = category.strip()
+            if category:
+                categories[category] = categories.get(category, 0) + count
+        return {"total": total, "youtube": youtube, "explicit_content": explicit, "categories": categories}
+
+    def load_song(self, record):
+        """Read a song's lyrics from the database."""
+        row = self._connection().execute(
+            "SELECT lyrics, lyrics_with_chords FROM songs WHERE inner_id = ?", (int(record.inner_id),)).fetchone()
+        if row is None:
+            raise KeyError(record.inner_id)
+        return {"lyrics": row[0], "lyrics_with_chords": row[1]}
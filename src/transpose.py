@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Chord transposition for the musician songbook.
+
+A song's `lyrics_with_chords` is parsed once into a ChordSheet: lyric lines are
+kept as text and chord lines become (column, pitch class, suffix, bass) tuples.
+Any of the 12 transpositions is then produced from precomputed name tables,
+with sharps or flats chosen by the target key and B/H written the way the
+song writes them (German H = B natural, B = B flat).
+"""
+
+import os
+import re
+import argparse
+
+from config import get_config
+
+CONFIG = get_config()
+
+NOTE_PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "H": 11}
+ACCIDENTALS = {"": 0, "#": 1, "isz": 1, "b": -1, "esz": -1}
+
+SHARP_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+FLAT_NAMES = ("C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "B")
+
+# NAME_TABLES[(german, use_flats)][pitch_class] -> chord root name
+NAME_TABLES = {}
+for _german in (False, True):
+    for _use_flats in (False, True):
+        _names = list(FLAT_NAMES if _use_flats else SHARP_NAMES)
+        if _german:
+            _names[11] = "H"
+            if _use_flats:
+                _names[10] = "B"
+        NAME_TABLES[(_german, _use_flats)] = tuple(_names)
+
+# Keys written with flats; the others (and C / A minor) use sharps
+FLAT_MAJOR_KEYS = frozenset({5, 10, 3, 8, 1})     # F, Bb, Eb, Ab, Db
+FLAT_MINOR_KEYS = frozenset({2, 7, 0, 5, 10, 3})  # Dm, Gm, Cm, Fm, Bbm, Ebm
+# F#/Gb major and D#/Eb minor are written either way; the song's own spelling decides
+AMBIGUOUS_MAJOR_KEY = 6
+AMBIGUOUS_MINOR_KEY = 3
+
+_ROOT = r"([A-H])(isz|esz|#|b)?"
+_SUFFIX = r"((?:maj|min|dim|aug|sus|add|m|M|\+|°|ø|b5|#5|b9|#9|\d+|\(|\))*)"
+CHORD_PATTERN = re.compile(rf"{_ROOT}{_SUFFIX}(?:/{_ROOT})?([*.]*)")
+CHORD_SEPARATORS = re.compile(r"([-=])")
+TOKEN_PATTERN = re.compile(r"\S+")
+
+def _pitch_class(letter, accidental, german):
+    if letter == "B":
+        # German B is B flat; English B is B natural
+        base = 10 if german else 11
+    else:
+        base = NOTE_PITCH_CLASSES[letter]
+    return (base + ACCIDENTALS[accidental or ""]) % 12
+
+def _parse_chord(text, german):
+    """Parse one chord into (root, suffix, bass, annotation), or None if it is not a chord."""
+    match = CHORD_PATTERN.fullmatch(text)
+    if not match:
+        return None
+    root_letter, root_accidental, suffix, bass_letter, bass_accidental, annotation = match.groups()
+    root = _pitch_class(root_letter, root_accidental, german)
+    bass = _pitch_class(bass_letter, bass_accidental, german) if bass_letter else None
+    return root, suffix, bass, annotation
+
+def _parse_token(text, german):
+    """
+    Parse a token of a chord line. Tokens such as "F#m-G" hold several chords joined by - or =.
+    Returns a tuple of chords and separators, or None if any part is not a chord.
+    """
+    parts = []
+    for index, piece in enumerate(CHORD_SEPARATORS.split(text)):
+        if index % 2:
+            parts.append(piece)
+            continue
+        chord = _parse_chord(piece, german)
+        if chord is None:
+            return None
+        parts.append(chord)
+    return tuple(parts)
+
+def _uses_german_notation(chord_tokens):
+    """Whether any chord (root or bass) is written as H; only tokens of chord lines are looked at."""
+    return any(re.search(r"(?:^|[-=/])H", token) for token in chord_tokens)
+
+def _key_uses_flats(key, minor, prefer_flats):
+    if minor:
+        if key == AMBIGUOUS_MINOR_KEY:
+            return prefer_flats
+        return key in FLAT_MINOR_KEYS
+    if key == AMBIGUOUS_MAJOR_KEY:
+        return prefer_flats
+    return key in FLAT_MAJOR_KEYS
+
+class ChordSheet:
+    """
+    A parsed `lyrics_with_chords` text that can be rendered in any key without re-parsing.
+
+    lines: tuple of either a str (lyric line) or a tuple of (column, token) pairs,
+    where token is a tuple of parsed chords and separators.
+    """
+    __slots__ = ("source", "lines", "german", "key", "minor", "prefer_flats")
+
+    def __init__(self, source, lines, german, key, minor, prefer_flats):
+        self.source = source
+        self.lines = lines
+        self.german = german
+        self.key = key
+        self.minor = minor
+        self.prefer_flats = prefer_flats
+
+    @classmethod
+    def parse(cls, text):
+        """Parse lyrics with chords. Lines whose every word is a chord are treated as chord lines."""
+        text = text or ""
+        # Whether a line is a chord line does not depend on the notation, which is only
+        # known once all chord lines are found: lyric words such as "Hát" are not chords
+        split_lines = []
+        for line in text.split("\n"):
+            tokens = [(match.start(), match.group()) for match in TOKEN_PATTERN.finditer(line)]
+            is_chord_line = bool(tokens) and all(_parse_token(token, False) is not None for _, token in tokens)
+            split_lines.append((line, tokens if is_chord_line else None))
+        german = _uses_german_notation(token for _, tokens in split_lines if tokens for _, token in tokens)
+
+        lines = []
+        first_chord = None
+        flats = sharps = 0
+        for line, tokens in split_lines:
+            if tokens is None:
+                lines.append(line)
+                continue
+            parsed = [(column, _parse_token(token, german)) for column, token in tokens]
+            lines.append(tuple(parsed))
+            for _, token_text in tokens:
+                flats += len(re.findall(r"(?<=[A-HB])(?:b|esz)", token_text))
+                sharps += len(re.findall(r"#|isz", token_text))
+            if first_chord is None:
+                first_chord = parsed[0][1][0]
+
+        if first_chord is None:
+            key, minor = 0, False
+        else:
+            root, suffix, _, _ = first_chord
+            key, minor = root, suffix.startswith("m") and not suffix.startswith("maj")
+        return cls(text, tuple(lines), german, key, minor, flats > sharps)
+
+    def has_chords(self):
+        return any(not isinstance(line, str) for line in self.lines)
+
+    def key_name(self, semitones=0):
+        """Name of the song's key after transposing, e.g. "Dm"."""
+        key = (self.key + semitones) % 12
+        names = NAME_TABLES[(self.german, _key_uses_flats(key, self.minor, self.prefer_flats))]
+        return names[key] + ("m" if self.minor else "")
+
+    def _names(self, semitones):
+        key = (self.key + semitones) % 12
+        return NAME_TABLES[(self.german, _key_uses_flats(key, self.minor, self.prefer_flats))]
+
+    def _render(self, semitones, wrap):
+        names = self._names(semitones)
+        output = []
+        for line in self.lines:
+            if isinstance(line, str):
+                output.append(line)
+                continue
+            pieces = []
+            visible_length = 0
+            for column, token in line:
+                visible_text = ""
+                markup = ""
+                for part in token:
+                    if isinstance(part, str):
+                        visible_text += part
+                        markup += part
+                        continue
+                    root, suffix, bass, annotation = part
+                    chord = names[(root + semitones) % 12] + suffix
+                    if bass is not None:
+                        chord += "/" + names[(bass + semitones) % 12]
+                    visible_text += chord + annotation
+                    markup += wrap(chord) + annotation
+                # Keep each chord above its original column unless the previous chord got longer
+                if column > visible_length:
+                    padding = column - visible_length
+                else:
+                    padding = 1 if pieces else 0
+                pieces.append(" " * padding + markup)
+                visible_length += padding + len(visible_text)
+            output.append("".join(pieces))
+        return "\n".join(output)
+
+    def text(self, semitones=0):
+        """The lyrics with chords transposed by the given number of semitones."""
+        if semitones % 12 == 0:
+            return self.source
+        return self._render(semitones % 12, lambda chord: chord)
+
+    def html(self, semitones=0):
+        """Like text(), with every chord wrapped in <span class="chord"> as wrap_chords_in_lyrics does."""
+        return self._render(semitones % 12, lambda chord: f'<span class="chord">{chord}</span>')
+
+def transposed_subdir(semitones=0, capo=None):
+    """Output subdirectory of a transposed musician edition, e.g. "songbook_musician_transpose+2" or "..._capo3"."""
+    base = CONFIG.songbook_subdir("musician")
+    if capo:
+        return f"{base}_capo{capo}"
+    return f"{base}_transpose{semitones:+d}"
+
+def generate_transposed_edition(songs, semitones, templates_dir, output_dir, capo=None):
+    """
+    Render the musician page of each song with its chords moved by `semitones`.
+    Returns the list of generated PDF paths; songs whose conversion fails are reported and skipped.
+    """
+    from generate_songbook_page import get_template_for_version, render_template, html_to_pdf
+    from pdf_conversion import ConversionError
+
+    template_path = get_template_for_version(templates_dir, "musician")
+    subdir = os.path.join(output_dir, transposed_subdir(semitones, capo))
+    os.makedirs(subdir, exist_ok=True)
+    output_paths = []
+    for song in songs:
+        sheet = ChordSheet.parse(song['lyrics_with_chords'])
+        html_content = render_template(template_path, song, "musician", sheet, semitones)
+        output_path = os.path.join(subdir, CONFIG.song_page_filename(song['inner_id']))
+        try:
+            html_to_pdf(html_content, output_path, "musician")
+        except ConversionError as e:
+            print(f"Failed to generate transposed page for song inner_id {song['inner_id']}: {e}")
+            continue
+        output_paths.append(output_path)
+    return output_paths
+
+def generate_all_keys(song, templates_dir, output_dir):
+    """
+    Render a song's musician page in all 12 keys, parsing its chords once.
+    Files are named after the song page with the offset appended, e.g. song_12_+3.pdf.
+    Returns the list of generated PDF paths; keys whose conversion fails are reported and skipped.
+    """
+    from generate_songbook_page import get_template_for_version, render_template, html_to_pdf
+    from pdf_conversion import ConversionError
+
+    template_path = get_template_for_version(templates_dir, "musician")
+    subdir = os.path.join(output_dir, f"{CONFIG.songbook_subdir('musician')}_keys")
+    os.makedirs(subdir, exist_ok=True)
+    sheet = ChordSheet.parse(song['lyrics_with_chords'])
+    base_name, extension = os.path.splitext(CONFIG.song_page_filename(song['inner_id']))
+    output_paths = []
+    for semitones in range(12):
+        html_content = render_template(template_path, song, "musician", sheet, semitones)
+        output_path = os.path.join(subdir, f"{base_name}_{semitones:+d}{extension}")
+        try:
+            html_to_pdf(html_content, output_path, "musician")
+        except ConversionError as e:
+            print(f"Failed to generate page for song inner_id {song['inner_id']} in key {semitones:+d}: {e}")
+            continue
+        output_paths.append(output_path)
+    return output_paths
+
+if __name__ == "__main__":
+    from song_catalog import open_catalog
+
+    parser = argparse.ArgumentParser(description="Transpose the chords of the musician songbook.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--transpose", type=int, help="Semitones to move the chords by, e.g. 2 or -3")
+    group.add_argument("--capo", type=int, help="Capo fret: chords are written for playing with a capo, sounding as before")
+    group.add_argument("--all-keys", action="store_true", help="Render the song given by --song-id in all 12 keys")
+    parser.add_argument("--song-id", help="Inner ID of a single song (default: all songs)")
+    parser.add_argument("--print", action="store_true", dest="print_only",
+                        help="Print the transposed lyrics instead of generating PDFs")
+    parser.add_argument("--templates-dir", default=CONFIG.paths.templates_dir,
+                        help="Directory containing template files")
+    parser.add_argument("--output-dir", default=CONFIG.paths.output_dir,
+                        help="Directory to save output files")
+    parser.add_argument("--json-file", default=CONFIG.paths.songs_json,
+                        help="Path to the song catalog (songs.json, .jsonl or SQLite)")
+    args = parser.parse_args()
+
+    catalog = open_catalog(args.json_file)
+    if args.song_id is not None:
+        try:
+            songs = [catalog.get(args.song_id)]
+        except KeyError:
+            parser.error(f"Song with ID {args.song_id} not found.")
+    elif args.all_keys:
+        parser.error("--all-keys needs --song-id")
+    else:
+        songs = list(catalog)
+
+    # A capo on fret N raises the sound by N semitones, so the written chords go down by N
+    semitones = -args.capo if args.capo else (args.transpose or 0)
+
+    if args.print_only:
+        offsets = range(12) if args.all_keys else [semitones]
+        for song in songs:
+            sheet = ChordSheet.parse(song['lyrics_with_chords'])
+            for offset in offsets:
+                print(f"=== {song['id']} {song['title']} ({sheet.key_name(offset)}, {offset:+d}) ===")
+                print(sheet.text(offset))
+                print()
+    elif args.all_keys:
+        paths = generate_all_keys(songs[0], args.templates_dir, args.output_dir)
+        print(f"Generated {len(paths)} of 12 pages for song {args.song_id}")
+    else:
+        paths = generate_transposed_edition(songs, semitones, args.templates_dir, args.output_dir, args.capo)
+        print(f"Generated {len(paths)} transposed pages in {os.path.dirname(paths[0]) if paths else args.output_dir}")
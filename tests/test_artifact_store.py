@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from artifact_store import ArtifactStore, LocalDirectoryStore
+
+def key(number):
+    return f"{number:02x}" + "0" * 62
+
+def test_put_and_get(tmp_path):
+    store = LocalDirectoryStore(str(tmp_path), 1000)
+    store.put(key(1), b"pdf bytes")
+    assert store.get(key(1)) == b"pdf bytes"
+    assert store.get(key(2)) is None
+
+def test_running_total_follows_puts_and_overwrites(tmp_path):
+    store = LocalDirectoryStore(str(tmp_path), 1000)
+    store.put(key(1), b"a" * 100)
+    store.put(key(2), b"b" * 50)
+    store.put(key(1), b"c" * 30)
+    assert store._total_bytes() == 80
+    assert store.stats()["bytes"] == 80
+
+def test_put_does_not_scan_the_store_below_the_limit(tmp_path, monkeypatch):
+    store = LocalDirectoryStore(str(tmp_path), 1000)
+    store.put(key(1), b"a" * 100)
+
+    def scan():
+        raise AssertionError("the store was scanned")
+    monkeypatch.setattr(store, "_entries", scan)
+    for number in range(2, 10):
+        store.put(key(number), b"b" * 100)
+    assert store._total_bytes() == 900
+
+def test_least_recently_used_artifacts_are_evicted(tmp_path):
+    store = LocalDirectoryStore(str(tmp_path), 1000)
+    for number in range(1, 11):
+        store.put(key(number), b"x" * 100)
+        os.utime(store._path(key(number)), (number, number))
+    # Reading refreshes an artifact, so it outlives older ones
+    store.get(key(1))
+
+    store.put(key(11), b"x" * 100)
+    assert store._total_bytes() <= 900
+    assert store.get(key(1)) is not None and store.get(key(11)) is not None
+    assert store.get(key(2)) is None and store.get(key(3)) is None
+    assert store.stats()["bytes"] == store._total_bytes()
+
+def test_missing_usage_file_is_recounted(tmp_path):
+    store = LocalDirectoryStore(str(tmp_path), 1000)
+    store.put(key(1), b"a" * 100)
+    os.remove(store._usage_path())
+    store.put(key(2), b"b" * 100)
+    assert store._total_bytes() == 200
+
+def test_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        ArtifactStore()
+
+    class Incomplete(ArtifactStore):
+        def get(self, key):
+            return None
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,130 @@
+from io import BytesIO
+
+import pytest
+
+import build_final_songbook
+from build_final_songbook import link_toc_pages, number_toc_pages
+from page_index import TOC_LINK_PREFIX
+
+class FakeBook:
+    """
+    A book of a TOC and three one-page songs, whose TOC gets longer as it is rendered:
+    toc_lengths[n] is the TOC's page count after the nth render.
+    """
+    def __init__(self, toc_lengths):
+        self.toc_lengths = toc_lengths
+        self.renders = []
+
+    def source_page_entries(self, pdfs_to_merge):
+        toc_pages = self.toc_lengths[len(self.renders) // 2]
+        entries = [{"page": page, "kind": "toc", "inner_id": None} for page in range(1, toc_pages + 1)]
+        return entries + [{"page": toc_pages + number, "kind": "song", "inner_id": str(number)} for number in (1, 2, 3)]
+
+    def generate_toc(self, version, toc_version, templates_dir, output_dir, json_file, page_numbers=None):
+        self.renders.append((toc_version, dict(page_numbers)))
+
+@pytest.fixture
+def fake_book(monkeypatch):
+    def install(toc_lengths):
+        import generate_toc
+        book = FakeBook(toc_lengths)
+        monkeypatch.setattr(build_final_songbook, "songbook_pdf_paths", lambda version, directory: [])
+        monkeypatch.setattr(build_final_songbook, "source_page_entries", book.source_page_entries)
+        monkeypatch.setattr(generate_toc, "generate_toc", book.generate_toc)
+        return book
+    return install
+
+def song_numbers(toc_pages):
+    return {str(number): toc_pages + number for number in (1, 2, 3)}
+
+def number(capsys):
+    number_toc_pages("singer", "output", "output/singer", "songs.json", "templates")
+    return capsys.readouterr().out
+
+def test_numbers_that_settle_on_the_first_render(fake_book, capsys):
+    book = fake_book([1, 1])
+    assert "did not settle" not in number(capsys)
+    assert book.renders == [("1", song_numbers(1)), ("2", song_numbers(1))]
+
+def test_numbers_that_settle_on_the_last_pass_are_not_reported(fake_book, capsys):
+    # The page column makes the TOC one page longer on each of the first two renders
+    book = fake_book([1, 2, 3, 3])
+    assert "did not settle" not in number(capsys)
+    assert len(book.renders) == 2 * build_final_songbook.TOC_NUMBERING_PASSES
+    assert book.renders[-1] == ("2", song_numbers(3))
+
+def test_numbers_that_keep_moving_are_reported(fake_book, capsys):
+    fake_book([1, 2, 3, 4])
+    assert "did not settle" in number(capsys)
+
+def link(uri):
+    from PyPDF2.generic import ArrayObject, DictionaryObject, FloatObject, NameObject, TextStringObject
+    return DictionaryObject({
+        NameObject('/Type'): NameObject('/Annot'),
+        NameObject('/Subtype'): NameObject('/Link'),
+        NameObject('/Rect'): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(10), FloatObject(10)]),
+        NameObject('/A'): DictionaryObject({NameObject('/S'): NameObject('/URI'),
+                                            NameObject('/URI'): TextStringObject(uri)}),
+    })
+
+def test_toc_links_point_to_the_songs_pages():
+    pytest.importorskip("PyPDF2")
+    from PyPDF2 import PdfReader, PdfWriter
+    from PyPDF2.generic import ArrayObject, NameObject
+
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(595, 842)
+    youtube = "https://www.youtube.com/watch?v=abc"
+    writer.pages[0][NameObject('/Annots')] = ArrayObject(
+        [writer._add_object(link(TOC_LINK_PREFIX + inner_id)) for inner_id in ("2", "7")]
+        + [writer._add_object(link(youtube))])
+    entries = [{"page": 1, "kind": "toc", "inner_id": None}, {"page": 2, "kind": "song", "inner_id": "1"},
+               {"page": 3, "kind": "song", "inner_id": "1"}, {"page": 4, "kind": "song", "inner_id": "2"}]
+
+    link_toc_pages(writer, entries, {"1": 2, "2": 4})
+    output = BytesIO()
+    writer.write(output)
+    reader = PdfReader(output)
+
+    actions = [annotation.get_object()['/A'] for annotation in reader.pages[0]['/Annots']]
+    # The link to song 7, which is not in the book, is removed; other links are kept as they are
+    assert len(actions) == 2
+    assert actions[0]['/S'] == '/GoTo'
+    assert reader.get_page_number(actions[0]['/D'][0].get_object()) == 3
+    assert actions[1]['/URI'] == youtube
+
+def song_pdf(path, inner_id):
+    """A one-page song PDF whose font, an indirect object, is named after the song."""
+    from PyPDF2 import PdfWriter, PageObject
+    from PyPDF2.generic import DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    page = PageObject.create_blank_page(None, 420, 595)
+    font = writer._add_object(DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                                                NameObject('/Subtype'): NameObject('/Type1'),
+                                                NameObject('/BaseFont'): NameObject(f'/Song{inner_id}')}))
+    page[NameObject('/Resources')] = DictionaryObject({
+        NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+    writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def test_merged_book_has_every_song_page_in_order(tmp_path, capsys):
+    pytest.importorskip("PyPDF2")
+    from PyPDF2 import PdfReader
+    from build_final_songbook import CONFIG, build_final_songbook, merged_songbook_path
+    from page_index import page_index_path, read_page_index
+
+    pages_dir = tmp_path / CONFIG.songbook_subdir("singer")
+    pages_dir.mkdir()
+    # Many one-page files, as a singer build has
+    for inner_id in range(1, 31):
+        song_pdf(str(pages_dir / CONFIG.song_page_filename(inner_id)), inner_id)
+    build_final_songbook("singer", str(tmp_path), songs_json=str(tmp_path / "missing.json"))
+
+    merged_path = merged_songbook_path("singer", str(tmp_path))
+    fonts = [str(page['/Resources']['/Font']['/F1']['/BaseFont']) for page in PdfReader(merged_path).pages]
+    assert fonts == [f"/Song{inner_id}" for inner_id in range(1, 31)]
+    index = read_page_index(page_index_path(merged_path))
+    assert index["songs"]["12"]["start_page"] == 12
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from build_journal import DONE, FAILED, STARTED, BuildJournal, song_task, toc_task
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "build_journal_singer.jsonl")
+
+def interrupted_run(journal_path):
+    """A run where TOC 1 and song 1 finished, song 2 failed and song 3 was interrupted."""
+    journal = BuildJournal.start(journal_path, "singer", "catalog-sha", None)
+    for task in (toc_task("1"), song_task(1), song_task(2), song_task(3)):
+        journal.record(task, STARTED)
+    journal.record(toc_task("1"), DONE)
+    journal.record(song_task(1), DONE)
+    journal.record(song_task(2), FAILED, {"stage": "song", "inner_id": "2", "reason": "exited with code 1"})
+    return journal
+
+def test_replayed_journal_has_the_last_state_of_every_task(journal_path):
+    interrupted_run(journal_path)
+    journal = BuildJournal.read(journal_path)
+    assert journal.header["version"] == "singer"
+    assert journal.header["catalog_sha256"] == "catalog-sha"
+    assert journal.states == {toc_task("1"): DONE, song_task(1): DONE, song_task(2): FAILED, song_task(3): STARTED}
+    assert journal.failures == {song_task(2): {"stage": "song", "inner_id": "2", "reason": "exited with code 1"}}
+    assert journal.counts() == {STARTED: 1, DONE: 2, FAILED: 1}
+
+@pytest.mark.parametrize("resume, retry_failed, expected", [
+    (True, False, {song_task(3), song_task(4)}),
+    (False, True, {song_task(2)}),
+    (True, True, {song_task(2), song_task(3), song_task(4)}),
+])
+def test_should_run(journal_path, resume, retry_failed, expected):
+    interrupted_run(journal_path)
+    journal = BuildJournal.read(journal_path)
+    tasks = [toc_task("1"), song_task(1), song_task(2), song_task(3), song_task(4)]
+    assert {task for task in tasks if journal.should_run(task, resume, retry_failed)} == expected
+
+def test_retried_task_that_succeeds_is_no_longer_failed(journal_path):
+    interrupted_run(journal_path)
+    journal = BuildJournal.read(journal_path)
+    journal.continue_run(resume=False, retry_failed=True)
+    journal.record(song_task(2), STARTED)
+    journal.record(song_task(2), DONE)
+    replayed = BuildJournal.read(journal_path)
+    assert replayed.states[song_task(2)] == DONE
+    assert replayed.failures == {}
+
+def test_torn_last_line_is_ignored_and_dropped_on_continue(journal_path):
+    interrupted_run(journal_path)
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"event": "task", "task": "song:3", "sta')
+    journal = BuildJournal.read(journal_path)
+    assert journal.states[song_task(3)] == STARTED
+
+    journal.continue_run(resume=True, retry_failed=False)
+    journal.record(song_task(3), DONE)
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert records[-2]["event"] == "continue" and records[-2]["modes"] == ["resume"]
+    assert BuildJournal.read(journal_path).states[song_task(3)] == DONE
+
+def test_new_run_replaces_the_journal(journal_path):
+    interrupted_run(journal_path)
+    BuildJournal.start(journal_path, "singer", "other-sha", (1, 2))
+    journal = BuildJournal.read(journal_path)
+    assert journal.states == {}
+    assert journal.header["shard"] == [1, 2]
+
+def test_other_files_are_not_journals(tmp_path):
+    path = tmp_path / "not_a_journal.jsonl"
+    path.write_text('{"event": "run", "format_version": 999}\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        BuildJournal.read(str(path))
+    with pytest.raises(FileNotFoundError):
+        BuildJournal.read(str(tmp_path / "missing.jsonl"))
+
+def test_continuing_after_the_catalog_changed_is_refused(tmp_path, journal_path):
+    from generate_full_songbook import open_journal
+
+    songs_json = tmp_path / "songs.json"
+    songs_json.write_text('[{"inner_id": 1}]', encoding='utf-8')
+    journal = open_journal("singer", journal_path, str(songs_json), None, resume=False, retry_failed=False)
+    journal.record(song_task(1), DONE)
+    assert open_journal("singer", journal_path, str(songs_json), None, resume=True, retry_failed=False) is not None
+
+    songs_json.write_text('[{"inner_id": 1}, {"inner_id": 2}]', encoding='utf-8')
+    assert open_journal("singer", journal_path, str(songs_json), None, resume=True, retry_failed=False) is None
+    assert open_journal("singer", str(tmp_path / "missing.jsonl"), str(songs_json), None,
+                        resume=True, retry_failed=False) is None
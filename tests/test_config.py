@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from config import CONFIG_FILE_PATH, FEATURE_SECTIONS, ConfigError, parse_config
+
+def load_raw():
+    with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("name", FEATURE_SECTIONS)
+def test_missing_feature_section_fails_validation(name):
+    raw = load_raw()
+    del raw[name]
+    with pytest.raises(ConfigError, match=name):
+        parse_config(raw)
+
+@pytest.mark.parametrize("section, key", [
+    ("paths", "prepared_cache_filename"),
+    ("file_names", "build_journal"),
+    ("templates", "update_pack_report"),
+])
+def test_missing_key_fails_validation(section, key):
+    raw = load_raw()
+    del raw[section][key]
+    with pytest.raises(ConfigError, match=key):
+        parse_config(raw)
+
+def test_missing_key_of_a_feature_section_fails_when_the_feature_is_used():
+    raw = load_raw()
+    del raw["scheduling"]["history_weight"]
+    config = parse_config(raw)
+    with pytest.raises(ConfigError, match="history_weight"):
+        config.scheduling
+
+def test_feature_section_is_validated_when_used():
+    raw = load_raw()
+    raw["imposition"]["signature_pages"] = 6
+    config = parse_config(raw)
+    # Features that do not use the section are not affected
+    assert config.conversion["timeout_seconds"] > 0
+    with pytest.raises(ConfigError, match="signature_pages"):
+        config.imposition
+
+def test_required_sections_are_still_checked():
+    raw = load_raw()
+    del raw["lyrics"]
+    with pytest.raises(ConfigError, match="lyrics"):
+        parse_config(raw)
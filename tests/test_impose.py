@@ -0,0 +1,144 @@
+import pytest
+
+from impose import _rotation_matrix, imposition_order, signature_sizes
+
+@pytest.mark.parametrize("page_count, signature_pages, expected", [
+    (0, 16, []),
+    (1, 16, [4]),
+    (16, 16, [16]),
+    (17, 16, [16, 4]),
+    (30, 16, [16, 16]),
+    (30, 0, [32]),
+    (8, 0, [8]),
+])
+def test_signature_sizes(page_count, signature_pages, expected):
+    assert signature_sizes(page_count, signature_pages) == expected
+
+def test_imposition_order_of_one_signature():
+    assert imposition_order(8, 0) == [(7, 0), (1, 6), (5, 2), (3, 4)]
+
+def test_short_book_is_padded_with_blanks_at_the_end():
+    assert imposition_order(6, 0) == [(None, 0), (1, None), (5, 2), (3, 4)]
+
+def read_folded(sides, page_count, signature_pages):
+    """The page order of the printed sheets after folding each signature and gathering them."""
+    order = []
+    position = 0
+    for size in signature_sizes(page_count, signature_pages):
+        sheets = [sides[position + 2 * sheet: position + 2 * sheet + 2] for sheet in range(size // 4)]
+        # Going in: the right half of each front and the left half of each back, outermost sheet first
+        for front, back in sheets:
+            order += [front[1], back[0]]
+        # Coming out: the right half of each back and the left half of each front, innermost sheet first
+        for front, back in reversed(sheets):
+            order += [back[1], front[0]]
+        position += size // 2
+    return order
+
+@pytest.mark.parametrize("page_count", [1, 4, 7, 16, 17, 33, 64, 100])
+@pytest.mark.parametrize("signature_pages", [0, 4, 16, 32])
+def test_folded_sheets_read_in_page_order(page_count, signature_pages):
+    sides = imposition_order(page_count, signature_pages)
+    assert len(sides) == sum(signature_sizes(page_count, signature_pages)) // 2
+    pages = read_folded(sides, page_count, signature_pages)
+    assert pages == list(range(page_count)) + [None] * (len(pages) - page_count)
+
+def make_pdf(path, first_page, page_count, compress=False, rotate=0):
+    from PyPDF2 import PdfWriter, PageObject
+    from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+    writer = PdfWriter()
+    for number in range(first_page, first_page + page_count):
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 24 Tf 100 700 Td (Page {number}) Tj ET".encode('ascii'))
+        page = PageObject.create_blank_page(None, 420, 595)
+        # An indirect font per page, so copying resources has to tell the source files apart
+        font = writer._add_object(DictionaryObject({NameObject('/Type'): NameObject('/Font'),
+                                                    NameObject('/Subtype'): NameObject('/Type1'),
+                                                    NameObject('/BaseFont'): NameObject(f'/Page{number}')}))
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+        page[NameObject('/Contents')] = writer._add_object(content.flate_encode() if compress else content)
+        if rotate:
+            page[NameObject('/Rotate')] = NumberObject(rotate)
+        writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+def test_impose_places_every_page_on_its_side(tmp_path):
+    pytest.importorskip("PyPDF2")
+    from PyPDF2 import PdfReader
+    from impose import impose
+
+    # Pages spread over several files, one of them with compressed content
+    paths = []
+    for index, (first_page, page_count) in enumerate(((0, 3), (3, 6), (9, 2))):
+        paths.append(str(tmp_path / f"song_{index}.pdf"))
+        make_pdf(paths[-1], first_page, page_count, compress=index == 1)
+    output_path = str(tmp_path / "booklet.pdf")
+
+    assert impose(paths, output_path, signature_pages=8, sheet_size="auto", crop_marks=False) == 3
+    reader = PdfReader(output_path)
+    sides = imposition_order(11, 8)
+    assert len(reader.pages) == len(sides)
+    for sheet_side, side in zip(reader.pages, sides):
+        assert float(sheet_side.mediabox.width) == pytest.approx(840)
+        xobjects = sheet_side['/Resources']['/XObject']
+        for position, index in enumerate(side):
+            name = f"/P{position}"
+            if index is None:
+                assert name not in xobjects
+            else:
+                assert f"(Page {index})".encode('ascii') in xobjects[name].get_object().get_data()
+
+def test_pages_of_many_source_files_are_not_mixed_up(tmp_path):
+    pytest.importorskip("PyPDF2")
+    from PyPDF2 import PdfReader
+    from impose import impose
+
+    # One page per file, as with the per-song PDFs: every reader is freed early on purpose
+    paths = []
+    for index in range(40):
+        paths.append(str(tmp_path / f"song_{index}.pdf"))
+        make_pdf(paths[-1], index, 1, compress=index % 2 == 1)
+    output_path = str(tmp_path / "booklet.pdf")
+    impose(paths, output_path, signature_pages=16, sheet_size="auto", crop_marks=False)
+
+    placed = []
+    for sheet_side, side in zip(PdfReader(output_path).pages, imposition_order(40, 16)):
+        xobjects = sheet_side['/Resources']['/XObject']
+        for position, index in enumerate(side):
+            form = xobjects[f"/P{position}"].get_object()
+            placed.append((index, form.get_data(), form['/Resources']['/Font']['/F1']['/BaseFont']))
+    assert sorted(placed) == [(index, f"BT /F1 24 Tf 100 700 Td (Page {index}) Tj ET".encode('ascii'),
+                               f"/Page{index}") for index in range(40)]
+
+@pytest.mark.parametrize("rotation", [90, 180, 270])
+def test_rotation_matrix_turns_the_page_as_it_is_shown(rotation):
+    left, bottom, width, height = 10, 20, 420, 595
+    a, b, c, d, e, f = _rotation_matrix(rotation, left, bottom, width, height)
+
+    def shown(x, y):
+        return a * x + c * y + e, b * x + d * y + f
+    shown_width, shown_height = (height, width) if rotation in (90, 270) else (width, height)
+    # Turning clockwise, the page's top left corner ends up at the top right, bottom right or bottom left
+    top_left = {90: (shown_width, shown_height), 180: (shown_width, 0), 270: (0, 0)}[rotation]
+    assert shown(left, bottom + height) == top_left
+    corners = {shown(x, y) for x in (left, left + width) for y in (bottom, bottom + height)}
+    assert corners == {(0, 0), (shown_width, 0), (0, shown_height), (shown_width, shown_height)}
+
+def test_rotated_pages_are_placed_as_shown(tmp_path):
+    pytest.importorskip("PyPDF2")
+    from PyPDF2 import PdfReader
+    from impose import impose
+
+    path = str(tmp_path / "landscape.pdf")
+    make_pdf(path, 0, 4, rotate=90)
+    output_path = str(tmp_path / "booklet.pdf")
+    impose([path], output_path, signature_pages=0, sheet_size="auto", crop_marks=False)
+
+    sheet_side = PdfReader(output_path).pages[0]
+    # Two 595 x 420 landscape pages side by side
+    assert (float(sheet_side.mediabox.width), float(sheet_side.mediabox.height)) == pytest.approx((1190, 420))
+    form = sheet_side['/Resources']['/XObject']['/P0'].get_object()
+    assert [float(value) for value in form['/Matrix']] == [0, -1, 1, 0, 0, 420]
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import lyrics_search
+from lyrics_search import INDEX_FORMAT_VERSION, LyricsSearchIndex, fold_accents, tokenize, update_search_index
+
+def song(inner_id, title, lyrics, author=""):
+    return {"id": f"H{inner_id:02d}", "inner_id": str(inner_id), "title": title, "author": author,
+            "lyrics": lyrics, "lyrics_with_chords": "", "youtube": ""}
+
+SONGS = [
+    song(1, "Hátikvá", "lihjot ám ḥofsi beárcenu,\nerec Cion virusálájim.", "Naftali Herz Imber"),
+    song(2, "Jerusálájim sel zahav", "Avir harim cálul kájájin"),
+    song(3, "Hava nagila", "Hava nagila venism'ha"),
+    song(4, "Hevenu salom alechem", "Hevenu salom alechem, hava"),
+]
+
+def index_of(songs):
+    index = LyricsSearchIndex()
+    index.update(songs)
+    return index
+
+def titles(results):
+    return [result["title"] for result in results]
+
+def test_accents_are_folded():
+    assert fold_accents("Ḥofsi Beárcenu") == "hofsi bearcenu"
+    assert tokenize("Jerusálájim, ŐSZ-ÜŰ!") == ["jerusalajim", "osz", "uu"]
+    assert tokenize(None) == []
+
+def test_search_ignores_accents_and_matches_prefixes():
+    index = index_of(SONGS)
+    assert titles(index.search("hofsi")) == ["Hátikvá"]
+    assert titles(index.search("HOFSI BEARCENU")) == ["Hátikvá"]
+    # A half remembered word matches as a prefix, in the title as well as in the lyrics
+    assert titles(index.search("jerusal")) == ["Jerusálájim sel zahav"]
+    assert titles(index.search("virusal")) == ["Hátikvá"]
+    assert index.search("") == [] and index.search("xyz") == []
+
+def test_title_matches_rank_above_lyrics_matches():
+    results = index_of(SONGS).search("hava")
+    assert titles(results) == ["Hava nagila", "Hevenu salom alechem"]
+    assert results[0]["score"] > results[1]["score"]
+
+def test_songs_matching_every_word_rank_first():
+    results = index_of(SONGS).search("hava salom")
+    assert titles(results) == ["Hevenu salom alechem"]
+    assert results[0]["matched_all"]
+
+    # Without a song matching both words, partial matches are returned
+    results = index_of(SONGS).search("nagila zahav")
+    assert set(titles(results)) == {"Hava nagila", "Jerusálájim sel zahav"}
+    assert not any(result["matched_all"] for result in results)
+
+def test_update_matches_a_fresh_index():
+    index = index_of(SONGS)
+    changed = dict(SONGS[2], lyrics="Uru ahim belev same'ah")
+    added = song(5, "Erev shel shoshanim", "Erev shel shoshanim")
+    assert index.update([SONGS[0], SONGS[1], changed, added]) == (1, 1, 1)
+
+    fresh = index_of([SONGS[0], SONGS[1], changed, added])
+    assert index.docs == fresh.docs
+    assert {term: lyrics_search._decode_postings(encoded) for term, encoded in index.postings.items()} == \
+        {term: lyrics_search._decode_postings(encoded) for term, encoded in fresh.postings.items()}
+    assert index.search("venism") == [] and titles(index.search("uru ahim")) == ["Hava nagila"]
+    assert index.search("alechem") == []
+    assert titles(index.search("shoshanim")) == ["Erev shel shoshanim"]
+
+def test_update_only_decodes_the_terms_of_changed_songs(monkeypatch):
+    index = index_of(SONGS)
+    decoded = []
+    decode = lyrics_search._decode_postings
+    monkeypatch.setattr(lyrics_search, "_decode_postings", lambda encoded: decoded.append(encoded) or decode(encoded))
+
+    assert index.update(SONGS) == (0, 0, 0)
+    assert decoded == []
+    index.update(SONGS[:3] + [dict(SONGS[3], lyrics="Hevenu salom")])
+    # The old and new terms of song 4 only
+    assert len(decoded) == len(set(tokenize("Hevenu salom alechem hava")))
+
+def test_index_is_saved_and_reused(tmp_path, capsys):
+    catalog_path = tmp_path / "songs.json"
+    catalog_path.write_text(json.dumps(SONGS, ensure_ascii=False), encoding='utf-8')
+    index_path = str(tmp_path / "search_index.json")
+    update_search_index(str(catalog_path), index_path)
+    assert "4 added" in capsys.readouterr().out
+
+    index = update_search_index(str(catalog_path), index_path)
+    # The catalog did not change, so nothing was read or written
+    assert capsys.readouterr().out == ""
+    assert titles(index.search("hofsi")) == ["Hátikvá"]
+
+def test_index_of_an_old_format_is_rebuilt(tmp_path):
+    index_path = tmp_path / "search_index.json"
+    index_path.write_text(json.dumps({"format_version": INDEX_FORMAT_VERSION - 1, "docs": {"1": {}},
+                                      "postings": {}}), encoding='utf-8')
+    assert LyricsSearchIndex.load(str(index_path)).docs == {}
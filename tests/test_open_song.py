@@ -0,0 +1,46 @@
+import os
+import sys
+import subprocess
+
+import open_song
+from open_song import find_song, open_at_page
+from page_index import write_page_index
+
+INDEX = {"songs": {
+    "1": {"id": "H01", "title": "Hátikvá", "start_page": 3, "page_count": 2},
+    "12": {"id": "H12", "title": "Hava nagila", "start_page": 5, "page_count": 1},
+    "40": {"id": None, "title": None, "start_page": 6, "page_count": 1},
+}}
+
+def test_find_song_by_id_or_inner_id():
+    assert find_song(INDEX, song_id="h12") == ("12", INDEX["songs"]["12"])
+    assert find_song(INDEX, inner_id=1) == ("1", INDEX["songs"]["1"])
+    assert find_song(INDEX, song_id="H99") == (None, None)
+    assert find_song(INDEX, inner_id="99") == (None, None)
+
+def test_open_with_a_viewer_command(monkeypatch):
+    commands = []
+    monkeypatch.setattr(open_song.subprocess, "Popen", commands.append)
+    open_at_page("/books/singer book.pdf", 5, 'evince --page-index={page} "{file}"')
+    assert commands == [["evince", "--page-index=5", "/books/singer book.pdf"]]
+
+def test_open_in_the_default_viewer(monkeypatch):
+    urls = []
+    monkeypatch.setattr(open_song.webbrowser, "open", urls.append)
+    open_at_page("book.pdf", 5)
+    assert urls == [f"file://{os.path.abspath('book.pdf')}#page=5"]
+
+def test_print_page(tmp_path):
+    entries = [{"page": 1, "source": "toc.pdf", "source_page": 1, "kind": "toc", "inner_id": None, "sha256": "a"},
+               {"page": 2, "source": "song_12.pdf", "source_page": 1, "kind": "song", "inner_id": "12", "sha256": "b"}]
+    write_page_index(str(tmp_path / "singer_SironSongbook_Merged.pdf"), "singer", entries,
+                     {"12": {"id": "H12", "title": "Hava nagila"}})
+    script = os.path.join(os.path.dirname(open_song.__file__), "open_song.py")
+
+    def run(*args):
+        return subprocess.run([sys.executable, script, "--version", "singer", "--output-dir", str(tmp_path),
+                               "--print-page", *args], capture_output=True, text=True)
+    found = run("--id", "H12")
+    assert (found.returncode, found.stdout) == (0, "2\n")
+    missing = run("--inner-id", "1")
+    assert missing.returncode == 1 and "not in the singer songbook" in missing.stdout
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from page_index import page_index_path, read_page_index, song_pages, write_page_index
+
+def entry(page, kind="song", inner_id="1", sha256="a"):
+    return {"page": page, "source": "toc.pdf" if kind == "toc" else f"song_{inner_id}.pdf", "source_page": 1,
+            "kind": kind, "inner_id": inner_id, "sha256": sha256}
+
+BOOK = [entry(1, "toc", None), entry(2, "toc", None), entry(3, inner_id="1"), entry(4, inner_id="1"),
+        entry(5, inner_id="2"), entry(6, inner_id="10")]
+
+def test_song_pages():
+    assert song_pages(BOOK) == {"1": (3, 2), "2": (5, 1), "10": (6, 1)}
+    assert song_pages(BOOK[:2]) == {}
+
+def test_page_index_has_every_song_and_page(tmp_path):
+    merged_pdf = str(tmp_path / "singer_SironSongbook_Merged.pdf")
+    path = write_page_index(merged_pdf, "singer", BOOK, {"1": {"id": "H01", "title": "Hátikvá"}})
+    assert path == page_index_path(merged_pdf) == str(tmp_path / "singer_SironSongbook_Merged.pages.json")
+
+    index = read_page_index(path)
+    assert (index["version"], index["merged_pdf"], index["page_count"]) == ("singer", "singer_SironSongbook_Merged.pdf", 6)
+    assert index["songs"]["1"] == {"id": "H01", "title": "Hátikvá", "start_page": 3, "page_count": 2}
+    assert index["songs"]["2"] == {"id": None, "title": None, "start_page": 5, "page_count": 1}
+    assert index["pages"] == BOOK
+
+def test_previous_index_is_kept_when_the_pages_change(tmp_path):
+    merged_pdf = str(tmp_path / "singer_SironSongbook_Merged.pdf")
+    previous_path = page_index_path(merged_pdf, previous=True)
+    write_page_index(merged_pdf, "singer", BOOK)
+
+    # Rebuilding unchanged pages does not replace the previous build's index
+    write_page_index(merged_pdf, "singer", BOOK)
+    assert not (tmp_path / "singer_SironSongbook_Merged.pages.previous.json").exists()
+
+    changed = BOOK[:4] + [entry(5, inner_id="2", sha256="b")]
+    write_page_index(merged_pdf, "singer", changed)
+    assert read_page_index(previous_path)["pages"] == BOOK
+    assert read_page_index(page_index_path(merged_pdf))["pages"] == changed
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "singer_SironSongbook_Merged.pages.json", "singer_SironSongbook_Merged.pages.previous.json"]
+
+def test_index_of_another_format_is_refused(tmp_path):
+    path = tmp_path / "book.pages.json"
+    path.write_text(json.dumps({"format_version": 999, "pages": []}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        read_page_index(str(path))
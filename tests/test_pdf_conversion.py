@@ -0,0 +1,164 @@
+import io
+import os
+import json
+import time
+import stat
+
+import pytest
+
+import pdf_conversion
+from pdf_conversion import ConversionError, convert_html, write_failure_report
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="the fake wkhtmltopdf is a shell script")
+
+def make_fake(tmp_path, name, body):
+    """Write an executable fake wkhtmltopdf shell script and return its path."""
+    path = tmp_path / name
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+def is_running(pid):
+    """Whether pid is a live process (a zombie waiting to be reaped counts as finished)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+@pytest.fixture
+def conversion_settings(monkeypatch):
+    settings = pdf_conversion.CONFIG.conversion
+    for key, value in (("timeout_seconds", 1), ("retries", 1), ("retry_backoff_seconds", 0.1)):
+        monkeypatch.setitem(settings, key, value)
+    return settings
+
+def test_hanging_converter_is_killed_with_its_children(tmp_path, monkeypatch, conversion_settings):
+    pid_file = tmp_path / "pids"
+    # Starts a grandchild too: the timeout must kill the whole process tree
+    fake = make_fake(tmp_path, "hang.sh", f'sleep 100 &\necho $! >> "{pid_file}"\necho $$ >> "{pid_file}"\nwait\n')
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", fake)
+    monkeypatch.setitem(conversion_settings, "retries", 0)
+
+    start = time.monotonic()
+    with pytest.raises(ConversionError) as error:
+        convert_html("<html></html>", [], "test page")
+    elapsed = time.monotonic() - start
+
+    assert error.value.details["timed_out"]
+    assert elapsed < conversion_settings["timeout_seconds"] + 2
+    pids = [int(line) for line in pid_file.read_text().split()]
+    assert len(pids) == 2
+    deadline = time.monotonic() + 2
+    while any(is_running(pid) for pid in pids) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(is_running(pid) for pid in pids)
+
+def test_crashing_converter_fails_after_every_retry(tmp_path, monkeypatch, conversion_settings):
+    runs_file = tmp_path / "runs"
+    fake = make_fake(tmp_path, "crash.sh", f'cat > /dev/null\necho run >> "{runs_file}"\n'
+                                           'echo "Segmentation fault" >&2\nexit 2\n')
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", fake)
+
+    with pytest.raises(ConversionError) as error:
+        convert_html("<html></html>", [], "test page")
+
+    details = error.value.details
+    assert details["attempts"] == conversion_settings["retries"] + 1
+    assert details["returncode"] == 2
+    assert details["reason"] == "exited with code 2"
+    assert "Segmentation fault" in details["output_tail"]
+    assert len(runs_file.read_text().split()) == conversion_settings["retries"] + 1
+
+def pdf_fake(tmp_path, name, output, exit_code):
+    """A fake wkhtmltopdf that reads the HTML, writes output to stdout and exits with exit_code."""
+    output_path = tmp_path / f"{name}.out"
+    output_path.write_bytes(output)
+    return make_fake(tmp_path, name, f'cat > /dev/null\ncat "{output_path}"\nexit {exit_code}\n')
+
+def blank_pdf():
+    from PyPDF2 import PdfWriter
+    writer = PdfWriter()
+    writer.add_blank_page(595, 842)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def test_pdf_from_a_crashed_run_is_rejected(tmp_path, monkeypatch, conversion_settings):
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", pdf_fake(tmp_path, "segfault.sh", b"%PDF-1.4\n1 0 obj <<", 139))
+    with pytest.raises(ConversionError) as error:
+        convert_html("<html></html>", [], "test page")
+    assert error.value.details["reason"] == "exited with code 139"
+
+def test_complete_pdf_from_a_crashed_run_is_rejected(tmp_path, monkeypatch, conversion_settings):
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", pdf_fake(tmp_path, "crash.sh", blank_pdf(), 2))
+    with pytest.raises(ConversionError):
+        convert_html("<html></html>", [], "test page")
+
+def test_exit_code_1_is_accepted_with_a_complete_pdf(tmp_path, monkeypatch, conversion_settings):
+    pdf = blank_pdf()
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", pdf_fake(tmp_path, "warn.sh", pdf, 1))
+    assert convert_html("<html></html>", [], "test page") == pdf
+
+@pytest.mark.parametrize("damage", ["truncated", "unparsable"])
+def test_exit_code_1_with_an_incomplete_pdf_is_rejected(tmp_path, monkeypatch, conversion_settings, damage):
+    output = blank_pdf()[:-20] if damage == "truncated" else b"%PDF-1.4\n1 0 obj <<\n%%EOF\n"
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", pdf_fake(tmp_path, "warn.sh", output, 1))
+    with pytest.raises(ConversionError) as error:
+        convert_html("<html></html>", [], "test page")
+    assert error.value.details["reason"] == "exited with code 1 and an incomplete PDF"
+
+def test_output_of_a_failed_run_is_not_cached(tmp_path, monkeypatch, conversion_settings):
+    import artifact_store
+    import generate_songbook_page
+
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", pdf_fake(tmp_path, "segfault.sh", b"%PDF-1.4\n1 0 obj <<", 139))
+    monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setitem(artifact_store.CONFIG.artifact_store, "enabled", True)
+    artifact_store.get_artifact_store.cache_clear()
+    try:
+        output_path = tmp_path / "song_1.pdf"
+        with pytest.raises(ConversionError):
+            generate_songbook_page.html_to_pdf("<html></html>", str(output_path), "singer")
+        assert artifact_store.get_artifact_store().stats()["entries"] == 0
+        assert not output_path.exists()
+    finally:
+        artifact_store.get_artifact_store.cache_clear()
+
+def test_missing_converter_is_not_retried(tmp_path, monkeypatch, conversion_settings):
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", str(tmp_path / "missing"))
+    with pytest.raises(ConversionError) as error:
+        convert_html("<html></html>", [], "test page")
+    assert error.value.details["attempts"] == 1
+
+def test_failure_report(tmp_path):
+    report_path = tmp_path / "reports" / "failed_songs_singer.json"
+    failures = [{"stage": "song", "inner_id": "7", "reason": "exited with code 2", "attempts": 3}]
+    write_failure_report(str(report_path), "singer", failures)
+
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    assert report["version"] == "singer"
+    assert report["failed_count"] == 1
+    assert report["failures"] == failures
+    assert [path.name for path in report_path.parent.iterdir()] == [report_path.name]
+
+def test_failed_build_writes_failure_report(tmp_path, monkeypatch):
+    import generate_full_songbook
+
+    songs_json = tmp_path / "songs.json"
+    songs_json.write_text(json.dumps([{"id": "H01", "inner_id": 1, "title": "Teszt", "author": "", "category": "",
+                                       "lyrics": "La la", "lyrics_with_chords": "La la", "youtube": ""}]),
+                          encoding='utf-8')
+    # The page scripts read the retry settings from config.json; a converter that cannot
+    # be started fails without being retried
+    monkeypatch.setenv("WKHTMLTOPDF_PATH", str(tmp_path / "missing"))
+    monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmp_path / "artifacts"))
+
+    output_dir = tmp_path / "output"
+    generate_full_songbook.generate_full_songbook("singer", str(songs_json), None, str(output_dir))
+
+    report = json.loads((output_dir / "failed_songs_singer.json").read_text(encoding='utf-8'))
+    assert report["version"] == "singer"
+    assert report["failed_count"] == 1
+    failure = report["failures"][0]
+    assert (failure["stage"], failure["toc_version"], failure["reason"]) == ("toc", "1", "exited with code 1")
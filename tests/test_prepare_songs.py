@@ -0,0 +1,102 @@
+import json
+import sqlite3
+import threading
+
+from prepare_songs import PreparedSongs, prepare_catalog
+from song_catalog import open_catalog
+
+SONGS = [{"inner_id": inner_id, "lyrics": f"Első sor {inner_id}\nMásodik sor", "lyrics_with_chords": "",
+          "youtube": ""} for inner_id in range(1, 4)]
+
+def test_saved_entries_are_read_back_one_at_a_time(tmp_path):
+    cache_path = str(tmp_path / "prepared_songs.db")
+    prepared = PreparedSongs.load(cache_path)
+    fields = [prepared.get(song, "projection") for song in SONGS]
+    assert (prepared.misses, prepared.hits) == (3, 0)
+    prepared.save()
+    assert len(prepared) == 3
+
+    reopened = PreparedSongs.load(cache_path)
+    assert reopened.get(SONGS[1], "projection") == fields[1]
+    assert (reopened.misses, reopened.hits) == (0, 1)
+    # Only the entry asked for was read
+    assert list(reopened.entries) == [reopened.key(SONGS[1], "projection")]
+
+def test_changed_song_misses_and_save_drops_stale_entries(tmp_path):
+    cache_path = str(tmp_path / "prepared_songs.db")
+    prepared = PreparedSongs.load(cache_path)
+    for song in SONGS:
+        prepared.get(song, "projection")
+    prepared.save()
+
+    changed = dict(SONGS[0], lyrics="Új sor")
+    prepared = PreparedSongs.load(cache_path)
+    keep_keys = set()
+    for song in [changed] + SONGS[1:]:
+        prepared.get(song, "projection")
+        keep_keys.add(prepared.key(song, "projection"))
+    assert (prepared.misses, prepared.hits) == (1, 2)
+    prepared.save(keep_keys)
+    assert len(PreparedSongs.load(cache_path)) == 3
+
+def test_outdated_cache_is_started_again(tmp_path):
+    cache_path = str(tmp_path / "prepared_songs.db")
+    connection = sqlite3.connect(cache_path)
+    connection.execute("CREATE TABLE prepared (key TEXT, fields TEXT, format TEXT)")
+    connection.execute("INSERT INTO prepared VALUES ('old', '{}', 'old')")
+    connection.commit()
+    connection.close()
+
+    prepared = PreparedSongs.load(cache_path)
+    assert len(prepared) == 0
+    prepared.get(SONGS[0], "projection")
+    prepared.save()
+    reopened = PreparedSongs.load(cache_path)
+    assert len(reopened) == 1
+    assert reopened.get(SONGS[0], "projection")["columns"] == 1
+
+def test_file_that_is_not_a_cache_is_left_alone(tmp_path, capsys):
+    cache_path = tmp_path / "prepared_songs.db"
+    old_cache = json.dumps({"format_version": 1, "entries": {}})
+    cache_path.write_text(old_cache, encoding='utf-8')
+    prepared = PreparedSongs.load(str(cache_path))
+    assert len(prepared) == 0
+    assert prepared.get(SONGS[0], "projection")["columns"] == 1
+    prepared.save()
+    assert cache_path.read_text(encoding='utf-8') == old_cache
+    assert "--rebuild" in capsys.readouterr().out
+
+def test_concurrent_saves_keep_every_entry(tmp_path):
+    # Like shards of one build, each saving the songs it prepared into a new cache file
+    cache_path = str(tmp_path / "prepared_songs.db")
+    songs = [dict(SONGS[0], inner_id=inner_id, lyrics=f"Sor {inner_id}") for inner_id in range(40)]
+    shards = [songs[shard::4] for shard in range(4)]
+    errors = []
+
+    def save_shard(shard_songs):
+        try:
+            for song in shard_songs:
+                prepared = PreparedSongs.load(cache_path)
+                prepared.get(song, "projection")
+                prepared.save()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=save_shard, args=(shard_songs,)) for shard_songs in shards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(PreparedSongs.load(cache_path)) == len(songs)
+
+def test_prepare_catalog_prepares_only_the_given_songs(tmp_path):
+    songs_json = tmp_path / "songs.json"
+    songs_json.write_text(json.dumps([dict(song, title=f"Dal {song['inner_id']}") for song in SONGS]),
+                          encoding='utf-8')
+    cache_path = str(tmp_path / "prepared_songs.db")
+    shard_songs = [song for song in open_catalog(str(songs_json)) if song.inner_id != 2]
+
+    prepared = prepare_catalog(str(songs_json), cache_path, ("projection",), songs=shard_songs)
+    assert prepared.misses == 2
+    assert len(PreparedSongs.load(cache_path)) == 2
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from render_history import (CONFIG, HISTORY_FORMAT_VERSION, RenderHistory, longest_first, predicted_makespan)
+from sharding import estimate_page_cost
+
+def song(inner_id, lines):
+    return {"inner_id": inner_id, "lyrics": "sor\n" * lines, "lyrics_with_chords": "", "youtube": ""}
+
+@pytest.fixture
+def history_weight(monkeypatch):
+    monkeypatch.setitem(CONFIG.scheduling, "history_weight", 0.25)
+    return 0.25
+
+def test_record_keeps_a_moving_average(tmp_path, history_weight):
+    history = RenderHistory(str(tmp_path / "render_history.json"))
+    history.record("singer", 1, 4.0)
+    assert history.entries["singer:1"] == {"seconds": 4.0, "runs": 1}
+    history.record("singer", 1, 8.0)
+    assert history.entries["singer:1"] == {"seconds": 0.25 * 8.0 + 0.75 * 4.0, "runs": 2}
+    history.record("singer", 1, 8.0)
+    assert history.duration("singer", 1) == pytest.approx(0.25 * 8.0 + 0.75 * 5.0, abs=0.001)
+    # Editions are timed separately
+    assert history.duration("musician", 1) is None
+
+def test_predict_uses_history_and_scales_estimates_by_the_median_ratio(tmp_path):
+    history = RenderHistory(str(tmp_path / "render_history.json"))
+    songs = [song(1, 0), song(2, 40), song(3, 80), song(4, 120)]
+    costs = [estimate_page_cost(song, "projection") for song in songs]
+    # Songs 1-3 took 3, 5 and 7 seconds per unit of cost, so the median is 5
+    for index, seconds_per_cost in ((0, 3), (1, 5), (2, 7)):
+        history.entries[f"projection:{index + 1}"] = {"seconds": costs[index] * seconds_per_cost, "runs": 1}
+
+    predictions = history.predict(songs, "projection")
+    assert predictions["1"] == (costs[0] * 3, "history")
+    assert predictions["4"] == (pytest.approx(costs[3] * 5), "estimate")
+
+def test_predict_without_history_uses_the_default_ratio(tmp_path):
+    predictions = RenderHistory(str(tmp_path / "missing.json")).predict([song(1, 40)], "singer")
+    assert predictions["1"] == (estimate_page_cost(song(1, 40), "singer")
+                                * CONFIG.scheduling['default_seconds_per_cost'], "estimate")
+
+def test_save_merges_with_entries_saved_by_other_builds(tmp_path):
+    path = str(tmp_path / "render_history.json")
+    first, second = RenderHistory.load(path), RenderHistory.load(path)
+    first.record("singer", 1, 2.0)
+    first.record("singer", 2, 3.0)
+    second.record("musician", 1, 5.0)
+    second.record("singer", 2, 9.0)
+    first.save()
+    second.save()
+
+    saved = RenderHistory.load(path)
+    # Each build's own entries win; entries it did not touch are kept
+    assert saved.entries == {"singer:1": {"seconds": 2.0, "runs": 1}, "singer:2": {"seconds": 9.0, "runs": 1},
+                             "musician:1": {"seconds": 5.0, "runs": 1}}
+    assert second.entries == saved.entries
+    with open(path, 'r', encoding='utf-8') as f:
+        assert json.load(f)["format_version"] == HISTORY_FORMAT_VERSION
+
+def test_unreadable_history_is_empty(tmp_path):
+    path = tmp_path / "render_history.json"
+    path.write_text("{not json", encoding='utf-8')
+    assert RenderHistory.load(str(path)).entries == {}
+    path.write_text(json.dumps({"format_version": HISTORY_FORMAT_VERSION + 1, "entries": {"singer:1": {}}}),
+                    encoding='utf-8')
+    assert RenderHistory.load(str(path)).entries == {}
+
+def test_longest_first_and_makespan():
+    songs = [song(1, 0), song(2, 0), song(3, 0), song(4, 0)]
+    predictions = {"1": (2.0, "history"), "2": (5.0, "history"), "3": (2.0, "estimate"), "4": (3.0, "history")}
+    ordered = longest_first(songs, predictions)
+    # Ties keep catalog order
+    assert [song["inner_id"] for song in ordered] == [2, 4, 1, 3]
+    # Longest first finishes sooner than the same pages shortest first
+    assert predicted_makespan([4.0, 3.0, 3.0, 2.0], 2) == 6.0
+    assert predicted_makespan([2.0, 3.0, 3.0, 4.0], 2) == 7.0
+    assert predicted_makespan([1.0, 2.0], 0) == 3.0
@@ -0,0 +1,122 @@
+import os
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import render_service
+from render_service import CONFIG, RenderRequestHandler, RenderService
+from song_catalog import CatalogChangedError
+
+def write_songs(path, titles):
+    songs = [{"id": f"H{number:02d}", "inner_id": str(number), "title": title, "author": "", "category": "",
+              "lyrics": f"{title} la la", "lyrics_with_chords": f"Am\n{title} la la", "youtube": ""}
+             for number, title in enumerate(titles, 1)]
+    path.write_text(json.dumps(songs, ensure_ascii=False), encoding='utf-8')
+
+@pytest.fixture
+def songs_json(tmp_path):
+    path = tmp_path / "songs.json"
+    write_songs(path, ["Hava nagila", "Sálom"])
+    return path
+
+@pytest.fixture
+def service(songs_json):
+    # A check interval of 0 looks for a changed songs.json on every request
+    return RenderService(str(songs_json), CONFIG.paths.templates_dir, 10 * 1024 * 1024, 2, 0)
+
+def rewrite(path, titles):
+    """Rewrite the catalog so its size or modification time differs from the loaded one."""
+    stat = os.stat(path)
+    write_songs(path, titles)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_second_render_is_a_cache_hit(service):
+    body, cache_hit = service.render("1", "singer", "html")
+    assert "Hava nagila" in body.decode('utf-8') and not cache_hit
+    assert service.render("1", "singer", "html") == (body, True)
+    assert service.render("1", "musician", "html")[1] is False
+    stats = service.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["songs"]) == (1, 2, 2, 2)
+
+def test_changed_catalog_clears_the_cache(service, songs_json):
+    service.render("1", "singer", "html")
+    rewrite(songs_json, ["Hevenu salom alechem", "Sálom"])
+    body, cache_hit = service.render("1", "singer", "html")
+    assert "Hevenu salom alechem" in body.decode('utf-8') and not cache_hit
+
+def test_page_rendered_from_a_replaced_catalog_is_not_cached(service, songs_json, monkeypatch):
+    render_template = render_service.render_template
+
+    def render_during_reload(*args, **kwargs):
+        # Another request reloads the catalog while this one is rendering the old song
+        html = render_template(*args, **kwargs)
+        rewrite(songs_json, ["Hevenu salom alechem", "Sálom"])
+        service._refresh_if_changed(force=True)
+        return html
+    monkeypatch.setattr(render_service, "render_template", render_during_reload)
+    assert "Hava nagila" in service.render("1", "singer", "html")[0].decode('utf-8')
+
+    monkeypatch.setattr(render_service, "render_template", render_template)
+    body, cache_hit = service.render("1", "singer", "html")
+    assert "Hevenu salom alechem" in body.decode('utf-8') and not cache_hit
+
+def test_catalog_changed_during_a_render_is_reloaded_and_retried(service, songs_json, monkeypatch):
+    rewrite(songs_json, ["Hevenu salom alechem", "Sálom"])
+    # The change is not noticed before the lyrics are read, so reading them fails first
+    monkeypatch.setattr(service, "check_interval", 3600)
+    body, _ = service.render("1", "singer", "html")
+    assert "Hevenu salom alechem" in body.decode('utf-8')
+
+@pytest.fixture
+def server(service):
+    RenderRequestHandler.service = service
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RenderRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    RenderRequestHandler.service = None
+
+def get(url):
+    """Return the status, headers and body of a GET request."""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+def test_song_page_is_served_with_its_cache_status(server):
+    status, headers, body = get(f"{server}/song/2?version=singer")
+    assert status == 200 and headers["X-Cache"] == "miss" and "Sálom" in body.decode('utf-8')
+    assert get(f"{server}/song/2?version=singer")[1]["X-Cache"] == "hit"
+
+@pytest.mark.parametrize("path, status", [
+    ("/song/99", 404),
+    ("/songs/1", 404),
+    ("/song/1?version=choir", 400),
+    ("/song/1?format=docx", 400),
+])
+def test_bad_requests(server, path, status):
+    response_status, headers, body = get(server + path)
+    assert response_status == status
+    assert headers["Content-Type"] == "application/json"
+    assert "error" in json.loads(body)
+
+def test_catalog_that_keeps_changing_asks_the_client_to_retry(server, service, monkeypatch):
+    def render(*args):
+        raise CatalogChangedError("songs.json changed on disk")
+    monkeypatch.setattr(service, "render", render)
+    status, headers, _ = get(f"{server}/song/1")
+    assert status == 503
+    assert headers["Retry-After"] == str(render_service.RETRY_AFTER_SECONDS)
+
+def test_unexpected_errors_are_answered_with_500(server, songs_json):
+    songs_json.write_text('[{"id": "H01", "inner_id": "1", "title": "Hava', encoding='utf-8')
+    status, _, body = get(f"{server}/song/1")
+    assert status == 500
+    assert "error" in json.loads(body)
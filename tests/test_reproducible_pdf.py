@@ -0,0 +1,84 @@
+import hashlib
+from io import BytesIO
+
+import pytest
+
+PyPDF2 = pytest.importorskip("PyPDF2")
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, ByteStringObject
+
+from reproducible_pdf import CONFIG, normalize_pdf_bytes, write_reproducible
+
+def wkhtmltopdf_render(creation_date, document_id):
+    """A one-page PDF laid out like wkhtmltopdf's: literal date strings and a hex /ID in the trailer."""
+    objects = [
+        b"<<\n/Type /Catalog\n/Pages 2 0 R\n>>",
+        b"<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>",
+        b"<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 595 842]\n/Resources <<\n>>\n>>",
+        b"<<\n/Title (Teszt)\n/Creator (wkhtmltopdf 0.12.6)\n/Producer (Qt 4.8.7)\n/CreationDate (D:"
+        + creation_date + b")\n>>",
+    ]
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += (b"trailer\n<<\n/Size %d\n/Root 1 0 R\n/Info 4 0 R\n/ID [<%s> <%s>]\n>>\nstartxref\n%d\n%%%%EOF\n"
+             % (len(objects) + 1, document_id, document_id, xref))
+    return data
+
+def make_writer(creation_date, document_id):
+    """A PyPDF2 writer of a one-page PDF that already has its own dates and /ID."""
+    writer = PdfWriter()
+    writer.add_blank_page(595, 842)
+    writer.add_metadata({"/CreationDate": creation_date, "/ModDate": creation_date, "/Creator": "wkhtmltopdf 0.12.6"})
+    # write_reproducible relies on these PyPDF2 internals
+    writer._ID = ArrayObject([ByteStringObject(document_id), ByteStringObject(document_id)])
+    return writer
+
+def to_bytes(writer):
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+@pytest.fixture(autouse=True)
+def source_date_epoch(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+
+def test_normalized_renders_hash_the_same():
+    first = wkhtmltopdf_render(b"20240101120000+01'00'", b"0123456789ABCDEF0123456789ABCDEF")
+    second = wkhtmltopdf_render(b"20250630235959+02'00'", b"FEDCBA9876543210FEDCBA9876543210")
+    assert sha256(first) != sha256(second)
+
+    first_normalized, second_normalized = normalize_pdf_bytes(first), normalize_pdf_bytes(second)
+    assert sha256(first_normalized) == sha256(second_normalized)
+    # Same-length replacements keep the xref offsets valid
+    assert len(first_normalized) == len(first)
+    reader = PdfReader(BytesIO(first_normalized), strict=True)
+    assert reader.metadata["/CreationDate"] == "D:20231114221320+00'00'"
+    assert reader.trailer["/ID"][0] != bytes.fromhex("0123456789ABCDEF0123456789ABCDEF")
+    assert len(reader.pages) == 1
+
+def test_normalized_id_depends_on_the_content():
+    first = wkhtmltopdf_render(b"20240101120000+01'00'", b"0123456789ABCDEF0123456789ABCDEF")
+    other = first.replace(b"(Teszt)", b"(Tesza)")
+    assert sha256(normalize_pdf_bytes(first)) != sha256(normalize_pdf_bytes(other))
+
+def test_write_reproducible_gives_identical_files(tmp_path):
+    paths = [tmp_path / "first.pdf", tmp_path / "second.pdf"]
+    write_reproducible(make_writer("D:20240101120000+01'00'", b"\x01" * 16), str(paths[0]))
+    write_reproducible(make_writer("D:20250630235959+02'00'", b"\xfe" * 16), str(paths[1]))
+    first, second = (path.read_bytes() for path in paths)
+    assert sha256(first) == sha256(second)
+
+    reader = PdfReader(BytesIO(first))
+    assert reader.metadata["/CreationDate"] == "D:20231114221320+00'00'"
+    assert reader.metadata["/Creator"] == reader.metadata["/Producer"] == CONFIG.reproducible_pdf['producer']
+    document_id = reader.trailer["/ID"][0]
+    assert document_id != b"\x01" * 16 and len(document_id) == 16
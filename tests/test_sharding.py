@@ -0,0 +1,53 @@
+import pytest
+
+from sharding import (assign_shards, estimate_page_cost, parse_shard_spec, read_shard_manifest,
+                      write_shard_manifest)
+
+def make_songs(count):
+    return [{"inner_id": inner_id, "lyrics": "sor\n" * (inner_id % 7 * 10), "lyrics_with_chords": "",
+             "youtube": "https://youtu.be/x" if inner_id % 3 == 0 else ""} for inner_id in range(1, count + 1)]
+
+@pytest.mark.parametrize("spec, expected", [("1/1", (1, 1)), ("2/4", (2, 4)), ("4/4", (4, 4))])
+def test_parse_shard_spec(spec, expected):
+    assert parse_shard_spec(spec) == expected
+
+@pytest.mark.parametrize("spec", ["0/4", "5/4", "1/0", "2", "a/b", "1/2/3"])
+def test_parse_shard_spec_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_shard_spec(spec)
+
+@pytest.mark.parametrize("strategy", ["hash", "balanced"])
+def test_every_song_gets_exactly_one_shard(strategy):
+    songs = make_songs(50)
+    assignment = assign_shards(songs, 4, "singer", strategy)
+    assert sorted(assignment) == sorted(str(song["inner_id"]) for song in songs)
+    assert set(assignment.values()) == {1, 2, 3, 4}
+    # Every agent computes the same split, whatever the order it reads the catalog in
+    assert assign_shards(list(reversed(songs)), 4, "singer", strategy) == assignment
+
+def test_hash_assignment_is_stable_when_songs_are_added():
+    songs = make_songs(40)
+    before = assign_shards(songs, 3, "singer", "hash")
+    after = assign_shards(songs + make_songs(60)[40:], 3, "singer", "hash")
+    assert all(after[inner_id] == shard for inner_id, shard in before.items())
+
+def test_balanced_assignment_evens_out_the_cost():
+    songs = make_songs(60)
+    assignment = assign_shards(songs, 3, "singer", "balanced")
+    loads = [0.0, 0.0, 0.0]
+    for song in songs:
+        loads[assignment[str(song["inner_id"])] - 1] += estimate_page_cost(song, "singer")
+    most_expensive = max(estimate_page_cost(song, "singer") for song in songs)
+    assert max(loads) - min(loads) <= most_expensive
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        assign_shards(make_songs(3), 2, "singer", "random")
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "shard_1_of_2.json")
+    write_shard_manifest(path, {"version": "singer", "shard": 1, "shards": 2, "assigned": ["1", "3"]})
+    manifest = read_shard_manifest(path)
+    assert manifest["assigned"] == ["1", "3"]
+    assert manifest["format_version"] == 1
+    assert [entry.name for entry in tmp_path.iterdir()] == ["shard_1_of_2.json"]
@@ -0,0 +1,96 @@
+import os
+import json
+
+import pytest
+
+from song_catalog import (CatalogChangedError, SongCatalog, _scan_json_array, hungarian_title_key, open_catalog,
+                          write_json_lines)
+
+SONGS = [
+    {"id": "H02", "inner_id": "2", "title": "Őszi dal", "author": "", "category": "Magyar", "youtube": "x",
+     "lyrics": "Első sor [nem tömb], \"idézet\"\nMásodik sor", "lyrics_with_chords": "Am\nElső sor"},
+    {"id": "H01", "inner_id": "1", "title": "Hátikvá", "author": "Naftali Herz Imber", "category": "Héber",
+     "lyrics": "Kol od báleváv penimá", "lyrics_with_chords": "Am  Dm\nKol od báleváv penimá"},
+    {"id": "H10", "inner_id": "10", "title": "Ábécé", "author": "", "category": "Magyar", "skip_toc": True,
+     "explicit_content": True, "lyrics": "ḥ ő ű 🎵", "lyrics_with_chords": ""},
+]
+
+@pytest.fixture
+def songs_json(tmp_path):
+    path = tmp_path / "songs.json"
+    # Indented like songs.json, so offsets have to skip whitespace and commas between songs
+    path.write_text(json.dumps(SONGS, ensure_ascii=False, indent=2), encoding='utf-8')
+    return path
+
+def test_scanner_finds_each_song_by_byte_offset(songs_json):
+    data = songs_json.read_bytes()
+    scanned = list(_scan_json_array(str(songs_json)))
+    assert [song for _, _, song in scanned] == SONGS
+    for offset, length, song in scanned:
+        assert json.loads(data[offset:offset + length]) == song
+
+@pytest.mark.parametrize("text", ["[]", "  [ \n ]\n", '[{"inner_id": "1"} ,\n\t{"inner_id": "2"}]'])
+def test_scanner_handles_empty_and_compact_arrays(tmp_path, text):
+    path = tmp_path / "songs.json"
+    path.write_text(text, encoding='utf-8')
+    assert [song for _, _, song in _scan_json_array(str(path))] == json.loads(text)
+
+def test_only_metadata_is_resident_and_lyrics_are_read_on_demand(songs_json, monkeypatch):
+    catalog = SongCatalog(str(songs_json))
+    song = catalog.get(10)
+    assert not hasattr(song, "__dict__")
+    assert (song["title"], song.get("skip_toc"), song.get("missing", "default")) == ("Ábécé", True, "default")
+
+    reads = []
+    load_song = catalog.load_song
+    monkeypatch.setattr(catalog, "load_song", lambda record: reads.append(record) or load_song(record))
+    assert catalog.get("1")["author"] == "Naftali Herz Imber"
+    assert reads == []
+    # Non-ASCII lyrics before a song must not shift its offset
+    assert song.lyrics == "ḥ ő ű 🎵"
+    assert catalog.get("2").to_dict() == {**SONGS[0], **{field: "" for field in ("original_id", "explicit_content",
+                                                                                  "skip_toc", "title_suffix")}}
+    assert len(reads) == 2
+
+def test_lookups(songs_json):
+    catalog = open_catalog(str(songs_json))
+    assert len(catalog) == 3
+    assert [song.inner_id for song in catalog] == ["2", "1", "10"]
+    assert catalog.get_by_id("H01").title == "Hátikvá"
+    assert [song.inner_id for song in catalog.songs_in_category("Magyar")] == ["2", "10"]
+    with pytest.raises(KeyError):
+        catalog.get("99")
+    with pytest.raises(KeyError):
+        catalog.get_by_id("H99")
+
+def test_toc_order_skips_songs_and_sorts_hungarian_titles(songs_json):
+    catalog = open_catalog(str(songs_json))
+    assert [song.inner_id for song in catalog.toc_songs("id")] == ["1", "2"]
+    assert [song.title for song in catalog.toc_songs("title")] == ["Hátikvá", "Őszi dal"]
+    # Accented letters sort right after their base letter, "ö"/"ő" after "o"
+    assert sorted(["Őz", "Ozmózis", "Öt", "Ár", "Arany"], key=hungarian_title_key) == \
+        ["Arany", "Ár", "Ozmózis", "Öt", "Őz"]
+    with pytest.raises(ValueError):
+        catalog.toc_songs("author")
+
+def test_summary(songs_json):
+    assert open_catalog(str(songs_json)).summary() == {
+        "total": 3, "youtube": 1, "explicit_content": 1, "categories": {"Magyar": 2, "Héber": 1}}
+
+def test_changed_file_is_detected_before_reading_lyrics(songs_json):
+    catalog = SongCatalog(str(songs_json))
+    song = catalog.get("1")
+    songs_json.write_text(json.dumps(list(reversed(SONGS)), ensure_ascii=False, indent=2), encoding='utf-8')
+    stat = os.stat(songs_json)
+    os.utime(songs_json, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    with pytest.raises(CatalogChangedError):
+        song.lyrics
+    # A fresh catalog reads the new file
+    assert SongCatalog(str(songs_json)).get("1").lyrics == SONGS[1]["lyrics"]
+
+def test_json_lines_round_trip(songs_json, tmp_path):
+    jsonl_path = str(tmp_path / "songs.jsonl")
+    write_json_lines(open_catalog(str(songs_json)), jsonl_path)
+    catalog = open_catalog(jsonl_path)
+    assert [song.to_dict()["lyrics"] for song in catalog] == [song["lyrics"] for song in SONGS]
+    assert catalog.get("10").lyrics_with_chords == ""
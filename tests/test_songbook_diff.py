@@ -0,0 +1,35 @@
+import os
+
+from songbook_diff import CONFIG, diff_page_indexes, render_report
+
+def page(number, source, sha256, kind="song", inner_id="1", source_page=1):
+    return {"page": number, "source": source, "source_page": source_page, "sha256": sha256,
+            "kind": kind, "inner_id": inner_id}
+
+def test_diff_page_indexes():
+    old = {"pages": [page(1, "toc.pdf", "a", kind="toc", inner_id=None), page(2, "song_1.pdf", "b"),
+                     page(3, "song_2.pdf", "c", inner_id="2"), page(4, "song_3.pdf", "d", inner_id="3")]}
+    new = {"pages": [page(1, "toc.pdf", "a", kind="toc", inner_id=None), page(2, "song_1.pdf", "B"),
+                     page(3, "song_3.pdf", "d", inner_id="3"), page(4, "song_4.pdf", "e", inner_id="4")]}
+    changes = diff_page_indexes(old, new)
+    assert [(change["status"], change["page"], change["old_page"]) for change in changes] == [
+        ("changed", 2, 2), ("moved", 3, 4), ("added", 4, None), ("removed", None, 3)]
+
+def test_report_is_in_hungarian():
+    changes = diff_page_indexes({"pages": [page(1, "song_1.pdf", "a")]},
+                                {"pages": [page(1, "song_1.pdf", "b"), page(2, "song_1.pdf", "c", source_page=2)]})
+    for change in changes:
+        change["title"] = "Hava nagila"
+    report = {"version": "singer", "old_page_count": 1, "new_page_count": 2,
+              "counts": {"changed": 1, "added": 1, "removed": 0, "moved": 0},
+              "update_pack": "singer_SironSongbook_Update.pdf", "update_pack_pages": 2, "changes": changes}
+    html = render_report(report, os.path.join(CONFIG.paths.templates_dir, CONFIG.templates['update_pack_report']))
+
+    assert '<html lang="hu">' in html
+    assert "Frissítőcsomag - Daloskönyv énekeseknek" in html
+    assert "1 módosult, 1 új, 0 törölt" in html
+    assert '<tr class="changed">' in html and "<td>módosult</td>" in html
+    assert '<tr class="added">' in html and "<td>új</td>" in html
+    assert "(2. oldal)" in html
+    for english in ("Update pack", "Reprint", "Status", "changed,", "(page"):
+        assert english not in html
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+
+import pytest
+
+from config import get_config
+from song_catalog import SongCatalog, open_catalog
+from sqlite_catalog import SqliteSongCatalog, write_sqlite_catalog
+
+SONGS = [
+    {"id": "H03", "inner_id": "3", "title": "Őszi dal", "author": "", "category": "Magyar ", "youtube": "x",
+     "lyrics": "Első sor\nMásodik sor", "lyrics_with_chords": "Am\nElső sor"},
+    {"id": "H01", "inner_id": "1", "title": "Hátikvá", "author": "Naftali Herz Imber", "category": "Héber",
+     "lyrics": "Kol od báleváv penimá", "lyrics_with_chords": "Am  Dm\nKol od báleváv penimá"},
+    {"id": "H10", "inner_id": "10", "title": "Ábécé", "author": "", "category": "Magyar", "skip_toc": True,
+     "explicit_content": True, "lyrics": "ḥ ő ű", "lyrics_with_chords": ""},
+    {"id": "H02", "inner_id": "2", "title": "Hava nagila", "author": "", "category": "",
+     "lyrics": "Hava nagila", "lyrics_with_chords": "Am\nHava nagila"},
+]
+
+@pytest.fixture
+def catalogs(tmp_path):
+    """The same songs from songs.json and from the SQLite catalog written from it."""
+    json_path = tmp_path / "songs.json"
+    json_path.write_text(json.dumps(SONGS, ensure_ascii=False), encoding='utf-8')
+    json_catalog = open_catalog(str(json_path))
+    db_path = str(tmp_path / "songs.db")
+    assert write_sqlite_catalog(json_catalog, db_path) == len(SONGS)
+    return json_catalog, open_catalog(db_path)
+
+def inner_ids(songs):
+    return [song.inner_id for song in songs]
+
+def test_round_trip(catalogs):
+    json_catalog, sqlite_catalog = catalogs
+    assert isinstance(sqlite_catalog, SqliteSongCatalog)
+    assert len(sqlite_catalog) == len(json_catalog)
+    by_inner_id = {song.inner_id: song.to_dict() for song in json_catalog}
+    for song in sqlite_catalog:
+        expected = by_inner_id[song.inner_id]
+        # Flags come back as booleans
+        expected.update(explicit_content=bool(expected["explicit_content"]), skip_toc=bool(expected["skip_toc"]))
+        assert song.to_dict() == expected
+    assert sqlite_catalog.get("10").lyrics == "ḥ ő ű"
+    assert sqlite_catalog.get_by_id("H01").title == "Hátikvá"
+    assert sqlite_catalog.summary() == json_catalog.summary()
+    for missing in ("99", "x"):
+        with pytest.raises(KeyError):
+            sqlite_catalog.get(missing)
+
+def test_toc_order_matches_the_json_backend(catalogs):
+    json_catalog, sqlite_catalog = catalogs
+    for sort_by in ("id", "title"):
+        assert inner_ids(sqlite_catalog.toc_songs(sort_by)) == inner_ids(json_catalog.toc_songs(sort_by))
+    # "a" sorts before "á", so Hava nagila comes before Hátikvá
+    assert inner_ids(sqlite_catalog.toc_songs("title")) == ["2", "1", "3"]
+    with pytest.raises(ValueError):
+        sqlite_catalog.toc_songs("author")
+
+def test_toc_order_of_the_bundled_catalog(tmp_path):
+    songs_json = get_config().paths.songs_json
+    json_catalog = SongCatalog(songs_json)
+    db_path = str(tmp_path / "songs.db")
+    write_sqlite_catalog(json_catalog, db_path)
+    sqlite_catalog = SqliteSongCatalog(db_path)
+    for sort_by in ("id", "title"):
+        assert inner_ids(sqlite_catalog.toc_songs(sort_by)) == inner_ids(json_catalog.toc_songs(sort_by))
+
+def test_catalog_of_another_schema_version_is_refused(tmp_path):
+    db_path = str(tmp_path / "songs.db")
+    write_sqlite_catalog(SONGS, db_path)
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA user_version = 999")
+    connection.commit()
+    connection.close()
+    with pytest.raises(ValueError, match="generate_json.py --sqlite"):
+        open_catalog(db_path)
+    with pytest.raises(FileNotFoundError):
+        open_catalog(str(tmp_path / "missing.db"))
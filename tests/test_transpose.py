@@ -0,0 +1,57 @@
+import os
+
+from transpose import ChordSheet
+
+
+def test_transposes_chord_lines_and_keeps_lyrics():
+    sheet = ChordSheet.parse("Am      Dm\nKol od báleváv\nE7  Am\nnefes jehudi")
+    assert sheet.text(2) == "Bm      Em\nKol od báleváv\nF#7 Bm\nnefes jehudi"
+
+
+def test_zero_semitones_returns_the_source():
+    text = "C   G\nla la"
+    assert ChordSheet.parse(text).text(12) == text
+
+
+def test_flat_key_is_spelled_with_flats():
+    assert ChordSheet.parse("F  C\nla").text(5) == "Bb F\nla"
+
+
+def test_lyric_words_starting_with_h_do_not_switch_to_german_notation():
+    # Regression: "Hát" on a lyric line made B7 read as B flat 7
+    text = "Em          B7\nHát mit tehetnék érted,\nHova mész?"
+    sheet = ChordSheet.parse(text)
+    assert not sheet.german
+    assert sheet.text(2).split("\n")[0] == "F#m         C#7"
+
+
+def test_h_chord_switches_to_german_notation():
+    sheet = ChordSheet.parse("H7   E\nla la\nB    F\nla la")
+    assert sheet.german
+    # German H is B natural and B is B flat
+    assert sheet.text(1).split("\n")[0] == "C7   F"
+    assert sheet.text(1).split("\n")[2] == "H    F#"
+
+
+def test_slash_bass_and_joined_chords():
+    assert ChordSheet.parse("C/E F#m-G\nla").text(2) == "D/F# G#m-A\nla"
+
+
+def test_all_keys_skips_keys_that_fail_to_convert(tmp_path, monkeypatch, capsys):
+    import generate_songbook_page
+    from pdf_conversion import ConversionError
+    from transpose import CONFIG, generate_all_keys
+
+    def html_to_pdf(html_content, output_path, version):
+        if output_path.endswith(("_+3.pdf", "_+7.pdf")):
+            raise ConversionError("wkhtmltopdf exited with code 1", {"reason": "exited with code 1"})
+        open(output_path, 'wb').close()
+    monkeypatch.setattr(generate_songbook_page, "html_to_pdf", html_to_pdf)
+    song = {"id": "H01", "inner_id": "1", "title": "Hátikvá", "author": "", "category": "", "youtube": "",
+            "lyrics": "Kol od báleváv", "lyrics_with_chords": "Am      Dm\nKol od báleváv"}
+
+    paths = generate_all_keys(song, CONFIG.paths.templates_dir, str(tmp_path))
+    assert [os.path.basename(path) for path in paths] == [f"song_1_{semitones:+d}.pdf" for semitones in range(12)
+                                                          if semitones not in (3, 7)]
+    output = capsys.readouterr().out
+    assert "in key +3" in output and "in key +7" in output